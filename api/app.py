@@ -0,0 +1,87 @@
+import logging
+
+from fastapi import FastAPI
+from starlette.middleware.cors import CORSMiddleware
+
+import api.core.util.config as cfg
+from api.core.db.mongodb_utils import connect_to_mongo_db, close_mongo_db_connection
+from api.core.db.storage import open_storage, close_storage
+from api.core.services.collection.content_index import start_content_index, stop_content_index
+from api.core.services.collection.evidence_buffer import start_evidence_buffer, stop_evidence_buffer
+from api.core.services.collection.variants import start_variants, stop_variants
+from api.core.services.reco.fallback import start_fallback_items, stop_fallback_items
+from api.core.services.reco.http_cache import ConditionalGetMiddleware, start_response_versions, \
+    stop_response_versions
+from api.core.util.admission import AdmissionMiddleware
+from api.core.util.compression import CompressionMiddleware
+from api.core.util.log_config import LogConfig
+from api.core.util.metrics import MetricsMiddleware
+from api.core.util.tracing import TracingMiddleware
+from api.v1.api import api_router
+from api.v1.metrics.metrics import api_metrics_router
+from api.v1.redirect.redirect import api_redirect_router
+
+log_config = LogConfig()
+logger = logging.getLogger(__name__)
+
+
+def create_app(include_builder: bool = True) -> FastAPI:
+    """Creates the API application.
+
+    Args:
+        include_builder (bool): Include builder routes. Serving-only apps (see `serving.py`) exclude them, builder
+            dependencies (numpy, pandas, scipy) are imported when a build runs in any case.
+    Returns:
+        FastAPI: Application with routes, middlewares and startup/shutdown handlers.
+    """
+    app = FastAPI(title="Recommendation API",
+                  version="0.2",
+                  openapi_url=f"{cfg.API_V1_STR}/openapi.json",
+                  description=f"REST API that exposes calculated recommendations from Recommender Builder. "
+                              f"App is running in {cfg.ENVIRONMENT} mode.")
+
+    if cfg.HTTP_COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware)
+    if cfg.HTTP_CACHE_ENABLED:
+        app.add_middleware(ConditionalGetMiddleware)
+    if cfg.ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware)  # inside CORS, rejections are readable by browsers
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origin_regex=cfg.CORS_ORIGIN_REGEX,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[cfg.HEADER_RECO_FALLBACK, "ETag", "Retry-After"]
+    )
+    if cfg.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+    if cfg.TRACING_ENABLED:
+        app.add_middleware(TracingMiddleware)
+
+    app.add_event_handler("startup", connect_to_mongo_db)
+    app.add_event_handler("startup", open_storage)
+    app.add_event_handler("startup", start_evidence_buffer)
+    app.add_event_handler("startup", start_fallback_items)
+    app.add_event_handler("startup", start_variants)
+    app.add_event_handler("startup", start_content_index)
+    app.add_event_handler("startup", start_response_versions)
+    app.add_event_handler("shutdown", stop_response_versions)
+    app.add_event_handler("shutdown", stop_content_index)
+    app.add_event_handler("shutdown", stop_variants)
+    app.add_event_handler("shutdown", stop_fallback_items)
+    app.add_event_handler("shutdown", stop_evidence_buffer)  # flush pending evidence before connection is closed
+    app.add_event_handler("shutdown", close_storage)
+    app.add_event_handler("shutdown", close_mongo_db_connection)
+
+    if include_builder:
+        from api.v1.builder import builder
+        app.include_router(builder.api_router, prefix=cfg.API_V1_STR)
+    app.include_router(api_router, prefix=cfg.API_V1_STR)
+    app.include_router(api_redirect_router)
+    if cfg.METRICS_ENABLED:
+        app.include_router(api_metrics_router)
+
+    logger.info(f"running app version {cfg.API_V1_STR} in {cfg.ENVIRONMENT} mode "
+                f"({'with' if include_builder else 'without'} builder routes) ...")
+    return app
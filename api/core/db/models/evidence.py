@@ -35,3 +35,22 @@ class BasicEvidenceModel(BaseModel):
                 "path": "https://path-to-step.com"
             }
         }
+
+
+class EvidenceRollupModel(BaseModel):
+    """Pre-aggregated evidence per user, item and evidence name (maintained on ingest).
+
+    Attributes: #noqa
+        user_uid (str): Unique identifier for user object.
+        item_code (int): Code of the item the user interacted with (see `item_codes`).
+        name (str): Evidence name (e.g. 'view_details', 'purchase').
+        count (int): Number of evidence objects for (user_uid, item_code, name).
+        first_timestamp (datetime): Timestamp of first evidence object.
+        last_timestamp (datetime): Timestamp of last evidence object.
+    """
+    user_uid: str = Field(...)
+    item_code: int = Field(...)
+    name: str = Field(...)
+    count: int = Field(...)
+    first_timestamp: datetime = Field()
+    last_timestamp: datetime = Field()
@@ -1,9 +1,9 @@
 from datetime import datetime
+from typing import List, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, StrictInt, StrictStr
 
-
-# TODO: id references (seed, recommended) should contain the mongodb _id and not the id (=attribute of item)
+import api.core.util.config as cfg
 
 
 class BasicRelationModel(BaseModel):
@@ -11,13 +11,14 @@ class BasicRelationModel(BaseModel):
 
     Attributes: #noqa
         type (str): Recommendation algorithm used for entry, e.g. ib_cf, fbt, etc.
-        item_id_seed (str): ID of item for which reco are needed.
-        item_id_recommended (str): ID of recommended item.
+        item_id_seed (int | str): Item code (see `item_codes`) of item for which reco are needed, user id for
+            relations with base "user".
+        item_id_recommended (int): Item code of recommended item.
         timestamp (datetime): Current timestamp. Can be used for versioning reco.
     """
     type: str = Field()
-    item_id_seed: str = Field()
-    item_id_recommended: str = Field()
+    item_id_seed: Union[StrictInt, StrictStr] = Field()
+    item_id_recommended: StrictInt = Field()
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -27,9 +28,11 @@ class CollaborativeFilteringRelation(BasicRelationModel):
     Attributes: #noqa
         similarity (float): Metric of collaborative filtering.
         base (str): Type of filtering, i.e. "item" or "used"
+        partition (str, optional): Partition key of recommended items (see `partitions`), None for unfiltered relations.
     """
     similarity: float = Field()
     base: str = Field(...)  # user/item
+    partition: Optional[str] = Field(None)
 
 
 class FrequentlyBoughtTogetherRelation(BasicRelationModel):
@@ -41,3 +44,34 @@ class FrequentlyBoughtTogetherRelation(BasicRelationModel):
     """
     confidence: float = Field()
     support: float = Field()
+
+
+class ContentBasedRelation(BasicRelationModel):
+    """Relation class for content-based similarity of item metadata.
+
+    Attributes: #noqa
+        similarity (float): Cosine similarity of TF-IDF vectors.
+        base (str): Always "item" (item-to-item).
+    """
+    type: str = Field(cfg.TYPE_CONTENT_BASED)
+    similarity: float = Field()
+    base: str = Field("item")
+
+
+class UserRecommendationModel(BaseModel):
+    """Precomputed recommended items of a user (one entry per user).
+
+    Attributes: #noqa
+        type (str): Recommendation algorithm used for entry.
+        user_uid (str): Unique identifier for user object.
+        item_ids (List[int]): Item codes of recommended items ordered by descending score.
+        scores (List[float]): Scores of recommended items.
+        timestamp (datetime): Current timestamp.
+        build_id (str, optional): Build that stored the entry (entries of earlier builds are deleted).
+    """
+    type: str = Field(cfg.TYPE_USER_ITEMS)
+    user_uid: str = Field(...)
+    item_ids: List[StrictInt] = Field(...)
+    scores: List[float] = Field(...)
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    build_id: Optional[str]
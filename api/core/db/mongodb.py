@@ -1,3 +1,4 @@
+from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorClient
 
 
@@ -9,4 +10,9 @@ db = DataBase()
 
 
 async def get_database() -> AsyncIOMotorClient:
+    """Client for routes that require MongoDB (exports, builders), HTTP 501 when running without MongoDB (memory
+    storage without `DB_URL`)."""
+    if db.client is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail="Route requires MongoDB, not available for this storage backend")
     return db.client
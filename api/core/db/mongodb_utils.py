@@ -1,25 +1,80 @@
 import logging
+import os
+import threading
+from typing import Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
+from pymongo.read_preferences import ReadPreference
 
 import api.core.util.config as cfg
+from api.core.util.metrics import event_listeners
 from .mongodb import db
 
 logger = logging.getLogger(__name__)
 
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def read_preference(mode: str):
+    """Read preference for a mode name (e.g. `secondaryPreferred`), used for per operation read preferences."""
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode}, choose from {list(READ_PREFERENCES)}")
+    return READ_PREFERENCES[mode]
+
+
+def pool_options(max_pool_size: int, min_pool_size: int) -> dict:
+    return {'maxPoolSize': max_pool_size,
+            'minPoolSize': min_pool_size,
+            'maxIdleTimeMS': cfg.DB_MAX_IDLE_TIME_MS,
+            'waitQueueTimeoutMS': cfg.DB_WAIT_QUEUE_TIMEOUT_MS,
+            'read_preference': read_preference(cfg.DB_READ_PREFERENCE)}
+
 
 # Synchronous ->
 
+_sync_client: Optional[MongoClient] = None
+_sync_client_pid: Optional[int] = None
+_sync_client_lock = threading.Lock()
+
+
+def get_sync_client() -> MongoClient:
+    """Returns process-wide synchronous client, its connection pool is shared by all threads. A new client is
+    created in forked processes (pymongo clients are not fork-safe)."""
+    global _sync_client, _sync_client_pid
+    with _sync_client_lock:
+        if _sync_client is None or _sync_client_pid != os.getpid():
+            _sync_client = MongoClient(cfg.DB_URL,
+                                       **pool_options(cfg.DB_SYNC_MAX_POOL_SIZE, cfg.DB_SYNC_MIN_POOL_SIZE),
+                                       event_listeners=event_listeners('sync', cfg.DB_SYNC_MAX_POOL_SIZE))
+            _sync_client_pid = os.getpid()
+        return _sync_client
+
+
+def close_sync_client():
+    global _sync_client
+    with _sync_client_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
 class MongoDBHelper:
     """Helper class for Recommendation Builder Class(!) to connect to MongoDB.
 
     Use class in 'with' construct. Note, that builder classes store reco synchronous into
-    MongoDB (<> collection-/reco-services store/retrieve asynchronous)
+    MongoDB (<> collection-/reco-services store/retrieve asynchronous). All blocks share the process-wide client
+    (see `get_sync_client`), leaving a block does not close connections.
     """
 
     def __init__(self, collection):
-        self.client = MongoClient(cfg.DB_URL)
+        self.client = get_sync_client()
         # TODO: class needs attribute to control "how much" evidence (e.g. age-based) should be fetch for calculations
         self.db = self.client[collection]
 
@@ -27,20 +82,32 @@ class MongoDBHelper:
         return self.db
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.client.close()
+        pass
 
 
 # Asynchronous ->
 
 async def connect_to_mongo_db():
+    if cfg.STORAGE_BACKEND == 'memory' and not cfg.DB_URL:
+        logger.info("no DB_URL for memory storage -> run without MongoDB")
+        return
     logger.info("connect to MongoDB...")
     db.client = AsyncIOMotorClient(cfg.DB_URL,
-                                   maxPoolSize=10,
-                                   minPoolSize=10)
+                                   **pool_options(cfg.DB_MAX_POOL_SIZE, cfg.DB_MIN_POOL_SIZE),
+                                   event_listeners=event_listeners('async', cfg.DB_MAX_POOL_SIZE))
     logger.info("connection to MongoDB successful!")
 
 
 async def close_mongo_db_connection():
+    if db.client is None:
+        return
     logger.info("close connection to MongoDB...")
     db.client.close()
+    db.client = None
+    close_sync_client()
     logger.info("connection to MongoDB closed!")
+
+
+def get_reco_collection(conn: AsyncIOMotorClient, name: str):
+    """Collection for recommendation queries (read preference `DB_READ_PREFERENCE_RECO`)."""
+    return conn[cfg.DB_NAME].get_collection(name, read_preference=read_preference(cfg.DB_READ_PREFERENCE_RECO))
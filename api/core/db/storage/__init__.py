@@ -0,0 +1,44 @@
+"""Pluggable storage of the API (`STORAGE_BACKEND`), see `base` for the repository interface."""
+import logging
+from typing import Optional
+
+import api.core.util.config as cfg
+from api.core.db.mongodb import db
+from .base import Storage, ItemRepository, RelationRepository, UserRecommendationRepository, UserRepository, \
+    EvidenceRepository, SplittingRepository
+from .memory import MemoryStorage
+from .mongodb import MongoDBStorage
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ('mongodb', 'memory')
+
+
+class StorageHolder:
+    storage: Optional[Storage] = None
+
+
+storage_holder = StorageHolder()
+
+
+async def get_storage() -> Storage:
+    return storage_holder.storage
+
+
+async def open_storage():
+    """Creates storage of `STORAGE_BACKEND`, must run after `connect_to_mongo_db`. The memory backend loads a
+    snapshot of MongoDB when connected (`DB_URL` set)."""
+    if cfg.STORAGE_BACKEND not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {cfg.STORAGE_BACKEND}, choose from {list(STORAGE_BACKENDS)}")
+    logger.info(f"open {cfg.STORAGE_BACKEND} storage...")
+    if cfg.STORAGE_BACKEND == 'mongodb':
+        storage_holder.storage = MongoDBStorage(db.client)
+        return
+    storage = MemoryStorage()
+    if db.client is not None:
+        await storage.load_from_mongodb(db.client)
+    storage_holder.storage = storage
+
+
+async def close_storage():
+    storage_holder.storage = None
@@ -0,0 +1,205 @@
+"""Storage interface of the API: one repository per collection, documents are plain dictionaries (as stored in
+MongoDB, e.g. with `_id`). Services use repositories of the configured `Storage` (see `get_storage`) instead of
+collections, so the API can serve from MongoDB (`MongoDBStorage`) or from memory (`MemoryStorage`)."""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+def unique_neighbours(neighbours) -> List[Tuple[int, float]]:
+    """Drops repeated recommended items (e.g. of several builds) of (item_id_recommended, similarity) pairs ordered by
+    descending similarity."""
+    seen = set()
+    return [(i, s) for i, s in neighbours if not (i in seen or seen.add(i))]
+
+
+class ItemRepository(ABC):
+    @abstractmethod
+    async def find_by_id(self, item_id: str) -> Optional[dict]:
+        """Returns (first) item with `id`."""
+
+    @abstractmethod
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        """Returns items with given `id`s in order of `item_ids` (unknown ids are skipped)."""
+
+    @abstractmethod
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        """Returns items with given `item_code`s in order of `item_codes` (unknown codes are skipped)."""
+
+    @abstractmethod
+    async def find_all(self) -> List[dict]:
+        """Returns all items."""
+
+    @abstractmethod
+    async def parent_ids(self, attribute: str) -> Dict[str, str]:
+        """Returns parent item id (value of `attribute`) per item id of all items with parent (variants)."""
+
+    @abstractmethod
+    async def latest(self, n: int) -> List[dict]:
+        """Returns `n` items with latest `created_time`."""
+
+    @abstractmethod
+    async def sample(self, n: int) -> List[dict]:
+        """Returns `n` random items (all items when there are less)."""
+
+    @abstractmethod
+    async def upsert_many(self, documents: List[dict]) -> dict:
+        """Inserts or updates (match by `id` and `type`) items, returns number of inserted, updated and failed."""
+
+    @abstractmethod
+    async def delete_by_id(self, item_id: str) -> int:
+        """Deletes items with `id`, returns number of deleted items."""
+
+    @abstractmethod
+    async def version(self) -> str:
+        """Returns version of the item catalog, changes with every item upsert or deletion."""
+
+
+class ItemCodeRepository(ABC):
+    """Persistent item id dictionary, entries have the dense integer code as `_id` and the item id as `id`."""
+
+    @abstractmethod
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        """Returns entries of item ids (unknown ids are skipped)."""
+
+    @abstractmethod
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        """Returns entries of codes (unknown codes are skipped)."""
+
+    @abstractmethod
+    async def next_code(self) -> int:
+        """Returns the code following the highest assigned code (0 for an empty dictionary)."""
+
+    @abstractmethod
+    async def insert_many(self, documents: List[dict]) -> List[dict]:
+        """Inserts entries, returns the inserted entries (entries whose code or item id is already assigned, e.g. by
+        a concurrent process, are skipped)."""
+
+
+class RelationRepository(ABC):
+    """Relations reference items by item code (`item_id_seed` and `item_id_recommended`, seeds of relations with base
+    `user` are user ids)."""
+
+    @abstractmethod
+    async def recommended_items(self, item_id_seed: Union[int, str], base: str, n: int, types: List[str],
+                                partition: Optional[str] = None) -> List[dict]:
+        """Returns (up to) `n` recommended items of seed item from relations of `types` ordered by descending relation
+        similarity. Relations of a `partition` (normalized key) only recommend items of that partition, relations
+        without partition are unfiltered."""
+
+    @abstractmethod
+    async def neighbours(self, item_id_seeds: List[int], base: str, n: int,
+                         types: List[str]) -> Dict[int, List[Tuple[int, float]]]:
+        """Returns (up to) `n` (item code recommended, similarity) per seed item from unfiltered relations of `types`
+        ordered by descending similarity (recommended items are not joined, i.e. may be unknown)."""
+
+    @abstractmethod
+    async def insert_many(self, documents: List[dict]) -> int:
+        """Inserts relations, returns number of inserted relations."""
+
+    @abstractmethod
+    async def replace(self, type: str, base: str, item_id_seeds: List[int], documents: List[dict]) -> int:
+        """Deletes unfiltered relations of `type` and `base` of seed items `item_id_seeds` and inserts `documents` (new
+        relations of these seed items), returns number of inserted relations."""
+
+    @abstractmethod
+    async def version(self) -> str:
+        """Returns version of relations and user recommendations, changes with every completed build."""
+
+
+class UserRecommendationRepository(ABC):
+    @abstractmethod
+    async def recommended_items(self, user_uid: str, n: int) -> List[dict]:
+        """Returns (up to) `n` precomputed recommended items of user in order of their score."""
+
+    @abstractmethod
+    async def replace_many(self, documents: List[dict]) -> int:
+        """Inserts or replaces (match by `user_uid`) recommendations of users, returns number of written users."""
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def find_by_uid(self, user_uid: Any) -> Optional[dict]:
+        """Returns user by `_id` (ObjectId or its string representation)."""
+
+    @abstractmethod
+    async def find_by_reco2js_id(self, reco2js_id: str) -> Optional[dict]:
+        """Returns (first) user with reco2js_id in `keys.reco2js_ids`."""
+
+    @abstractmethod
+    async def upsert_by_reco2js_id(self, reco2js_id: str, fields: dict) -> dict:
+        """Sets `fields` of user with reco2js_id (creates user when not found), returns updated user."""
+
+    @abstractmethod
+    async def insert(self, document: dict) -> Any:
+        """Inserts user, returns `_id`."""
+
+    @abstractmethod
+    async def set_group(self, user_uid: Any, group_name: str, group_value: str):
+        """Sets `groups.<group_name>` of user."""
+
+    @abstractmethod
+    async def delete_by_reco2js_id(self, reco2js_id: str) -> int:
+        """Deletes users with reco2js_id, returns number of deleted users."""
+
+
+class EvidenceRepository(ABC):
+    @abstractmethod
+    async def insert_many(self, documents: List[dict]) -> int:
+        """Inserts evidence, returns number of inserted evidence objects."""
+
+    @abstractmethod
+    async def find_by_user(self, user_uid: str) -> List[dict]:
+        """Returns evidence of user."""
+
+    @abstractmethod
+    async def consumed_item_ids(self, user_uid: str, names: List[str]) -> List[str]:
+        """Returns distinct item ids of the user's evidence with one of `names`."""
+
+    @abstractmethod
+    async def delete_by_user(self, user_uid: str) -> int:
+        """Deletes evidence of user, returns number of deleted evidence objects."""
+
+    @abstractmethod
+    async def popular_item_ids(self, n: int) -> List[str]:
+        """Returns ids of `n` items with most evidence."""
+
+
+class SplittingRepository(ABC):
+    @abstractmethod
+    async def find(self, name: str) -> Optional[dict]:
+        """Returns splitting by name."""
+
+    @abstractmethod
+    async def find_all(self) -> List[dict]:
+        """Returns all splittings."""
+
+    @abstractmethod
+    async def upsert(self, document: dict):
+        """Inserts or updates (match by `name`) splitting."""
+
+    @abstractmethod
+    async def delete(self, name: str) -> int:
+        """Deletes splitting by name, returns number of deleted splittings."""
+
+
+class Storage:
+    """Repositories of a storage backend.
+
+    Attributes: #noqa
+        name (str): Backend name (`mongodb` or `memory`).
+        items (ItemRepository): Items.
+        item_codes (ItemCodeRepository): Item id dictionary.
+        relations (RelationRepository): Relations (recommendations) between items.
+        user_recommendations (UserRecommendationRepository): Precomputed recommended items per user.
+        users (UserRepository): Users.
+        evidence (EvidenceRepository): Evidence (user interactions).
+        splittings (SplittingRepository): Splitting configurations.
+    """
+    name: str
+    items: ItemRepository
+    item_codes: ItemCodeRepository
+    relations: RelationRepository
+    user_recommendations: UserRecommendationRepository
+    users: UserRepository
+    evidence: EvidenceRepository
+    splittings: SplittingRepository
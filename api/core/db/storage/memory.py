@@ -0,0 +1,373 @@
+"""In-memory storage engine for small deployments, edge nodes, tests and benchmarks.
+
+All data lives in dictionaries of the serving process, indexed for the access patterns of the services (items by
+`id`, item code and creation time, relations by seed item, users by reco2js id, evidence by user). Repository methods
+never await while mutating, so concurrent requests see consistent indexes without locks. Returned documents are the
+stored dictionaries and must not be modified.
+
+Data is not persisted: `load_from_mongodb` copies a snapshot of the MongoDB collections (e.g. relations calculated by
+the builders) at startup, later writes only change the memory of the process.
+"""
+import bisect
+import logging
+import random
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import api.core.util.config as cfg
+from .base import (Storage, ItemRepository, ItemCodeRepository, RelationRepository, UserRecommendationRepository,
+                   UserRepository, EvidenceRepository, SplittingRepository, unique_neighbours)
+
+logger = logging.getLogger(__name__)
+
+
+def _created_key(doc: dict) -> Tuple[int, str]:
+    """Ascending sort key of latest index: items without `created_time` come first (i.e. last in descending order,
+    like in MongoDB), datetimes and their ISO strings (encoded models) compare equally."""
+    created = doc.get('created_time')
+    if created is None:
+        return 0, ''
+    if isinstance(created, datetime):
+        created = created.isoformat()
+    return 1, str(created)
+
+
+class MemoryItemRepository(ItemRepository):
+    def __init__(self):
+        self._docs: Dict[Tuple[str, str], dict] = {}  # (id, type) -> item
+        self._by_id: Dict[str, List[Tuple[str, str]]] = {}
+        self._by_code: Dict[int, List[Tuple[str, str]]] = {}
+        self._latest: List[Tuple[Tuple, Tuple[str, str]]] = []  # ascending (created key, (id, type))
+        self._keys: List[Tuple[str, str]] = []  # for O(1) sampling, removal swaps with last key
+        self._positions: Dict[Tuple[str, str], int] = {}
+        self._version = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    async def find_by_id(self, item_id: str) -> Optional[dict]:
+        keys = self._by_id.get(item_id)
+        return self._docs[keys[0]] if keys else None
+
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        return [self._docs[keys[0]] for keys in map(self._by_id.get, item_ids) if keys]
+
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        return [self._docs[keys[0]] for keys in map(self._by_code.get, item_codes) if keys]
+
+    async def find_all(self) -> List[dict]:
+        return list(self._docs.values())
+
+    async def parent_ids(self, attribute: str) -> Dict[str, str]:
+        return {d['id']: str(d[attribute]) for d in self._docs.values()
+                if d.get(attribute) is not None and str(d[attribute]) != d['id']}
+
+    async def latest(self, n: int) -> List[dict]:
+        return [self._docs[key] for _, key in reversed(self._latest[-n:])] if n > 0 else []
+
+    async def sample(self, n: int) -> List[dict]:
+        return [self._docs[key] for key in random.sample(self._keys, min(n, len(self._keys)))]
+
+    async def upsert_many(self, documents: List[dict]) -> dict:
+        res = {'inserted': 0, 'updated': 0, 'failed': 0}
+        self._version += 1
+        for d in documents:
+            key = (d['id'], d['type'])
+            old = self._docs.get(key)
+            if old is None:
+                self._add(key, {'_id': ObjectId(), **d})
+                res['inserted'] += 1
+            else:
+                self._remove(key)
+                self._add(key, {**old, **d})
+                res['updated'] += 1
+        return res
+
+    async def delete_by_id(self, item_id: str) -> int:
+        keys = list(self._by_id.get(item_id, []))
+        for key in keys:
+            self._remove(key)
+        self._version += 1
+        return len(keys)
+
+    async def version(self) -> str:
+        return str(self._version)
+
+    def _add(self, key: Tuple[str, str], doc: dict):
+        self._docs[key] = doc
+        self._by_id.setdefault(key[0], []).append(key)
+        if doc.get(cfg.COLUMN_ITEM_CODE) is not None:
+            self._by_code.setdefault(doc[cfg.COLUMN_ITEM_CODE], []).append(key)
+        bisect.insort(self._latest, (_created_key(doc), key))
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+
+    def _remove(self, key: Tuple[str, str]):
+        doc = self._docs.pop(key)
+        self._by_id[key[0]].remove(key)
+        if not self._by_id[key[0]]:
+            del self._by_id[key[0]]
+        code = doc.get(cfg.COLUMN_ITEM_CODE)
+        if code is not None:
+            self._by_code[code].remove(key)
+            if not self._by_code[code]:
+                del self._by_code[code]
+        entry = (_created_key(doc), key)
+        del self._latest[bisect.bisect_left(self._latest, entry)]
+        position, last = self._positions.pop(key), self._keys.pop()
+        if last != key:
+            self._keys[position] = last
+            self._positions[last] = position
+
+
+class MemoryItemCodeRepository(ItemCodeRepository):
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+        self._by_code: Dict[int, dict] = {}
+
+    def __len__(self):
+        return len(self._by_code)
+
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        return [self._by_id[i] for i in item_ids if i in self._by_id]
+
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        return [self._by_code[c] for c in item_codes if c in self._by_code]
+
+    async def next_code(self) -> int:
+        return max(self._by_code) + 1 if self._by_code else 0
+
+    async def insert_many(self, documents: List[dict]) -> List[dict]:
+        inserted = []
+        for d in documents:
+            if d['_id'] not in self._by_code and d['id'] not in self._by_id:
+                self._by_code[d['_id']] = self._by_id[d['id']] = d
+                inserted.append(d)
+        return inserted
+
+
+class MemoryRelationRepository(RelationRepository):
+    """Relations grouped by (seed item, base, partition), each group sorted by descending similarity. Items are joined
+    on read, i.e. relations to unknown (e.g. deleted) items are skipped like in the MongoDB `$lookup`."""
+
+    def __init__(self, items: MemoryItemRepository):
+        self.items = items
+        self._by_seed: Dict[Tuple[str, str, Optional[str]], List[dict]] = {}
+        self._version = 0
+
+    def __len__(self):
+        return sum(len(r) for r in self._by_seed.values())
+
+    async def recommended_items(self, item_id_seed: Union[int, str], base: str, n: int, types: List[str],
+                                partition: Optional[str] = None) -> List[dict]:
+        res = []
+        for relation in self._by_seed.get((item_id_seed, base, partition), []):
+            if relation.get('type') not in types:
+                continue
+            for key in self.items._by_code.get(relation['item_id_recommended'], []):
+                res.append(self.items._docs[key])
+            if len(res) >= n:
+                break
+        return res[:n]
+
+    async def neighbours(self, item_id_seeds: List[int], base: str, n: int,
+                         types: List[str]) -> Dict[int, List[Tuple[int, float]]]:
+        res = {}
+        for seed in item_id_seeds:
+            relations = [r for r in self._by_seed.get((seed, base, None), []) if r.get('type') in types][:n]
+            if relations:
+                res[seed] = unique_neighbours((r['item_id_recommended'], r.get(cfg.COLUMN_SIMILARITY) or 0)
+                                              for r in relations)
+        return res
+
+    async def insert_many(self, documents: List[dict]) -> int:
+        changed = set()
+        self._version += 1
+        for d in documents:
+            key = (d['item_id_seed'], d['base'], d.get(cfg.COLUMN_PARTITION))
+            self._by_seed.setdefault(key, []).append({'_id': ObjectId(), **d})
+            changed.add(key)
+        for key in changed:
+            self._by_seed[key].sort(key=lambda r: r.get(cfg.COLUMN_SIMILARITY) or 0, reverse=True)
+        return len(documents)
+
+    async def replace(self, type: str, base: str, item_id_seeds: List[int], documents: List[dict]) -> int:
+        for seed in item_id_seeds:
+            relations = [r for r in self._by_seed.get((seed, base, None), []) if r.get('type') != type]
+            if relations:
+                self._by_seed[(seed, base, None)] = relations
+            else:
+                self._by_seed.pop((seed, base, None), None)
+        return await self.insert_many(documents)
+
+    async def version(self) -> str:
+        """Counts changes, i.e. relations loaded from MongoDB and later inserts (builds are not seen)."""
+        return str(self._version)
+
+
+class MemoryUserRecommendationRepository(UserRecommendationRepository):
+    """Recommendations by user uid, items are joined on read."""
+
+    def __init__(self, items: MemoryItemRepository):
+        self.items = items
+        self._by_user: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self._by_user)
+
+    async def recommended_items(self, user_uid: str, n: int) -> List[dict]:
+        doc = self._by_user.get(user_uid)
+        return await self.items.find_by_codes(doc['item_ids'][:n]) if doc else []
+
+    async def replace_many(self, documents: List[dict]) -> int:
+        for d in documents:
+            self._by_user[d[cfg.COLUMN_USER_UID]] = d
+        return len(documents)
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._docs: Dict[Any, dict] = {}
+        self._by_reco2js_id: Dict[str, Any] = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    async def find_by_uid(self, user_uid: Any) -> Optional[dict]:
+        if not isinstance(user_uid, ObjectId) and ObjectId.is_valid(user_uid):
+            user_uid = ObjectId(user_uid)
+        return self._docs.get(user_uid)
+
+    async def find_by_reco2js_id(self, reco2js_id: str) -> Optional[dict]:
+        uid = self._by_reco2js_id.get(reco2js_id)
+        return None if uid is None else self._docs[uid]
+
+    async def upsert_by_reco2js_id(self, reco2js_id: str, fields: dict) -> dict:
+        uid = self._by_reco2js_id.get(reco2js_id)
+        if uid is None:
+            doc = {'_id': ObjectId(), 'keys': {'reco2js_ids': [reco2js_id]}, **fields}
+        else:
+            doc = {**self._remove(uid), **fields}
+        self._add(doc)
+        return doc
+
+    async def insert(self, document: dict) -> Any:
+        doc = {'_id': ObjectId(), **document}
+        self._add(doc)
+        return doc['_id']
+
+    async def set_group(self, user_uid: Any, group_name: str, group_value: str):
+        doc = self._docs.get(user_uid)
+        if doc is not None:
+            doc['groups'] = {**(doc.get('groups') or {}), group_name: group_value}
+
+    async def delete_by_reco2js_id(self, reco2js_id: str) -> int:
+        uids = {uid for uid, doc in self._docs.items() if reco2js_id in self._reco2js_ids(doc)}
+        for uid in uids:
+            self._remove(uid)
+        return len(uids)
+
+    @staticmethod
+    def _reco2js_ids(doc: dict) -> List[str]:
+        return (doc.get('keys') or {}).get('reco2js_ids') or []
+
+    def _add(self, doc: dict):
+        self._docs[doc['_id']] = doc
+        for reco2js_id in self._reco2js_ids(doc):
+            self._by_reco2js_id.setdefault(reco2js_id, doc['_id'])  # first user wins, like find_one
+
+    def _remove(self, uid: Any) -> dict:
+        doc = self._docs.pop(uid)
+        for reco2js_id in self._reco2js_ids(doc):
+            if self._by_reco2js_id.get(reco2js_id) == uid:
+                del self._by_reco2js_id[reco2js_id]
+                other = next((d for d in self._docs.values() if reco2js_id in self._reco2js_ids(d)), None)
+                if other is not None:
+                    self._by_reco2js_id[reco2js_id] = other['_id']
+        return doc
+
+
+class MemoryEvidenceRepository(EvidenceRepository):
+    """Evidence grouped by user, item popularity is counted on insert."""
+
+    def __init__(self):
+        self._by_user: Dict[Any, List[dict]] = {}
+        self._item_counts: Counter = Counter()
+
+    def __len__(self):
+        return sum(len(e) for e in self._by_user.values())
+
+    async def insert_many(self, documents: List[dict]) -> int:
+        for d in documents:
+            self._by_user.setdefault(d.get(cfg.COLUMN_USER_UID), []).append({'_id': ObjectId(), **d})
+            if d.get(cfg.COLUMN_ITEM_ID) is not None:
+                self._item_counts[d[cfg.COLUMN_ITEM_ID]] += 1
+        return len(documents)
+
+    async def find_by_user(self, user_uid: str) -> List[dict]:
+        return list(self._by_user.get(user_uid, []))
+
+    async def consumed_item_ids(self, user_uid: str, names: List[str]) -> List[str]:
+        return list(dict.fromkeys(d[cfg.COLUMN_ITEM_ID] for d in self._by_user.get(user_uid, [])
+                                  if d.get(cfg.COLUMN_NAME) in names and d.get(cfg.COLUMN_ITEM_ID) is not None))
+
+    async def delete_by_user(self, user_uid: str) -> int:
+        documents = self._by_user.pop(user_uid, [])
+        self._item_counts.subtract(d[cfg.COLUMN_ITEM_ID] for d in documents if d.get(cfg.COLUMN_ITEM_ID) is not None)
+        self._item_counts += Counter()  # drops items without remaining evidence
+        return len(documents)
+
+    async def popular_item_ids(self, n: int) -> List[str]:
+        return [item_id for item_id, _ in self._item_counts.most_common(n)]
+
+
+class MemorySplittingRepository(SplittingRepository):
+    def __init__(self):
+        self._docs: Dict[str, dict] = {}
+
+    async def find(self, name: str) -> Optional[dict]:
+        return self._docs.get(name)
+
+    async def find_all(self) -> List[dict]:
+        return list(self._docs.values())
+
+    async def upsert(self, document: dict):
+        self._docs[document['name']] = {'_id': ObjectId(), **self._docs.get(document['name'], {}), **document}
+
+    async def delete(self, name: str) -> int:
+        return 0 if self._docs.pop(name, None) is None else 1
+
+
+class MemoryStorage(Storage):
+    """Repositories in memory of the serving process (see module docstring)."""
+    name = 'memory'
+
+    def __init__(self):
+        self.items = MemoryItemRepository()
+        self.item_codes = MemoryItemCodeRepository()
+        self.relations = MemoryRelationRepository(self.items)
+        self.user_recommendations = MemoryUserRecommendationRepository(self.items)
+        self.users = MemoryUserRepository()
+        self.evidence = MemoryEvidenceRepository()
+        self.splittings = MemorySplittingRepository()
+
+    async def load_from_mongodb(self, conn: AsyncIOMotorClient, db_name: str = None):
+        """Copies all items, item codes, relations, user recommendations, users, evidence and splittings of MongoDB
+        database `db_name` (default `DB_NAME`) into memory."""
+        database = conn[db_name or cfg.DB_NAME]
+        await self.items.upsert_many([d async for d in database[cfg.COLLECTION_NAME_ITEM].find()])
+        await self.item_codes.insert_many([d async for d in database[cfg.COLLECTION_NAME_ITEM_CODE].find()])
+        await self.relations.insert_many([d async for d in database[cfg.COLLECTION_NAME_RELATIONS].find()])
+        await self.user_recommendations.replace_many(
+            [d async for d in database[cfg.COLLECTION_NAME_USER_RECOMMENDATION].find()])
+        async for d in database[cfg.COLLECTION_NAME_USER].find():
+            await self.users.insert(d)
+        await self.evidence.insert_many([d async for d in database[cfg.COLLECTION_NAME_EVIDENCE].find()])
+        async for d in database[cfg.COLLECTION_NAME_SPLITTING_CONFIG].find():
+            await self.splittings.upsert(d)
+        logger.info(f"Loaded {len(self.items)} items, {len(self.relations)} relations, {len(self.users)} users and "
+                    f"{len(self.evidence)} evidence objects into memory")
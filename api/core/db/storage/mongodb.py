@@ -0,0 +1,332 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pymongo
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import api.core.util.config as cfg
+from api.core.db.mongodb_utils import get_reco_collection
+from api.core.services.collection.rollup import update_rollups
+from .base import (Storage, ItemRepository, ItemCodeRepository, RelationRepository, UserRecommendationRepository,
+                   UserRepository, EvidenceRepository, SplittingRepository, unique_neighbours)
+
+logger = logging.getLogger(__name__)
+
+
+class MongoDBItemRepository(ItemRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+        self._version_indexed = False
+        self._code_indexed = False
+
+    @property
+    def collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM]
+
+    @property
+    def reco_collection(self):
+        return get_reco_collection(self.conn, cfg.COLLECTION_NAME_ITEM)
+
+    async def find_by_id(self, item_id: str) -> Optional[dict]:
+        return await self.collection.find_one(filter={'id': item_id})
+
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        by_id = {i['id']: i async for i in self.reco_collection.find({'id': {'$in': list(item_ids)}})}
+        return [by_id[i] for i in item_ids if i in by_id]
+
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        cursor = self.reco_collection.find({cfg.COLUMN_ITEM_CODE: {'$in': list(item_codes)}})
+        by_code = {i[cfg.COLUMN_ITEM_CODE]: i async for i in cursor}
+        return [by_code[c] for c in item_codes if c in by_code]
+
+    async def find_all(self) -> List[dict]:
+        return await self.collection.find().to_list(None)
+
+    async def parent_ids(self, attribute: str) -> Dict[str, str]:
+        cursor = self.collection.find({attribute: {'$exists': True, '$ne': None}},
+                                      projection={'_id': 0, 'id': 1, attribute: 1})
+        return {d['id']: str(d[attribute]) async for d in cursor if str(d[attribute]) != d['id']}
+
+    async def latest(self, n: int) -> List[dict]:
+        cursor = self.reco_collection.find().sort([('created_time', pymongo.DESCENDING)]).limit(n)
+        return await cursor.to_list(n)
+
+    async def sample(self, n: int) -> List[dict]:
+        return await self.reco_collection.aggregate([{'$sample': {'size': n}}]).to_list(None)
+
+    async def upsert_many(self, documents: List[dict]) -> dict:
+        """Upserts items with a single unordered bulk write (index on item code, used by the relation joins, is created
+        on first call)."""
+        if not self._code_indexed:
+            await self.collection.create_index(cfg.COLUMN_ITEM_CODE)
+            self._code_indexed = True
+        operations = [UpdateOne({'id': d['id'], 'type': d['type']}, {'$set': d}, upsert=True) for d in documents]
+        try:
+            res = await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            logger.error(f"Bulk upsert of {len(documents)} items failed partially: {e.details['writeErrors'][:1]}")
+            return {'inserted': e.details['nUpserted'],
+                    'updated': e.details['nMatched'],
+                    'failed': len(e.details['writeErrors'])}
+        return {'inserted': res.upserted_count, 'updated': res.matched_count, 'failed': 0}
+
+    async def delete_by_id(self, item_id: str) -> int:
+        res = await self.collection.delete_many(filter={'id': item_id})
+        return res.deleted_count
+
+    async def version(self) -> str:
+        """Latest `update_time` (set by every upsert, index created on first call) and number of items (deletions)."""
+        if not self._version_indexed:
+            await self.collection.create_index('update_time')
+            self._version_indexed = True
+        latest = await self.collection.find_one({}, projection={'_id': 0, 'update_time': 1},
+                                                sort=[('update_time', pymongo.DESCENDING)])
+        count = await self.collection.estimated_document_count()
+        return f"{count}:{latest.get('update_time') if latest else ''}"
+
+
+class MongoDBItemCodeRepository(ItemCodeRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+        self._indexed = False
+
+    @property
+    def collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM_CODE]
+
+    async def find_by_ids(self, item_ids: List[str]) -> List[dict]:
+        return await self.collection.find({'id': {'$in': list(item_ids)}}).to_list(None)
+
+    async def find_by_codes(self, item_codes: List[int]) -> List[dict]:
+        return await self.collection.find({'_id': {'$in': list(item_codes)}}).to_list(None)
+
+    async def next_code(self) -> int:
+        latest = await self.collection.find_one({}, projection={'_id': 1}, sort=[('_id', pymongo.DESCENDING)])
+        return latest['_id'] + 1 if latest else 0
+
+    async def insert_many(self, documents: List[dict]) -> List[dict]:
+        """Unordered insert, entries violating the unique `_id` (code) or `id` index are skipped."""
+        if not self._indexed:
+            await self.collection.create_index('id', unique=True)
+            self._indexed = True
+        if not documents:
+            return []
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details['writeErrors']}
+            return [d for i, d in enumerate(documents) if i not in failed]
+        return documents
+
+
+class MongoDBRelationRepository(RelationRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+
+    async def recommended_items(self, item_id_seed: Union[int, str], base: str, n: int, types: List[str],
+                                partition: Optional[str] = None) -> List[dict]:
+        pipeline = [
+            {'$match': {
+                'item_id_seed': item_id_seed,
+                'base': base,
+                'type': {'$in': list(types)},
+                cfg.COLUMN_PARTITION: partition  # None matches relations without partition
+            }},
+            {
+                '$lookup': {
+                    'from': cfg.COLLECTION_NAME_ITEM,
+                    'localField': 'item_id_recommended',
+                    'foreignField': cfg.COLUMN_ITEM_CODE,
+                    'as': 'item'
+                }
+            },
+            {'$unwind': '$item'},  # reduces and flattens the item (array) to a single object
+            {'$sort': {'similarity': -1}},
+            {'$limit': n}
+        ]
+        docs = await get_reco_collection(self.conn, cfg.COLLECTION_NAME_RELATIONS).aggregate(pipeline).to_list(None)
+        return [doc['item'] for doc in docs]
+
+    async def neighbours(self, item_id_seeds: List[int], base: str, n: int,
+                         types: List[str]) -> Dict[int, List[Tuple[int, float]]]:
+        pipeline = [
+            {'$match': {
+                'item_id_seed': {'$in': list(item_id_seeds)},
+                'base': base,
+                'type': {'$in': list(types)},
+                cfg.COLUMN_PARTITION: None
+            }},
+            {'$sort': {'similarity': -1}},
+            {'$group': {'_id': '$item_id_seed',
+                        'relations': {'$push': {'id': '$item_id_recommended', 'similarity': '$similarity'}}}},
+            {'$project': {'relations': {'$slice': ['$relations', n]}}}
+        ]
+        docs = await get_reco_collection(self.conn, cfg.COLLECTION_NAME_RELATIONS).aggregate(pipeline).to_list(None)
+        return {doc['_id']: unique_neighbours((r['id'], r['similarity']) for r in doc['relations']) for doc in docs}
+
+    async def insert_many(self, documents: List[dict]) -> int:
+        res = await self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_RELATIONS].insert_many(documents)
+        return len(res.inserted_ids)
+
+    async def replace(self, type: str, base: str, item_id_seeds: List[int], documents: List[dict]) -> int:
+        collection = self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_RELATIONS]
+        await collection.delete_many({'type': type, 'base': base, 'item_id_seed': {'$in': list(item_id_seeds)},
+                                      cfg.COLUMN_PARTITION: None})
+        return await self.insert_many(documents) if documents else 0
+
+    async def version(self) -> str:
+        """`_id` of the latest build history entry (builders store it after their relations)."""
+        latest = await self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_BUILD_HISTORY].find_one(
+            {}, projection={'_id': 1}, sort=[('_id', pymongo.DESCENDING)])
+        return str(latest['_id']) if latest else ''
+
+
+class MongoDBUserRecommendationRepository(UserRecommendationRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+
+    async def recommended_items(self, user_uid: str, n: int) -> List[dict]:
+        """Reads recommendations of user (unique index on `user_uid`) joined with their items in one query."""
+        pipeline = [
+            {'$match': {cfg.COLUMN_USER_UID: user_uid}},
+            {'$project': {'item_ids': {'$slice': ['$item_ids', n]}}},
+            {'$lookup': {'from': cfg.COLLECTION_NAME_ITEM, 'localField': 'item_ids',
+                         'foreignField': cfg.COLUMN_ITEM_CODE, 'as': 'items'}}
+        ]
+        collection = get_reco_collection(self.conn, cfg.COLLECTION_NAME_USER_RECOMMENDATION)
+        docs = await collection.aggregate(pipeline).to_list(None)
+        if not docs:
+            return []
+        by_code = {i[cfg.COLUMN_ITEM_CODE]: i for i in docs[0]['items']}  # $lookup does not keep the order
+        return [by_code[c] for c in docs[0]['item_ids'] if c in by_code]
+
+    async def replace_many(self, documents: List[dict]) -> int:
+        operations = [ReplaceOne({cfg.COLUMN_USER_UID: d[cfg.COLUMN_USER_UID]}, d, upsert=True) for d in documents]
+        if not operations:
+            return 0
+        await self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_USER_RECOMMENDATION].bulk_write(operations, ordered=False)
+        return len(operations)
+
+
+class MongoDBUserRepository(UserRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+
+    @property
+    def collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_USER]
+
+    async def find_by_uid(self, user_uid: Any) -> Optional[dict]:
+        return await self.collection.find_one(ObjectId(user_uid))
+
+    async def find_by_reco2js_id(self, reco2js_id: str) -> Optional[dict]:
+        return await self.collection.find_one(filter={'keys.reco2js_ids': reco2js_id})
+
+    async def upsert_by_reco2js_id(self, reco2js_id: str, fields: dict) -> dict:
+        # TODO: currently reco2js.id is the only deterministic identifier
+        return await self.collection.find_one_and_update({'keys.reco2js_ids': reco2js_id},
+                                                         {"$set": fields},
+                                                         upsert=True,
+                                                         return_document=ReturnDocument.AFTER)
+
+    async def insert(self, document: dict) -> Any:
+        res = await self.collection.insert_one(document=document)
+        return res.inserted_id
+
+    async def set_group(self, user_uid: Any, group_name: str, group_value: str):
+        await self.collection.update_one(filter={'_id': user_uid},
+                                         update={'$set': {f"groups.{group_name}": group_value}})
+
+    async def delete_by_reco2js_id(self, reco2js_id: str) -> int:
+        res = await self.collection.delete_many(filter={'keys.reco2js_ids': reco2js_id})
+        return res.deleted_count
+
+
+class MongoDBEvidenceRepository(EvidenceRepository):
+    """Evidence collection, rollups are maintained along with inserts when `EVIDENCE_ROLLUP_ENABLED`."""
+
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+        self._user_indexed = False
+
+    @property
+    def collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE]
+
+    @property
+    def rollup_collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE_ROLLUP]
+
+    async def insert_many(self, documents: List[dict]) -> int:
+        res = await self.collection.insert_many(documents)
+        if cfg.EVIDENCE_ROLLUP_ENABLED:
+            await update_rollups(self.rollup_collection, documents)
+        return len(res.inserted_ids)
+
+    async def find_by_user(self, user_uid: str) -> List[dict]:
+        return await self.collection.find(filter={'user_uid': user_uid}).to_list(None)
+
+    async def consumed_item_ids(self, user_uid: str, names: List[str]) -> List[str]:
+        """Distinct item ids of the user's evidence (index on user uid and name is created on first call)."""
+        if not self._user_indexed:
+            await self.collection.create_index([(cfg.COLUMN_USER_UID, pymongo.ASCENDING),
+                                                (cfg.COLUMN_NAME, pymongo.ASCENDING)])
+            self._user_indexed = True
+        return await self.collection.distinct(cfg.COLUMN_ITEM_ID, {cfg.COLUMN_USER_UID: user_uid,
+                                                                   cfg.COLUMN_NAME: {'$in': list(names)}})
+
+    async def delete_by_user(self, user_uid: str) -> int:
+        res = await self.collection.delete_many(filter={'user_uid': user_uid})
+        await self.rollup_collection.delete_many(filter={'user_uid': user_uid})
+        return res.deleted_count
+
+    async def popular_item_ids(self, n: int) -> List[str]:
+        """Item ids with highest summed up rollup counts (rollups reference item codes)."""
+        pipeline = [{'$group': {'_id': f"${cfg.COLUMN_ITEM_CODE}", 'count': {'$sum': f"${cfg.COLUMN_COUNT}"}}},
+                    {'$sort': {'count': -1}},
+                    {'$limit': n},
+                    {'$lookup': {'from': cfg.COLLECTION_NAME_ITEM_CODE, 'localField': '_id', 'foreignField': '_id',
+                                 'as': 'entry'}},
+                    {'$unwind': '$entry'},
+                    {'$sort': {'count': -1}}]
+        return [d['entry']['id'] async for d in self.rollup_collection.aggregate(pipeline)]
+
+
+class MongoDBSplittingRepository(SplittingRepository):
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+
+    @property
+    def collection(self):
+        return self.conn[cfg.DB_NAME][cfg.COLLECTION_NAME_SPLITTING_CONFIG]
+
+    async def find(self, name: str) -> Optional[dict]:
+        return await self.collection.find_one({'name': name})
+
+    async def find_all(self) -> List[dict]:
+        return await self.collection.find().to_list(None)
+
+    async def upsert(self, document: dict):
+        await self.collection.find_one_and_update({'name': document['name']}, {"$set": document}, upsert=True)
+
+    async def delete(self, name: str) -> int:
+        res = await self.collection.delete_one({'name': name})
+        return res.deleted_count
+
+
+class MongoDBStorage(Storage):
+    """Repositories on MongoDB collections of `DB_NAME` (recommendation reads use `DB_READ_PREFERENCE_RECO`)."""
+    name = 'mongodb'
+
+    def __init__(self, conn: AsyncIOMotorClient):
+        self.conn = conn
+        self.items = MongoDBItemRepository(conn)
+        self.item_codes = MongoDBItemCodeRepository(conn)
+        self.relations = MongoDBRelationRepository(conn)
+        self.user_recommendations = MongoDBUserRecommendationRepository(conn)
+        self.users = MongoDBUserRepository(conn)
+        self.evidence = MongoDBEvidenceRepository(conn)
+        self.splittings = MongoDBSplittingRepository(conn)
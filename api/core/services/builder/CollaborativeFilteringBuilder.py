@@ -1,19 +1,35 @@
 from __future__ import division
+from typing import Dict, List
 from scipy.sparse import csr_matrix
 import numpy as np
 import pandas as pd
 import api.core.util.config as cfg
 from api.core.db.models.relation import CollaborativeFilteringRelation
 from api.core.services.builder import BaseRecoBuilder
+from api.core.services.builder.profiling import BuildProfiler, profile_stage, matrix_info
+from api.core.services.reco.partitions import Partitioning, partitioning as default_partitioning
 
 
 class CollaborativeFilteringBuilder(BaseRecoBuilder[CollaborativeFilteringRelation]):
-    def __init__(self, df, item_based=True):
-        super().__init__()
+    """Item-to-item relations by Jaccard similarity of the users of items (10 per item), items are identified by item
+    code (column `item_id` of evidence, see `EvidencePipeline`).
+
+    With `items` (documents with item code and the partition attributes) and partition attributes, every item
+    additionally gets up to `partition_n_recos` relations per partition (see `partitions`) with the most similar items
+    of that partition, so filtered recommendations read a full list instead of filtering the unfiltered one.
+    """
+
+    def __init__(self, df, item_based=True, profiler: BuildProfiler = None, items: List[dict] = None,
+                 partitioning: Partitioning = default_partitioning,
+                 partition_n_recos: int = cfg.RECO_PARTITION_N_RECOS):
+        super().__init__(profiler)
 
         self.df = df
         self.d = None
         self.item_based = item_based
+        self.items = items
+        self.partitioning = partitioning
+        self.partition_n_recos = partition_n_recos
         self.map_u = {}
         self.map_l = {}
         self.rating_matrix = None
@@ -22,8 +38,11 @@ class CollaborativeFilteringBuilder(BaseRecoBuilder[CollaborativeFilteringRelati
     def run(self):
         self.create_ratings_matrix()
         self.similarity = self.pairwise_jacquard()
-        self.relations = self.sort_similarity()
+        self.relations = self.convert_to_models(self.sort_similarity())
+        if self.items and self.partitioning:
+            self.relations += self.convert_to_models(self.partitioned_similarity())
 
+    @profile_stage
     def create_ratings_matrix(self):
         # Group interactions
         users_locations = self.df.groupby(
@@ -41,7 +60,9 @@ class CollaborativeFilteringBuilder(BaseRecoBuilder[CollaborativeFilteringRelati
         col_idx = [self.map_l[i] for i in col]
         data = np.array(list(users_locations.values()), dtype=np.float32)
         self.rating_matrix = csr_matrix((data, (row_idx, col_idx)), shape=(nu, ni))
+        self.profiler.annotate(**matrix_info(self.rating_matrix))
 
+    @profile_stage
     def pairwise_jacquard(self):
         """Calculates the jacquard sim only on items where at least one item is rated (=1)
         https://stackoverflow.com/questions/32805916/compute-jaccard-distances-on-sparse-matrix
@@ -54,11 +75,14 @@ class CollaborativeFilteringBuilder(BaseRecoBuilder[CollaborativeFilteringRelati
         intersect = self.rating_matrix.dot(self.rating_matrix.T)  # how many 1s two users have in common
         row_sums = intersect.diagonal()  # how many 1s for each user
         unions = row_sums[:, None] + row_sums - intersect  # (no.user1 + no.user2) - no.together
-        return intersect / unions
+        similarity = np.asarray(intersect.todense() / unions)  # dense (scipy >= 1.11 returns sparse)
+        self.profiler.annotate(intersect=matrix_info(intersect), **matrix_info(similarity))
+        return similarity
 
+    @profile_stage
     def sort_similarity(self):
         self.d = pd.DataFrame(self.similarity)
-        self.d.values[[np.arange(self.d.shape[0])] * 2] = 0  # sets diagonal to 0
+        np.fill_diagonal(self.d.values, 0)  # sets diagonal to 0
 
         relation_list = []
 
@@ -66,17 +90,50 @@ class CollaborativeFilteringBuilder(BaseRecoBuilder[CollaborativeFilteringRelati
 
         for col in self.d:
             n_recos = 10
-            for i, s in self.d[col].nlargest(n_recos).iteritems():
+            for i, s in self.d[col].nlargest(n_recos).items():
                 relation_list.append((key_list[col], key_list[i], s))
-        relations = self.convert_to_models(relation_list)
-        return relations
+        self.profiler.annotate(n_relations=len(relation_list))
+        return relation_list
+
+    def partitions(self) -> Dict[str, np.ndarray]:
+        """Columns of the similarity matrix (items) per partition key."""
+        items = {i[cfg.COLUMN_ITEM_CODE]: i for i in self.items if cfg.COLUMN_ITEM_CODE in i}
+        members = {}
+        for item_code, col in self.map_l.items():
+            item = items.get(item_code)
+            for key in self.partitioning.keys(item) if item is not None else []:
+                members.setdefault(key, []).append(col)
+        return {key: np.array(cols) for key, cols in members.items()}
+
+    @profile_stage
+    def partitioned_similarity(self):
+        """Returns (seed, recommended, similarity, partition) of the `partition_n_recos` most similar items (similarity
+        > 0) of every partition per item."""
+        key_list = np.array(list(self.map_l.keys()), dtype=object)
+        partitions = self.partitions()
+        relation_list = []
+        for key, cols in partitions.items():
+            similarity = self.similarity[:, cols]  # copy (fancy indexing)
+            similarity[cols, np.arange(len(cols))] = 0  # no self relations
+            k = min(self.partition_n_recos, len(cols))
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            values = np.take_along_axis(similarity, top, axis=1).ravel()
+            seeds = np.repeat(np.arange(similarity.shape[0]), k)
+            keep = values > 0
+            relation_list += zip(key_list[seeds[keep]], key_list[cols[top.ravel()[keep]]], values[keep].tolist(),
+                                 [key] * int(keep.sum()))
+        self.profiler.annotate(partitions=len(partitions), n_relations=len(relation_list))
+        return relation_list
 
+    @profile_stage
     def convert_to_models(self, relations):
-        a = [dict(zip(cfg.COLUMNS_RELATION_ICF, values)) for values in relations]
+        a = [dict(zip(cfg.COLUMNS_RELATION_ICF + [cfg.COLUMN_PARTITION], values)) for values in relations]
         s = []
         for b in a:
             c = dict(b)
             c["base"] = "item"
+            for column in (cfg.COLUMN_ITEM_ID_SEED, cfg.COLUMN_ITEM_ID_RECOMMENDED):
+                c[column] = int(c[column])  # item codes (numpy integers of the data frame)
             rec = CollaborativeFilteringRelation(**c, type=cfg.TYPE_COLLABORATIVE_FILTERING)
             s.append(rec)
         return s
@@ -0,0 +1,284 @@
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import api.core.util.config as cfg
+from api.core.db.models.relation import ContentBasedRelation
+from api.core.db.mongodb_utils import MongoDBHelper
+from api.core.services.builder import BaseRecoBuilder
+from api.core.services.builder.profiling import BuildProfiler, profile_stage, matrix_info
+from api.core.util.config import DB_NAME
+
+# item fields that are not content (name and type are vectorized separately)
+NON_CONTENT_FIELDS = {'_id', 'id', cfg.COLUMN_ITEM_CODE, 'type', 'name', 'price', 'url', 'image_url', 'created_time',
+                      'update_time'}
+
+TOKEN_PATTERN = re.compile(r"\w\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def item_terms(item: dict) -> Counter:
+    """Term counts of an item: words of `name`, the `type` and words (strings) or values (numbers, booleans) of
+    extra attributes, prefixed by their field name (e.g. `brand:acme`). Nested documents are ignored."""
+    terms = Counter(tokenize(item.get('name') or ''))
+    terms[f"type:{item.get('type')}".lower()] += 1
+    for field, value in item.items():
+        if field in NON_CONTENT_FIELDS:
+            continue
+        for v in value if isinstance(value, list) else [value]:
+            if isinstance(v, str):
+                terms.update(f"{field}:{token}" for token in tokenize(v))
+            elif isinstance(v, (bool, int, float)):
+                terms[f"{field}:{v}".lower()] += 1
+    return terms
+
+
+class ContentIndex:
+    """TF-IDF vectors and top-k neighbour lists (cosine similarity) of items, updatable per item.
+
+    `build` vectorizes all items and computes the neighbours of all items, `update` vectorizes new or changed items
+    only and recomputes their neighbours as well as the lists of other items they enter or leave (a list a changed item
+    leaves keeps one neighbour less until the next build). The IDF is computed by `build` and kept by updates (terms
+    new since the build get the IDF of their document frequency when first seen), vectors of changed items are kept
+    apart from the built matrix, so an update costs the similarities of the changed items, not a vectorization of the
+    catalog. Similarities are sparse products of blocks of `block_size` seed items with all items, i.e. only items
+    sharing terms are compared. Items are identified by item code (see `item_codes`), items without code are skipped.
+
+    Attributes: #noqa
+        n_recos (int): Neighbours per item.
+        block_size (int): Seed items per block of the similarity product.
+        max_df (float): Terms of more than this fraction of items are ignored.
+        item_codes (List[int]): Item code of each row.
+        rows (Dict[int, int]): Row of item code.
+        matrix (csr_matrix): L2-normalized TF-IDF vectors (rows are items) of the last build, float32.
+    """
+
+    def __init__(self, n_recos: int = cfg.CB_N_RECOS, block_size: int = cfg.CB_BLOCK_SIZE,
+                 max_df: float = cfg.CB_MAX_DF):
+        self.n_recos = n_recos
+        self.block_size = block_size
+        self.max_df = max_df
+        self.vocabulary: Dict[str, int] = {}
+        self.item_codes: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.matrix = None
+        self._matrix_t = None
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._changed: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}  # row -> (terms, values) changed since build
+        self._changed_rows = np.zeros(0, dtype=np.int64)
+        self._changed_t = None  # transposed vectors of changed rows (columns in order of `_changed_rows`)
+        self._stale = np.zeros(0, dtype=bool)  # rows of `matrix` replaced by changed vectors
+        self._df: List[int] = []  # number of items per term
+        self._terms: List[Dict[int, int]] = []  # term counts per row
+        self._neighbours: List[Dict[int, float]] = []  # row -> similarity per row
+        self._listed_in: List[Set[int]] = []  # rows whose neighbours contain row
+
+    def __len__(self):
+        return len(self.item_codes)
+
+    def build(self, items: List[dict]):
+        """Vectorizes `items` and computes neighbours of all items."""
+        self._add(items)
+        self._vectorize()
+        for row, others, similarities in self._similarities(np.arange(len(self.item_codes))):
+            self._set_neighbours(row, self._top_k(others, similarities))
+
+    def update(self, items: List[dict]) -> List[int]:
+        """Vectorizes new or changed `items` and updates neighbours, returns codes of items with changed neighbours
+        (the items themselves and items whose lists they entered or left)."""
+        changed = self._add(items)
+        if not changed:
+            return []
+        self._vectorize_changed(changed)
+        updated = set(changed)
+        for row, others, similarities in self._similarities(np.array(changed)):
+            self._set_neighbours(row, self._top_k(others, similarities))
+            by_other = dict(zip(others.tolist(), similarities.tolist()))
+            entering = others[similarities > self._thresholds(others)].tolist()
+            for other in self._listed_in[row].union(entering):
+                neighbours = dict(self._neighbours[other])
+                neighbours.pop(row, None)
+                if other in by_other:
+                    neighbours[row] = by_other[other]
+                best = sorted(neighbours.items(), key=lambda n: -n[1])[:self.n_recos]
+                self._set_neighbours(other, dict(best))
+                updated.add(other)
+        return [self.item_codes[row] for row in sorted(updated)]
+
+    def neighbours(self, item_codes: List[int]) -> List[Tuple[int, int, float]]:
+        """Returns (item_id_seed, item_id_recommended, similarity) of `item_codes` ordered by descending similarity."""
+        return [(code, self.item_codes[other], similarity)
+                for code in item_codes if code in self.rows
+                for other, similarity in sorted(self._neighbours[self.rows[code]].items(), key=lambda n: -n[1])]
+
+    def _add(self, items: List[dict]) -> List[int]:
+        """Stores term counts of new or changed items and updates document frequencies, returns changed rows."""
+        changed = []
+        for item in items:
+            code = item.get(cfg.COLUMN_ITEM_CODE)
+            if code is None:
+                continue
+            terms = {self.vocabulary.setdefault(t, len(self.vocabulary)): c for t, c in item_terms(item).items()}
+            self._df.extend([0] * (len(self.vocabulary) - len(self._df)))
+            row = self.rows.get(code)
+            if row is None:
+                row = self.rows[code] = len(self.item_codes)
+                self.item_codes.append(code)
+                self._terms.append({})
+                self._neighbours.append({})
+                self._listed_in.append(set())
+            elif self._terms[row] == terms:
+                continue
+            for t in self._terms[row]:
+                self._df[t] -= 1
+            for t in terms:
+                self._df[t] += 1
+            self._terms[row] = terms
+            changed.append(row)
+        return changed
+
+    def _idf_of(self, df: np.ndarray) -> np.ndarray:
+        """Smoothed IDF log((1 + n) / (1 + df)) + 1. Terms of more than `max_df` of the items (e.g. the type of a
+        single type catalog) get 0, they would make almost all items neighbours of each other."""
+        n_items = len(self.item_codes)
+        df = df.astype(np.float32)
+        return np.where(df > self.max_df * n_items, 0, np.log((1 + n_items) / (1 + df)) + 1).astype(np.float32)
+
+    def _vectorize(self):
+        """Builds L2-normalized TF-IDF matrix of all items (IDF of current document frequencies)."""
+        n_items = len(self.item_codes)
+        idf = self._idf = self._idf_of(np.asarray(self._df))
+        indptr = np.cumsum([0] + [len(t) for t in self._terms])
+        indices = np.fromiter((t for terms in self._terms for t in terms), dtype=np.int32, count=indptr[-1])
+        counts = np.fromiter((c for terms in self._terms for c in terms.values()), dtype=np.float32,
+                             count=indptr[-1])
+        matrix = csr_matrix((counts * idf[indices], indices, indptr), shape=(n_items, len(self.vocabulary)),
+                            dtype=np.float32)
+        matrix.eliminate_zeros()
+        indptr = matrix.indptr
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32)).ravel()
+        matrix.data /= np.repeat(np.maximum(norms, np.finfo(np.float32).tiny), np.diff(indptr))
+        self.matrix = matrix
+        self._matrix_t = matrix.T.tocsr()
+        self._changed = {}
+        self._changed_rows = np.zeros(0, dtype=np.int64)
+        self._changed_t = None
+        self._stale = np.zeros(n_items, dtype=bool)
+
+    def _vectorize_changed(self, rows: List[int]):
+        """Vectorizes changed rows with the IDF of the last build and replaces their rows of the built matrix."""
+        n_new_terms = len(self.vocabulary) - len(self._idf)
+        if n_new_terms > 0:
+            self._idf = np.concatenate([self._idf, self._idf_of(np.asarray(self._df[-n_new_terms:]))])
+        for row in rows:
+            terms = self._terms[row]
+            indices = np.fromiter(terms, dtype=np.int32, count=len(terms))
+            values = np.fromiter(terms.values(), dtype=np.float32, count=len(terms)) * self._idf[indices]
+            keep = values > 0
+            indices, values = indices[keep], values[keep]
+            self._changed[row] = indices, values / max(np.sqrt(values @ values), np.finfo(np.float32).tiny)
+            if row < len(self._stale):
+                self._stale[row] = True
+        self._changed_rows = np.fromiter(self._changed, dtype=np.int64, count=len(self._changed))
+        self._changed_t = self._vectors(self._changed_rows).T.tocsr()
+
+    def _vectors(self, rows: np.ndarray) -> csr_matrix:
+        """Vectors of rows (changed vectors or rows of the built matrix) with all terms as columns."""
+        if not self._changed:
+            return self.matrix[rows]
+        parts = []
+        for row in rows.tolist():
+            if row in self._changed:
+                parts.append(self._changed[row])
+            else:
+                begin, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+                parts.append((self.matrix.indices[begin:end], self.matrix.data[begin:end]))
+        indptr = np.cumsum([0] + [len(indices) for indices, _ in parts])
+        indices = np.concatenate([indices for indices, _ in parts]).astype(np.int32)
+        values = np.concatenate([values for _, values in parts]).astype(np.float32)
+        return csr_matrix((values, indices, indptr), shape=(len(rows), len(self.vocabulary)), dtype=np.float32)
+
+    def _similarities(self, rows: np.ndarray) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Yields (row, other rows, cosine similarities) of `rows` with similarity > 0 (self excluded), computed as
+        sparse product of blocks of rows with all items, i.e. only items sharing terms are compared."""
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            vectors = self._vectors(block)
+            similarities = vectors[:, :self._matrix_t.shape[0]] @ self._matrix_t
+            changed = vectors @ self._changed_t if self._changed else None
+            for i, row in enumerate(block):
+                begin, end = similarities.indptr[i], similarities.indptr[i + 1]
+                others, values = similarities.indices[begin:end], similarities.data[begin:end]
+                if changed is not None:  # built vectors of changed rows are replaced by their changed vectors
+                    keep = ~self._stale[others]
+                    begin, end = changed.indptr[i], changed.indptr[i + 1]
+                    others = np.concatenate([others[keep], self._changed_rows[changed.indices[begin:end]]])
+                    values = np.concatenate([values[keep], changed.data[begin:end]])
+                keep = (others != row) & (values > 0)
+                yield int(row), others[keep], values[keep]
+
+    def _top_k(self, others: np.ndarray, similarities: np.ndarray) -> Dict[int, float]:
+        if len(others) > self.n_recos:
+            idx = np.argpartition(-similarities, self.n_recos - 1)[:self.n_recos]
+            others, similarities = others[idx], similarities[idx]
+        return dict(zip(others.tolist(), similarities.tolist()))
+
+    def _thresholds(self, rows: np.ndarray) -> np.ndarray:
+        """Similarity an item must exceed to enter the neighbours of `rows` (0 while a list is not full)."""
+        return np.array([min(n.values()) if len(n) >= self.n_recos else 0
+                         for n in map(self._neighbours.__getitem__, rows.tolist())], dtype=np.float32)
+
+    def _set_neighbours(self, row: int, neighbours: Dict[int, float]):
+        for other in self._neighbours[row]:
+            self._listed_in[other].discard(row)
+        for other in neighbours:
+            self._listed_in[other].add(row)
+        self._neighbours[row] = neighbours
+
+
+class ContentBasedBuilder(BaseRecoBuilder[ContentBasedRelation]):
+    """Item-to-item relations by cosine similarity of TF-IDF vectors of item metadata (see `ContentIndex`). Relations
+    do not need evidence, so new items get recommendations before the next collaborative filtering build.
+
+    Attributes: #noqa
+        items (List[dict]): Item documents.
+        index (ContentIndex): Vectors and neighbours after `run`, can be updated with new or changed items.
+    """
+
+    def __init__(self, items: List[dict],
+                 n_recos: int = cfg.CB_N_RECOS,
+                 block_size: int = cfg.CB_BLOCK_SIZE,
+                 profiler: BuildProfiler = None):
+        super().__init__(profiler)
+        self.items = items
+        self.index = ContentIndex(n_recos=n_recos, block_size=block_size)
+
+    def run(self):
+        self.build_index()
+        self.relations = self.convert_to_models(self.index.neighbours(self.index.item_codes))
+
+    @profile_stage
+    def build_index(self):
+        self.index.build(self.items)
+        self.profiler.annotate(vocabulary=len(self.index.vocabulary), **matrix_info(self.index.matrix))
+
+    @profile_stage
+    def convert_to_models(self, relations) -> List[ContentBasedRelation]:
+        return [ContentBasedRelation(item_id_seed=seed, item_id_recommended=recommended,
+                                     similarity=similarity)
+                for seed, recommended, similarity in relations]
+
+    @profile_stage
+    def store_relations(self):
+        """Replaces all content-based relations (incremental updates keep a single list per seed item)."""
+        with MongoDBHelper(DB_NAME) as db:
+            db[cfg.COLLECTION_NAME_RELATIONS].delete_many({'type': cfg.TYPE_CONTENT_BASED})
+            if self.relations:
+                db[cfg.COLLECTION_NAME_RELATIONS].insert_many([rec.dict(by_alias=True) for rec in self.relations])
+        self.profiler.annotate(n_relations=len(self.relations))
@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import api.core.util.config as cfg
+from api.core.db.models.relation import CollaborativeFilteringRelation
+from api.core.services.builder import BaseRecoBuilder
+from api.core.services.builder.profiling import BuildProfiler, profile_stage, matrix_info
+
+
+class ImplicitALSBuilder(BaseRecoBuilder[CollaborativeFilteringRelation]):
+    """Matrix factorization for implicit feedback (alternating least squares, Hu, Koren and Volinsky 2008).
+
+    Interactions are summed up per (user, item) to a confidence matrix C = 1 + alpha * r with preference 1 for observed
+    pairs. User and item factors (float32) are solved alternately in blocks of rows: per row the normal equations
+    YtY + Yt(C_u - I)Y + reg * I are built from the row's interactions only, so an iteration is linear in the number of
+    interactions. Blocks are sized by number of interactions and solved with one batched `np.linalg.solve` each,
+    optionally in `n_threads` threads (numpy releases the GIL).
+
+    Item-to-item relations (cosine similarity of item factors) and optionally user-to-item relations (scores of user
+    and item factors, `item_id_seed` is the user) are computed in batched matrix products with `argpartition`.
+
+    Attributes: #noqa
+        df (pd.DataFrame): Evidence with user_id and item_id (and optionally count) columns.
+        factors (int): Number of latent factors.
+        iterations (int): Number of ALS iterations (each solves users and items once).
+        regularization (float): L2 regularization of factors.
+        alpha (float): Confidence scaling of interactions.
+        n_recos (int): Number of relations per item (and user).
+        user_relations (bool): Additionally compute user-to-item relations (base "user").
+        n_threads (int): Threads solving blocks concurrently.
+        block_nnz (int): Maximum number of interactions per solved block.
+        topk_block_elements (int): Maximum number of scores per block of the top-k products.
+        user_factors (np.ndarray): (n_users, factors) float32 after `run`.
+        item_factors (np.ndarray): (n_items, factors) float32 after `run`.
+    """
+
+    def __init__(self, df,
+                 factors: int = cfg.ALS_FACTORS,
+                 iterations: int = cfg.ALS_ITERATIONS,
+                 regularization: float = cfg.ALS_REGULARIZATION,
+                 alpha: float = cfg.ALS_ALPHA,
+                 n_recos: int = 10,
+                 user_relations: bool = False,
+                 n_threads: int = cfg.ALS_NUM_THREADS,
+                 block_nnz: int = cfg.ALS_BLOCK_NNZ,
+                 topk_block_elements: int = cfg.ALS_TOPK_BLOCK_ELEMENTS,
+                 seed: int = 42,
+                 profiler: BuildProfiler = None):
+        super().__init__(profiler)
+        self.df = df
+        self.factors = factors
+        self.iterations = iterations
+        self.regularization = regularization
+        self.alpha = alpha
+        self.n_recos = n_recos
+        self.user_relations = user_relations
+        self.n_threads = max(1, n_threads)
+        self.block_nnz = block_nnz
+        self.topk_block_elements = topk_block_elements
+        self.seed = seed
+        self.user_ids = None
+        self.item_ids = None
+        self.confidence = None
+        self.user_factors = None
+        self.item_factors = None
+
+    def run(self):
+        self.create_confidence_matrix()
+        self.fit()
+        relations = self.top_k_similar_items()
+        if self.user_relations:
+            relations += self.top_k_user_items()
+        self.relations = self.convert_to_models(relations)
+
+    @profile_stage
+    def create_confidence_matrix(self):
+        """Builds (n_users, n_items) CSR matrix of alpha * r (confidence minus 1) from summed up interactions."""
+        counts = self.df[cfg.COLUMN_COUNT] if cfg.COLUMN_COUNT in self.df else pd.Series(1, index=self.df.index)
+        user_idx, self.user_ids = pd.factorize(self.df[cfg.COLUMN_USER_ID])
+        item_idx, self.item_ids = pd.factorize(self.df[cfg.COLUMN_ITEM_ID])
+        # duplicates (user, item) are summed up by the conversion to CSR
+        self.confidence = csr_matrix((self.alpha * counts.to_numpy(dtype=np.float32), (user_idx, item_idx)),
+                                     shape=(len(self.user_ids), len(self.item_ids)), dtype=np.float32)
+        self.confidence.sum_duplicates()
+        self.profiler.annotate(**matrix_info(self.confidence))
+
+    @profile_stage
+    def fit(self):
+        rng = np.random.default_rng(self.seed)
+        n_users, n_items = self.confidence.shape
+        self.user_factors = np.zeros((n_users, self.factors), dtype=np.float32)
+        self.item_factors = (rng.standard_normal((n_items, self.factors)) * 0.01).astype(np.float32)
+        confidence_t = self.confidence.T.tocsr()
+        with ThreadPoolExecutor(self.n_threads) as executor:
+            for _ in range(self.iterations):
+                self.user_factors = self.solve(self.confidence, self.item_factors, executor)
+                self.item_factors = self.solve(confidence_t, self.user_factors, executor)
+        self.profiler.annotate(factors=self.factors, iterations=self.iterations,
+                               factor_mb=round((self.user_factors.nbytes + self.item_factors.nbytes) / 2 ** 20, 3))
+
+    def solve(self, confidence: csr_matrix, fixed: np.ndarray, executor: ThreadPoolExecutor) -> np.ndarray:
+        """Solves factors of all rows of `confidence` given the factors of its columns."""
+        gram = fixed.T @ fixed + self.regularization * np.eye(self.factors, dtype=np.float32)
+        res = np.zeros((confidence.shape[0], self.factors), dtype=np.float32)
+
+        def solve_block(block: Tuple[int, int]):
+            start, end = block
+            res[start:end] = solve_rows(confidence[start:end], fixed, gram)
+
+        list(executor.map(solve_block, row_blocks(confidence.indptr, self.block_nnz)))
+        return res
+
+    @profile_stage
+    def top_k_similar_items(self) -> List[tuple]:
+        """Returns (item_id_seed, item_id_recommended, similarity, base) of `n_recos` most similar items per item."""
+        norms = np.linalg.norm(self.item_factors, axis=1, keepdims=True)
+        normalized = self.item_factors / np.maximum(norms, np.finfo(np.float32).tiny)
+        relations = []
+        for start, idx, scores in top_k(normalized, normalized, self.n_recos, self.topk_block_elements,
+                                        exclude_self=True):
+            for row in range(idx.shape[0]):
+                seed = self.item_ids[start + row]
+                relations += [(seed, self.item_ids[i], float(s), "item") for i, s in zip(idx[row], scores[row])]
+        self.profiler.annotate(n_relations=len(relations))
+        return relations
+
+    @profile_stage
+    def top_k_user_items(self) -> List[tuple]:
+        """Returns (user_id, item_id_recommended, score, base) of `n_recos` top scored items per user, items the
+        user interacted with are excluded."""
+        relations = []
+        for start, idx, scores in top_k(self.user_factors, self.item_factors, self.n_recos, self.topk_block_elements,
+                                        exclude=self.confidence):
+            for row in range(idx.shape[0]):
+                user = self.user_ids[start + row]
+                relations += [(user, self.item_ids[i], float(s), "user")
+                              for i, s in zip(idx[row], scores[row]) if np.isfinite(s)]
+        self.profiler.annotate(n_relations=len(relations))
+        return relations
+
+    @profile_stage
+    def convert_to_models(self, relations) -> List[CollaborativeFilteringRelation]:
+        return [CollaborativeFilteringRelation(item_id_seed=int(seed) if base == "item" else str(seed),
+                                               item_id_recommended=int(recommended),
+                                               similarity=similarity, base=base, type=cfg.TYPE_ALS)
+                for seed, recommended, similarity, base in relations]
+
+    def save_factors(self, path: str):
+        """Writes factors, user ids and item codes as compressed numpy file (load with `load_factors`)."""
+        np.savez_compressed(path, user_factors=self.user_factors, item_factors=self.item_factors,
+                            user_ids=np.asarray(self.user_ids, dtype=str),
+                            item_ids=np.asarray(self.item_ids, dtype=np.int32))
+
+
+def load_factors(path: str) -> dict:
+    """Reads factor file written by `ImplicitALSBuilder.save_factors`."""
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def row_blocks(indptr: np.ndarray, block_nnz: int) -> List[Tuple[int, int]]:
+    """Splits rows into consecutive blocks of at most `block_nnz` non-zero entries (at least one row per block)."""
+    blocks = []
+    start, n_rows = 0, len(indptr) - 1
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + block_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def solve_rows(confidence: csr_matrix, fixed: np.ndarray, gram: np.ndarray) -> np.ndarray:
+    """Solves (gram + Yt(C_u - I)Y) x_u = Yt C_u p_u for all rows u of a block (`confidence` holds C_u - I) with one
+    batched solve. Per row only the factors of interacted columns are multiplied (nnz_u * k^2)."""
+    indptr = confidence.indptr - confidence.indptr[0]
+    y = fixed[confidence.indices]  # (nnz, k) factors of interacted columns
+    yw = y * confidence.data[:, None]
+    a = np.broadcast_to(gram, (confidence.shape[0],) + gram.shape).copy()
+    for row in np.flatnonzero(np.diff(indptr)):
+        start, end = indptr[row], indptr[row + 1]
+        a[row] += yw[start:end].T @ y[start:end]
+    b = csr_matrix((1 + confidence.data, confidence.indices, indptr), shape=confidence.shape) @ fixed
+    return np.linalg.solve(a, b[:, :, None])[:, :, 0]
+
+
+def top_k(queries: np.ndarray, candidates: np.ndarray, k: int, block_elements: int = cfg.ALS_TOPK_BLOCK_ELEMENTS,
+          exclude_self: bool = False, exclude: csr_matrix = None):
+    """Yields (batch start, indices, scores) of the `k` highest scored candidates per query row, computed in batches
+    of `block_elements // n_candidates` queries (one matrix product and `argpartition` per batch), so the score
+    matrix of a batch does not grow with the catalog. Indices and scores are sorted by descending score, excluded
+    candidates get score -inf."""
+    k = min(k, candidates.shape[0] - (1 if exclude_self else 0))
+    if k <= 0:
+        return
+    batch_size = max(1, block_elements // candidates.shape[0])
+    for start in range(0, queries.shape[0], batch_size):
+        scores = queries[start:start + batch_size] @ candidates.T
+        rows = np.arange(scores.shape[0])
+        if exclude_self:
+            scores[rows, rows + start] = -np.inf
+        if exclude is not None:
+            mask = exclude[start:start + batch_size].tocoo()
+            scores[mask.row, mask.col] = -np.inf
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-top, axis=1)
+        yield start, np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
@@ -0,0 +1,136 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import ReplaceOne
+from scipy.sparse import csr_matrix, vstack
+
+import api.core.util.config as cfg
+from api.core.db.models.relation import UserRecommendationModel
+from api.core.db.mongodb_utils import MongoDBHelper
+from api.core.services.builder import BaseRecoBuilder
+from api.core.services.builder.profiling import BuildProfiler, profile_stage, matrix_info
+from api.core.util.config import DB_NAME
+
+
+class UserItemBuilder(BaseRecoBuilder[UserRecommendationModel]):
+    """Precomputed "for you" items per user: scores are the product of the user-item interaction matrix with the
+    item-item cosine similarity matrix truncated to the `neighbours` most similar items per item, i.e. the sum of
+    similarities of an item to the items the user interacted with. Both products run in blocks of `block_size` rows,
+    items the user interacted with are masked and the top `n_recos` items per user are kept (`argpartition`).
+
+    Results are one document per user (`user_uid`, ordered `item_ids` and `scores`) in the user recommendation
+    collection, written in one unordered bulk upsert.
+
+    Attributes: #noqa
+        df (pd.DataFrame): Evidence with user_id and item_id columns.
+        n_recos (int): Recommended items per user.
+        neighbours (int): Neighbours per item of the truncated similarity matrix.
+        block_size (int): Rows per block of the sparse products.
+        interactions (csr_matrix): (n_users, n_items) binary interactions after `run`.
+        similarity (csr_matrix): (n_items, n_items) truncated item-item similarity after `run`.
+    """
+
+    def __init__(self, df,
+                 n_recos: int = cfg.USER_RECO_N_RECOS,
+                 neighbours: int = cfg.USER_RECO_NEIGHBOURS,
+                 block_size: int = cfg.USER_RECO_BLOCK_SIZE,
+                 profiler: BuildProfiler = None):
+        super().__init__(profiler)
+        self.df = df
+        self.n_recos = n_recos
+        self.neighbours = neighbours
+        self.block_size = block_size
+        self.user_ids = None
+        self.item_ids = None
+        self.interactions = None
+        self.similarity = None
+
+    def run(self):
+        self.create_interaction_matrix()
+        self.truncated_item_similarity()
+        self.relations = self.convert_to_models(self.top_k_user_items())
+
+    @profile_stage
+    def create_interaction_matrix(self):
+        user_idx, self.user_ids = pd.factorize(self.df[cfg.COLUMN_USER_ID])
+        item_idx, self.item_ids = pd.factorize(self.df[cfg.COLUMN_ITEM_ID])
+        self.interactions = csr_matrix((np.ones(len(user_idx), dtype=np.float32), (user_idx, item_idx)),
+                                       shape=(len(self.user_ids), len(self.item_ids)), dtype=np.float32)
+        self.interactions.sum_duplicates()
+        self.interactions.data[:] = 1
+        self.profiler.annotate(**matrix_info(self.interactions))
+
+    @profile_stage
+    def truncated_item_similarity(self):
+        """Cosine similarity of item columns, keeping the `neighbours` most similar items per item (self excluded)."""
+        items = self.interactions.T.tocsr()
+        norms = np.sqrt(np.asarray(items.sum(axis=1), dtype=np.float32)).ravel()  # binary rows
+        items = csr_matrix(items.multiply(1 / np.maximum(norms, 1)[:, None]), dtype=np.float32)
+        items_t = items.T.tocsr()
+        blocks = []
+        for start in range(0, items.shape[0], self.block_size):
+            similarities = items[start:start + self.block_size] @ items_t
+            rows = np.arange(similarities.shape[0])
+            similarities = similarities - similarities.multiply(
+                csr_matrix((np.ones(len(rows)), (rows, rows + start)), shape=similarities.shape))
+            blocks.append(top_k_rows(similarities, self.neighbours))
+        self.similarity = vstack(blocks, format='csr')
+        self.profiler.annotate(**matrix_info(self.similarity))
+
+    @profile_stage
+    def top_k_user_items(self) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+        """Returns (user_id, item indices, scores) of the `n_recos` top scored items per user that the user did not
+        interact with."""
+        res = []
+        for start in range(0, self.interactions.shape[0], self.block_size):
+            seen = self.interactions[start:start + self.block_size]
+            scores = seen @ self.similarity
+            scores = top_k_rows(scores - scores.multiply(seen), self.n_recos)
+            for row in range(scores.shape[0]):
+                begin, end = scores.indptr[row], scores.indptr[row + 1]
+                res.append((self.user_ids[start + row], scores.indices[begin:end], scores.data[begin:end]))
+        self.profiler.annotate(n_users=len(res))
+        return res
+
+    @profile_stage
+    def convert_to_models(self, recommendations) -> List[UserRecommendationModel]:
+        return [UserRecommendationModel(user_uid=str(user_id), item_ids=[int(self.item_ids[i]) for i in items],
+                                        scores=scores.tolist())
+                for user_id, items, scores in recommendations if len(items)]
+
+    @profile_stage
+    def store_relations(self):
+        """Replaces recommendations of all users: one unordered bulk upsert (unique index on user uid) of entries
+        stamped with the build id, then entries of earlier builds (users missing from this build) are deleted."""
+        build_id = str(ObjectId())
+        with MongoDBHelper(DB_NAME) as db:
+            collection = db[cfg.COLLECTION_NAME_USER_RECOMMENDATION]
+            collection.create_index(cfg.COLUMN_USER_UID, unique=True)
+            if self.relations:
+                collection.bulk_write([ReplaceOne({cfg.COLUMN_USER_UID: r.user_uid}, {**r.dict(), 'build_id': build_id},
+                                                  upsert=True)
+                                       for r in self.relations], ordered=False)
+            deleted = collection.delete_many({'build_id': {'$ne': build_id}}).deleted_count
+        self.profiler.annotate(n_users=len(self.relations), n_deleted_users=deleted)
+
+
+def top_k_rows(matrix: csr_matrix, k: int) -> csr_matrix:
+    """Keeps the `k` largest positive entries per row, ordered by descending value within each row."""
+    lengths, indices, data = [], [], []
+    for row in range(matrix.shape[0]):
+        begin, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols, values = matrix.indices[begin:end], matrix.data[begin:end]
+        positive = values > 0
+        cols, values = cols[positive], values[positive]
+        if len(values) > k:
+            idx = np.argpartition(-values, k - 1)[:k]
+            cols, values = cols[idx], values[idx]
+        order = np.argsort(-values, kind='stable')
+        lengths.append(len(order))
+        indices.append(cols[order])
+        data.append(values[order])
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    return csr_matrix((np.concatenate(data or [np.zeros(0)]).astype(np.float32),
+                       np.concatenate(indices or [np.zeros(0, dtype=np.int32)]), indptr), shape=matrix.shape)
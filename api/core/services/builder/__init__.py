@@ -1,6 +1,7 @@
-from typing import Generic, TypeVar
+from typing import Generic, TypeVar, Optional
 import api.core.util.config as cfg
 from api.core.db.mongodb_utils import MongoDBHelper
+from api.core.services.builder.profiling import BuildProfiler, profile_stage
 from api.core.util.config import DB_NAME
 
 T = TypeVar('T')
@@ -15,6 +16,8 @@ class BaseRecoBuilder(Generic[T]):
             each list entry contains an instance of reco model
     - collection_name: str
             the collection of database where relations can be persisted
+    - profiler: BuildProfiler
+            records time and memory per stage (methods decorated with @profile_stage)
 
     methods:
     - run(self): None
@@ -22,14 +25,28 @@ class BaseRecoBuilder(Generic[T]):
             the relations and stores them in attribute relations (see above)
     - store_relations(self): None
             persists relations in self.collection_name of database (from .env)
+    - store_build_history(self, **info): None
+            persists profiling report (and additional info) in build history collection
     """
 
-    def __init__(self):
+    def __init__(self, profiler: Optional[BuildProfiler] = None):
         self.relations: [T] = []
+        self.profiler = profiler or BuildProfiler()
+        self.profiler.builder = self.__class__.__name__
 
     def run(self):
         return
 
+    @profile_stage
     def store_relations(self):
         with MongoDBHelper(DB_NAME) as db:
             db[cfg.COLLECTION_NAME_RELATIONS].insert_many([rec.dict(by_alias=True) for rec in self.relations])
+        self.profiler.annotate(n_relations=len(self.relations))
+
+    def store_build_history(self, **info) -> dict:
+        """Logs profiling report and stores it with additional info in build history collection."""
+        self.profiler.log()
+        report = {**self.profiler.report(), **info}
+        with MongoDBHelper(DB_NAME) as db:
+            db[cfg.COLLECTION_NAME_BUILD_HISTORY].insert_one(dict(report))
+        return report
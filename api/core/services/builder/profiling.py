@@ -0,0 +1,142 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+import api.core.util.config as cfg
+from api.core.util.metrics import BUILDER_DURATION
+
+logger = logging.getLogger(__name__)
+
+_tracing = threading.Lock()  # tracemalloc is process-global, only one stage of concurrent builds traces at a time
+
+
+class BuildProfiler:
+    """Records wall time, CPU time and peak memory per builder stage.
+
+    Peak memory is traced with tracemalloc (allocations within the stage, numpy buffers included) when
+    `trace_memory` is set and no stage of another (concurrent) build traces. The current RSS of the process is sampled
+    by a background thread during every stage (Linux, `/proc/self/statm`), records get the peak and the change of RSS
+    within the stage. Both RSS and CPU time (`process_time`) are measured for the process, i.e. include other threads
+    such as concurrent requests or builds. Stages can be annotated with further information, e.g. matrix shapes and
+    number of non-zero entries.
+
+    Attributes: #noqa
+        builder (str): Name of profiled builder (used in report and metrics).
+        trace_memory (bool): Trace peak memory per stage with tracemalloc (slows down allocation heavy code).
+        rss_interval (float): Seconds between RSS samples.
+        stages (List[dict]): Stage records in order of completion.
+    """
+
+    def __init__(self, builder: str = None, trace_memory: bool = cfg.BUILDER_PROFILE_MEMORY,
+                 rss_interval: float = cfg.BUILDER_PROFILE_RSS_INTERVAL):
+        self.builder = builder
+        self.trace_memory = trace_memory
+        self.rss_interval = rss_interval
+        self.stages: List[dict] = []
+        self.started = datetime.utcnow()
+        self._open: List[dict] = []  # stack of running stages
+
+    @contextmanager
+    def stage(self, name: str):
+        record = {'stage': name}
+        # nested stages are part of the outer stage's peak
+        trace = self.trace_memory and not self._open and _tracing.acquire(blocking=False)
+        if trace:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()  # resets peak (tracemalloc.reset_peak requires python 3.9)
+            tracemalloc.start()
+        self._open.append(record)
+        sampler = _RssSampler(self.rss_interval) if _rss_bytes() is not None else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(time.process_time() - cpu, 6)
+            self._open.pop()
+            if trace:
+                record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+                tracemalloc.stop()
+                _tracing.release()
+            if sampler is not None:
+                end = sampler.stop()
+                record['rss_peak_mb'] = round(sampler.peak / 2 ** 20, 3)
+                record['rss_delta_mb'] = round((end - sampler.initial) / 2 ** 20, 3)
+            self.stages.append(record)
+            BUILDER_DURATION.observe(record['wall_s'], builder=self.builder, stage=name)
+
+    def annotate(self, **info):
+        """Adds information to the running stage (or to the most recently completed stage)."""
+        (self._open or self.stages)[-1].update(info)
+
+    def report(self) -> dict:
+        return {'builder': self.builder,
+                'started': self.started.isoformat(),
+                'total_wall_s': round(sum(s['wall_s'] for s in self.stages), 6),
+                'total_cpu_s': round(sum(s['cpu_s'] for s in self.stages), 6),
+                'peak_mb': max((s.get('peak_mb', 0) for s in self.stages), default=0),
+                'rss_peak_mb': max((s.get('rss_peak_mb', 0) for s in self.stages), default=0),
+                'stages': list(self.stages)}
+
+    def log(self):
+        """Logs report as single structured (JSON) log line."""
+        logger.info(json.dumps({'event': 'build_profile', **self.report()}))
+
+
+def profile_stage(func):
+    """Decorator for builder methods, runs method as profiler stage named like the method."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.stage(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def matrix_info(m) -> dict:
+    """Shape and number of stored entries of a (sparse or dense) matrix."""
+    import numpy as np
+    nnz = m.nnz if hasattr(m, 'nnz') else np.count_nonzero(m)
+    return {'shape': list(m.shape), 'nnz': int(nnz)}
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size of the process (None without `/proc`, e.g. on macOS)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+class _RssSampler(threading.Thread):
+    """Samples the RSS of the process every `interval` seconds until stopped and keeps the peak (max. RSS of
+    `getrusage` is the peak of the process lifetime, not of a stage)."""
+
+    def __init__(self, interval: float):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.interval = interval
+        self.initial = self.peak = _rss_bytes()
+        self._stopped = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def stop(self) -> int:
+        """Stops sampling, returns the RSS at the end of the stage."""
+        self._stopped.set()
+        self.join()
+        end = _rss_bytes()
+        self.peak = max(self.peak, end)
+        return end
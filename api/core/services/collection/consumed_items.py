@@ -0,0 +1,124 @@
+import hashlib
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import api.core.util.config as cfg
+from api.core.db.storage import Storage
+from api.core.services.collection.variants import variants
+from api.core.util.metrics import Gauge
+
+
+def item_key(item_id: str) -> int:
+    """Stable signed 64-bit hash of an item id (false positive probability of a lookup is about n / 2^64)."""
+    return int.from_bytes(hashlib.blake2b(str(item_id).encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+class ConsumedItems:
+    """Items consumed per user (evidence names `names`, e.g. purchases), kept in memory of the serving process to
+    exclude them from recommendations without an evidence query per request. Users are loaded from stored evidence
+    on first use and again after `refresh_interval` seconds (evidence ingested by other processes), evidence ingested
+    by this process is added immediately. Consumed variants also exclude their parent item (relations are stored per
+    parent, see `variants`).
+
+    Every user has a sorted array of 64-bit item id hashes (8 bytes per item), lookups are binary searches. At most
+    `max_users` users are kept, the least recently active user is evicted first. Recommendation methods fetch up to
+    `max_overfetch` additional candidates (at most one per consumed item) so that `n_recos` items remain after
+    filtering.
+
+    Attributes: #noqa
+        names (Sequence[str]): Evidence names that mark an item as consumed.
+        max_users (int): Maximum number of users.
+        max_overfetch (int): Maximum number of additionally fetched candidates.
+        refresh_interval (float): Seconds after which a user is loaded from stored evidence again.
+    """
+
+    def __init__(self,
+                 names: Sequence[str] = cfg.RECO_EXCLUDE_EVIDENCE_NAMES,
+                 max_users: int = cfg.RECO_EXCLUDE_MAX_USERS,
+                 max_overfetch: int = cfg.RECO_EXCLUDE_MAX_OVERFETCH,
+                 refresh_interval: float = cfg.RECO_EXCLUDE_REFRESH_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.names = set(names)
+        self.max_users = max_users
+        self.max_overfetch = max_overfetch
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._users: 'OrderedDict[str, array]' = OrderedDict()
+        self._loaded: Dict[str, float] = {}  # user uid -> time of last load from storage
+
+    def __len__(self):
+        return len(self._users)
+
+    def add(self, documents: List[dict]):
+        """Adds consumed items of evidence documents (with name, user uid and item id)."""
+        for d in documents:
+            user_uid, item_id = d.get(cfg.COLUMN_USER_UID), d.get(cfg.COLUMN_ITEM_ID)
+            if user_uid is None or item_id is None or d.get(cfg.COLUMN_NAME) not in self.names:
+                continue
+            self._add_items(user_uid, [item_id])
+
+    async def load(self, storage: Storage, user_uid: Optional[str]):
+        """Loads consumed items of the user from stored evidence unless loaded within `refresh_interval` seconds.
+        Items are merged, so evidence of this process that is not persisted yet (write-behind buffer) is kept."""
+        if user_uid is None or not self.names or not cfg.RECO_EXCLUDE_ENABLED:
+            return
+        now = self._clock()
+        loaded = self._loaded.get(user_uid)
+        if loaded is not None and now - loaded < self.refresh_interval:
+            return
+        self._loaded[user_uid] = now
+        self._add_items(user_uid, await storage.evidence.consumed_item_ids(user_uid, list(self.names)))
+
+    def _add_items(self, user_uid: str, item_ids: Iterable[str]):
+        keys = self._users.get(user_uid)
+        if keys is None:
+            keys = self._users[user_uid] = array('q')
+            if len(self._users) > self.max_users:
+                evicted, _ = self._users.popitem(last=False)
+                self._loaded.pop(evicted, None)
+        else:
+            self._users.move_to_end(user_uid)
+        for item_id in item_ids:
+            for key in {item_key(item_id), item_key(variants.resolve(str(item_id)))}:
+                position = bisect_left(keys, key)
+                if position == len(keys) or keys[position] != key:
+                    keys.insert(position, key)
+
+    def count(self, user_uid: Optional[str]) -> int:
+        keys = self._users.get(user_uid) if user_uid is not None else None
+        return len(keys) if keys else 0
+
+    def digest(self, user_uid: str) -> str:
+        """Hash of the user's consumed items (changes with every added item, empty without consumed items)."""
+        keys = self._users.get(user_uid)
+        return hashlib.blake2b(keys.tobytes(), digest_size=8).hexdigest() if keys else ""
+
+    def fetch_size(self, user_uid: Optional[str], n_recos: int) -> int:
+        """Number of candidates to fetch for `n_recos` items after filtering."""
+        return n_recos + min(self.count(user_uid), self.max_overfetch)
+
+    def contains(self, user_uid: str, item_id: str) -> bool:
+        keys = self._users.get(user_uid)
+        if not keys:
+            return False
+        key = item_key(item_id)
+        position = bisect_left(keys, key)
+        return position < len(keys) and keys[position] == key
+
+    def exclude(self, user_uid: Optional[str], items: list) -> list:
+        """Returns `items` (with attribute `id`) the user did not consume."""
+        if not self.count(user_uid):
+            return items
+        return [i for i in items if not self.contains(user_uid, i.id)]
+
+    def clear(self, user_uid: str):
+        self._users.pop(user_uid, None)
+        self._loaded.pop(user_uid, None)
+
+
+consumed_items = ConsumedItems()
+
+Gauge("consumed_items_users", "Number of users with consumed items in memory.", function=lambda: len(consumed_items))
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import api.core.util.config as cfg
+from api.core.db.models.relation import ContentBasedRelation
+from api.core.db.storage import Storage, storage_holder
+
+logger = logging.getLogger(__name__)
+
+
+class ContentIndexHolder:
+    """Content index (see `ContentIndex` of `ContentBasedBuilder`) of the serving process, updated with every item
+    upsert. Updates run in the threadpool one at a time, their relations replace the content-based relations of the
+    affected seed items. The index is private to the process, relations of other items are recomputed from its
+    neighbour lists, so only one process may update it (see `start_content_index`).
+
+    Attributes: #noqa
+        index (ContentIndex): Index built at startup or by the last content-based build of this process.
+    """
+
+    def __init__(self):
+        self.index = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._process_lock = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:  # created within the running event loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def replace(self, index):
+        """Replaces the index (e.g. after a content-based build), waits for a running update."""
+        async with self._get_lock():
+            self.index = index
+
+    async def update(self, storage: Storage, documents: List[dict]) -> int:
+        """Updates index with upserted item documents and stores the relations of all items with changed neighbours,
+        returns number of stored relations (0 without index)."""
+        if self.index is None:
+            return 0
+        async with self._get_lock():
+            index = self.index
+            item_codes = await run_in_threadpool(index.update, documents)
+            relations = [ContentBasedRelation(item_id_seed=seed, item_id_recommended=recommended,
+                                              similarity=similarity).dict(by_alias=True)
+                         for seed, recommended, similarity in index.neighbours(item_codes)]
+            return await storage.relations.replace(cfg.TYPE_CONTENT_BASED, "item", item_codes, relations)
+
+
+content_index = ContentIndexHolder()
+
+
+def _acquire_process_lock(path: str):
+    """Locks `path` for this process, raises `RuntimeError` if another process holds the lock."""
+    import fcntl  # POSIX only, like the deployment images
+    lock_file = open(path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(f"CB_INCREMENTAL_ENABLED requires a single process, the content index is updated by "
+                           f"another process (lock {path}). Run one worker with it or disable it.")
+    return lock_file
+
+
+async def start_content_index():
+    """Builds the content index of the process. Only one process of the host may keep an index (lock file
+    `CB_INCREMENTAL_LOCK_PATH`), further workers with `CB_INCREMENTAL_ENABLED` fail at startup."""
+    if not cfg.CB_INCREMENTAL_ENABLED:
+        return
+    content_index._process_lock = _acquire_process_lock(cfg.CB_INCREMENTAL_LOCK_PATH)
+    from api.core.services.builder.ContentBasedBuilder import ContentIndex  # numpy, scipy
+    logger.info("build content index...")
+    items = await storage_holder.storage.items.find_all()
+    index = ContentIndex()
+    await run_in_threadpool(index.build, items)
+    await content_index.replace(index)
+    logger.info(f"content index of {len(index)} items with {len(index.vocabulary)} terms built")
+
+
+async def stop_content_index():
+    await content_index.replace(None)
+    if content_index._process_lock is not None:
+        content_index._process_lock.close()  # releases the lock
+        content_index._process_lock = None
@@ -1,66 +1,162 @@
 import logging
 
-import pandas as pd
-from fastapi import Request
+from fastapi import Request, HTTPException, status
 
-from typing import List
-
-from fastapi.encoders import jsonable_encoder
+from datetime import datetime
+from typing import List, Optional
 
 import api.core.util.config as cfg
 from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import StreamingResponse
 
 from api.core.db.models.evidence import BasicEvidenceModel
-from api.core.db.mongodb_utils import MongoDBHelper
+from api.core.db.storage import Storage
+from api.core.db.mongodb_utils import MongoDBHelper, read_preference
+from api.core.services.collection.evidence_format import decode_evidence_batch, to_evidence_documents
+from api.core.services.collection.consumed_items import consumed_items
+from api.core.services.collection.evidence_buffer import evidence_buffer, EvidenceBufferFull
+from api.core.services.collection.export import stream_page, timestamp_range
+from api.core.services.collection.item_codes import item_codes, load_item_codes
+from api.core.services.collection.session_buffer import session_buffer
+from api.core.services.collection.variants import load_parent_ids
 
 logger = logging.getLogger(__name__)
 
 
 class EvidencePipeline:
-    """Class to provide evidence from collection to builders."""
+    """Class to provide evidence from collection to builders.
+
+    Attributes: #noqa
+        use_rollup (bool): Read pre-aggregated rollups (one row per user, item and evidence name) instead of raw
+            evidence.
+        collapse_variants (bool): Replace variant items by their parent item (see `variants`), i.e. builders compute
+            relations of parent items from the evidence of all their variants.
+    """
 
-    def __init__(self):
-        pass
+    def __init__(self, use_rollup: bool = cfg.EVIDENCE_PIPELINE_USE_ROLLUP,
+                 collapse_variants: bool = cfg.BUILDER_COLLAPSE_VARIANTS):
+        self.use_rollup = use_rollup
+        self.collapse_variants = collapse_variants
+
+    def get_evidence(self):
+        return self.get_rollup_evidence() if self.use_rollup else self.get_raw_evidence()
 
     def get_raw_evidence(self):
+        """Returns evidence with item codes in builder column `item_id` (evidence of items without code is dropped)."""
+        import pandas as pd  # builder dependency, not imported by serving workers
         with MongoDBHelper(cfg.DB_NAME) as db:
-            return pd.DataFrame(
+            df = pd.DataFrame(
                 list(
-                    db[cfg.COLLECTION_NAME_EVIDENCE].find({}, {'_id': False})
+                    self._collection(db, cfg.COLLECTION_NAME_EVIDENCE).find({}, {'_id': False})
                 ))
-
-
-async def get_all_evidence(conn: AsyncIOMotorClient) -> List[BasicEvidenceModel]:
-    """Returns all objects from evidence collection.
-
-    Method will throw an error when object different to BasicEvidenceModel are persisted in item collection.
-
+            codes = load_item_codes(db)
+            parents = load_parent_ids(db) if self.collapse_variants else {}
+        return encode_item_ids(df, codes, parents)
+
+    def get_rollup_evidence(self):
+        """Returns rollups with user identifier and item code in builder columns (user_uid -> user_id, item_code ->
+        item_id)."""
+        import pandas as pd
+        with MongoDBHelper(cfg.DB_NAME) as db:
+            df = pd.DataFrame(
+                list(
+                    self._collection(db, cfg.COLLECTION_NAME_EVIDENCE_ROLLUP).find({}, {'_id': False})
+                ))
+            parents = load_parent_ids(db) if self.collapse_variants else {}
+            codes = load_item_codes(db) if parents else {}
+        df = df.rename(columns={cfg.COLUMN_USER_UID: cfg.COLUMN_USER_ID, cfg.COLUMN_ITEM_CODE: cfg.COLUMN_ITEM_ID})
+        return collapse_item_codes(df, codes, parents)
+
+    @staticmethod
+    def _collection(db, name: str):
+        """Collection with builder read preference (`DB_READ_PREFERENCE_BUILDER`)."""
+        return db.get_collection(name, read_preference=read_preference(cfg.DB_READ_PREFERENCE_BUILDER))
+
+
+def encode_item_ids(df, codes: dict, parents: dict = None):
+    """Replaces item ids of evidence data frame by their codes (int32), variants by the code of their parent
+    (`parents`), rows of unknown items are dropped."""
+    if cfg.COLUMN_ITEM_ID not in df:
+        return df
+    item_ids = df[cfg.COLUMN_ITEM_ID].astype(str)
+    if parents:
+        item_ids = item_ids.map(parents).fillna(item_ids)
+    mapped = item_ids.map(codes)
+    df = df[mapped.notna()].copy()
+    df[cfg.COLUMN_ITEM_ID] = mapped[mapped.notna()].astype('int32')
+    return df.drop(columns=cfg.COLUMN_ITEM_CODE, errors='ignore')
+
+
+def collapse_item_codes(df, codes: dict, parents: dict):
+    """Replaces item codes of variants by the code of their parent (rollup data frame with codes in column item_id)."""
+    mapping = {codes[variant]: codes[parent] for variant, parent in parents.items()
+               if variant in codes and parent in codes}
+    if not mapping or cfg.COLUMN_ITEM_ID not in df:
+        return df
+    df = df.copy()
+    df[cfg.COLUMN_ITEM_ID] = df[cfg.COLUMN_ITEM_ID].map(mapping).fillna(df[cfg.COLUMN_ITEM_ID]).astype('int32')
+    return df
+
+
+async def get_all_evidence(conn: AsyncIOMotorClient,
+                           after: Optional[str] = None,
+                           limit: Optional[int] = None,
+                           fields: Optional[str] = None,
+                           start: Optional[datetime] = None,
+                           end: Optional[datetime] = None) -> StreamingResponse:
+    """Streams evidence objects as NDJSON (keyset paginated by `_id`).
+
+    Args:
+        conn (AsyncIOMotorClient): Session object used for retrieving evidence from db.
+        after (str, optional): `_id` of last evidence object of previous page.
+        limit (int, optional): Maximum number of returned evidence objects.
+        fields (str, optional): Comma separated list of returned attributes.
+        start (datetime, optional): Only evidence with timestamp >= start.
+        end (datetime, optional): Only evidence with timestamp < end.
     Returns:
-        List[BasicEvidenceModel]: Complete list of evidence entries in item collection.
+        StreamingResponse: NDJSON stream of evidence objects.
     """
-    cursor = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE].find()
-    evidence = await cursor.to_list(None)
-    return evidence
-
-
-async def get_evidence_for_user(conn: AsyncIOMotorClient, user_uid: str) -> List[BasicEvidenceModel]:
-    res = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE].find(filter={'user_uid': user_uid})
-    return await res.to_list(None)
-
-
-async def process_evidence(req: Request, object_list: List[BasicEvidenceModel]) -> List[BasicEvidenceModel]:
-    """Adds user UID to evidence objects."""
-    return [BasicEvidenceModel(**o.dict(skip_defaults=True), user_uid=req.headers.get(cfg.RECO_USER_UID)) for o in
-            object_list]
-
-
-async def create_evidence(conn: AsyncIOMotorClient, evidence_list: List[BasicEvidenceModel]) -> int:
-    """Inserts list of evidence objects to db."""
-    t = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE]
-    res = await t.insert_many([jsonable_encoder(e, exclude_none=True) for e in evidence_list])
-    return len(res.inserted_ids)
-
-
-async def delete_evidence(conn: AsyncIOMotorClient, user_uid: str):
-    res = await conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE].delete_many(filter={'user_uid': user_uid})
-    return res.deleted_count
+    return stream_page(conn[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE], timestamp_range(start, end), after, limit,
+                       fields)
+
+
+async def get_evidence_for_user(storage: Storage, user_uid: str) -> List[BasicEvidenceModel]:
+    return await storage.evidence.find_by_user(user_uid)
+
+
+async def process_evidence(req: Request) -> List[dict]:
+    """Decodes evidence batch from request body (JSON, NDJSON or msgpack, optionally gzip compressed) and returns
+    evidence documents with user UID (from request header)."""
+    objects = decode_evidence_batch(await req.body(), req.headers.get('content-type'),
+                                    req.headers.get('content-encoding'))
+    return to_evidence_documents(objects, user_uid=req.headers.get(cfg.RECO_USER_UID))
+
+
+async def create_evidence(storage: Storage, documents: List[dict]) -> int:
+    """Inserts list of evidence documents to db. When the evidence buffer is running, documents are only enqueued (and
+    persisted write-behind), a full buffer is answered with HTTP 429. Documents get the item code of their item (rollups
+    are keyed by code), unknown items get no code, ingestion does not write the item dictionary. Accepted item
+    interactions are added to the session buffer and consumed items."""
+    if not documents:
+        return 0
+    await item_codes.add_codes(storage, documents, field=cfg.COLUMN_ITEM_ID, assign=False)
+    if evidence_buffer.running:
+        try:
+            res = await evidence_buffer.put(documents)
+        except EvidenceBufferFull as e:
+            logger.warning(f"Rejected {len(documents)} evidence objects: {e}")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Evidence buffer is full, retry later",
+                                headers={"Retry-After": str(max(1, round(evidence_buffer.flush_interval)))})
+    else:
+        res = await storage.evidence.insert_many(documents)
+    session_buffer.add(documents)
+    if cfg.RECO_EXCLUDE_ENABLED:
+        consumed_items.add(documents)
+    return res
+
+
+async def delete_evidence(storage: Storage, user_uid: str):
+    session_buffer.clear(user_uid)
+    consumed_items.clear(user_uid)
+    return await storage.evidence.delete_by_user(user_uid)
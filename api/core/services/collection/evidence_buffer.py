@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from collections import deque
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import api.core.util.config as cfg
+from api.core.db.mongodb import db
+from api.core.services.collection.rollup import update_rollups, create_rollup_index
+from api.core.util.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+
+class EvidenceBufferFull(Exception):
+    """Raised when evidence cannot be enqueued within the put timeout (buffer is at max_size)."""
+
+
+class EvidenceBuffer:
+    """Write-behind buffer that accumulates evidence documents across requests.
+
+    Tracking calls enqueue already encoded evidence documents and return immediately. A background task drains the
+    bounded buffer with unordered bulk inserts whenever `flush_size` documents are pending or `flush_interval` seconds
+    have passed. When the buffer holds `max_size` documents callers wait up to `put_timeout` seconds for space before
+    `EvidenceBufferFull` is raised (backpressure). If a rollup collection is given, rollups are updated for every
+    persisted batch.
+
+    Attributes: #noqa
+        max_size (int): Maximum number of pending documents.
+        flush_size (int): Number of pending documents that triggers a flush (also max. documents per insert).
+        flush_interval (float): Maximum seconds between two flushes.
+        put_timeout (float): Seconds a caller waits for free space before the buffer rejects evidence.
+    """
+
+    def __init__(self,
+                 max_size: int = cfg.EVIDENCE_BUFFER_MAX_SIZE,
+                 flush_size: int = cfg.EVIDENCE_BUFFER_FLUSH_SIZE,
+                 flush_interval: float = cfg.EVIDENCE_BUFFER_FLUSH_INTERVAL,
+                 put_timeout: float = cfg.EVIDENCE_BUFFER_PUT_TIMEOUT):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.collection: Optional[AsyncIOMotorCollection] = None
+        self.rollup_collection: Optional[AsyncIOMotorCollection] = None
+        self._pending: deque = deque()
+        self._space: Optional[asyncio.Condition] = None
+        self._flush_needed: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def depth(self) -> int:
+        """Returns number of pending (acknowledged but not yet persisted) documents."""
+        return len(self._pending)
+
+    async def start(self, collection: AsyncIOMotorCollection,
+                    rollup_collection: Optional[AsyncIOMotorCollection] = None):
+        """Starts background flushing into `collection`. Must be called from within the running event loop."""
+        self.collection = collection
+        self.rollup_collection = rollup_collection
+        self._space = asyncio.Condition()
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops background flushing and persists all pending documents."""
+        if self._task is None:
+            return
+        self._stopping = True  # let a running flush finish instead of cancelling it mid-insert
+        self._flush_needed.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Evidence buffer stopped with {len(self._pending)} documents that could not be persisted")
+
+    async def put(self, documents: List[dict]) -> int:
+        """Enqueues documents and returns number of accepted documents. Either all or none are accepted."""
+        if len(documents) > self.max_size:
+            raise EvidenceBufferFull(f"Batch of {len(documents)} documents exceeds buffer size {self.max_size}")
+        async with self._space:
+            try:
+                await asyncio.wait_for(
+                    self._space.wait_for(lambda: self.max_size - len(self._pending) >= len(documents)),
+                    self.put_timeout)
+            except asyncio.TimeoutError:
+                raise EvidenceBufferFull(f"Evidence buffer full ({len(self._pending)} pending documents)")
+            self._pending.extend(documents)
+        if len(self._pending) >= self.flush_size:
+            self._flush_needed.set()
+        return len(documents)
+
+    async def flush(self):
+        """Persists pending documents in batches of `flush_size`. Documents of a failed batch are re-queued."""
+        if self._flush_lock is None:  # buffer never started
+            return
+        async with self._flush_lock:
+            while self._pending:
+                async with self._space:
+                    batch = [self._pending.popleft() for _ in range(min(self.flush_size, len(self._pending)))]
+                    self._space.notify_all()
+                if not await self._persist(batch):
+                    async with self._space:
+                        self._pending.extendleft(reversed(batch))
+                    break
+
+    async def _persist(self, batch: List[dict]) -> bool:
+        """Inserts batch unordered, returns False when batch should be retried. Since insert_many assigns `_id`
+        to the documents client side, a retried batch does not create duplicates."""
+        persisted = batch
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]  # 11000: dup key
+            if errors:
+                logger.error(f"Dropped {len(errors)} evidence documents on bulk insert: {errors[0].get('errmsg')}")
+                dropped = {err['index'] for err in errors}
+                persisted = [d for i, d in enumerate(batch) if i not in dropped]
+        except PyMongoError as e:
+            logger.error(f"Flushing {len(batch)} evidence documents failed, retry on next flush: {e}")
+            return False
+        if self.rollup_collection is not None:
+            try:
+                await update_rollups(self.rollup_collection, persisted)
+            except PyMongoError as e:
+                logger.error(f"Updating rollups for {len(persisted)} evidence documents failed: {e}")
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            if self._stopping:
+                return
+            try:
+                await self.flush()
+            except Exception as e:  # keep flushing task alive
+                logger.exception(f"Unexpected error while flushing evidence buffer: {e}")
+
+
+evidence_buffer = EvidenceBuffer()
+
+Gauge("evidence_buffer_depth", "Number of acknowledged evidence documents not yet persisted.",
+      function=evidence_buffer.depth)
+
+
+async def start_evidence_buffer():
+    if cfg.STORAGE_BACKEND != 'mongodb':  # memory storage inserts evidence directly
+        return
+    rollup_collection = None
+    if cfg.EVIDENCE_ROLLUP_ENABLED:
+        rollup_collection = db.client[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE_ROLLUP]
+        await create_rollup_index(rollup_collection)
+    if not cfg.EVIDENCE_BUFFER_ENABLED:
+        return
+    logger.info("start evidence buffer...")
+    await evidence_buffer.start(db.client[cfg.DB_NAME][cfg.COLLECTION_NAME_EVIDENCE], rollup_collection)
+
+
+async def stop_evidence_buffer():
+    logger.info("flush and stop evidence buffer...")
+    await evidence_buffer.stop()
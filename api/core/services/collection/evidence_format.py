@@ -0,0 +1,117 @@
+"""Decoding and fast validation of evidence batches.
+
+`PUT /col/evidence` accepts following request bodies (each optionally with `Content-Encoding: gzip`):
+
+- `application/json`: array of evidence objects
+- `application/x-ndjson`: one evidence object per line
+- `application/msgpack`: array of evidence maps or compact batch `{"keys": [...], "rows": [[...], ...]}` where every
+  row holds the values of `keys` (attribute names are sent only once per batch)
+
+Instead of constructing a `BasicEvidenceModel` per object, only declared fields are checked and objects are turned
+into documents that can be inserted directly (the same documents `jsonable_encoder(BasicEvidenceModel)` would return).
+"""
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import msgpack
+from fastapi import HTTPException, status
+from pydantic.datetime_parse import parse_datetime
+
+import api.core.util.config as cfg
+from api.core.util.ndjson import MEDIA_TYPE_NDJSON, is_gzip
+
+MEDIA_TYPES_MSGPACK = ("application/msgpack", "application/x-msgpack")
+
+OPTIONAL_STR_FIELDS = (cfg.COLUMN_USER_UID, cfg.COLUMN_ITEM_ID, 'path')
+
+EVIDENCE_REQUEST_BODY = {'requestBody': {'required': True, 'content': {
+    'application/json': {'schema': {'type': 'array', 'items': {'$ref': '#/components/schemas/BasicEvidenceModel'}}},
+    MEDIA_TYPE_NDJSON: {},
+    MEDIA_TYPES_MSGPACK[0]: {}
+}}}
+
+
+def decode_evidence_batch(body: bytes, content_type: Optional[str], content_encoding: Optional[str]) -> List:
+    """Decompresses and decodes request body according to content type, returns list of (unvalidated) objects."""
+    content_type = (content_type or 'application/json').split(';')[0].strip().lower()
+    if is_gzip(None, content_encoding):
+        body = _gunzip(body)
+    try:
+        if content_type in MEDIA_TYPES_MSGPACK:
+            objects = msgpack.unpackb(body, raw=False, timestamp=3)
+            if isinstance(objects, dict):
+                keys = objects.get('keys')
+                objects = [dict(zip(keys, row)) for row in objects.get('rows', [])]
+        elif content_type == MEDIA_TYPE_NDJSON:
+            objects = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            objects = json.loads(body)
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not decode evidence batch: {e}")
+    if not isinstance(objects, list):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=[_error((), "value is not a valid list", "type_error.list")])
+    return objects
+
+
+def to_evidence_documents(objects: List, user_uid: Optional[str] = None) -> List[dict]:
+    """Validates declared fields of BasicEvidenceModel and returns insertable documents. Additional attributes are
+    kept untouched (Extra.allow). `user_uid` (from request header) overrides the user of the objects.
+
+    Raises:
+        HTTPException: 422 with pydantic like error details when an object is invalid.
+    """
+    now = datetime.utcnow().isoformat()
+    documents = []
+    errors = []
+    for i, o in enumerate(objects):
+        if not isinstance(o, dict):
+            errors.append(_error((i,), "value is not a valid dict", "type_error.dict"))
+            continue
+        doc = {k: v for k, v in o.items() if v is not None}
+        if not isinstance(doc.get(cfg.COLUMN_NAME), str):
+            errors.append(_error((i, cfg.COLUMN_NAME), "field required or not a valid string", "type_error.str"))
+            continue
+        invalid = [f for f in OPTIONAL_STR_FIELDS if f in doc and not isinstance(doc[f], (str, int))]
+        if invalid:
+            errors.append(_error((i, invalid[0]), "str type expected", "type_error.str"))
+            continue
+        for f in OPTIONAL_STR_FIELDS:
+            if isinstance(doc.get(f), int):
+                doc[f] = str(doc[f])
+        if user_uid is not None:
+            doc[cfg.COLUMN_USER_UID] = user_uid
+        try:
+            doc['timestamp'] = _as_utc_iso(doc['timestamp']) if 'timestamp' in doc else now
+        except (ValueError, TypeError):
+            errors.append(_error((i, 'timestamp'), "invalid datetime format", "value_error.datetime"))
+            continue
+        documents.append(doc)
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    return documents
+
+
+def _as_utc_iso(value) -> str:
+    t = value if isinstance(value, datetime) else parse_datetime(value)
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t.isoformat()
+
+
+def _gunzip(body: bytes) -> bytes:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, cfg.EVIDENCE_MAX_BATCH_BYTES)
+    except zlib.error as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid gzip body: {e}")
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Decompressed evidence batch exceeds {cfg.EVIDENCE_MAX_BATCH_BYTES} bytes")
+    return data
+
+
+def _error(loc: tuple, msg: str, error_type: str) -> dict:
+    return {'loc': ('body',) + loc, 'msg': msg, 'type': error_type}
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from typing import Optional, List
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorCursor
+from pymongo import ASCENDING
+from starlette.responses import StreamingResponse
+
+import api.core.util.config as cfg
+from api.core.util.ndjson import stream_documents, MEDIA_TYPE_NDJSON
+
+
+def find_page(collection: AsyncIOMotorCollection,
+              query: dict = None,
+              after: Optional[str] = None,
+              limit: Optional[int] = None,
+              fields: Optional[List[str]] = None) -> AsyncIOMotorCursor:
+    """Returns cursor over documents ordered by `_id` (keyset pagination).
+
+    Args:
+        collection (AsyncIOMotorCollection): Collection to page through.
+        query (dict): Additional filter.
+        after (str, optional): Pagination token, i.e. `_id` of the last document of the previous page.
+        limit (int, optional): Page size, all (remaining) documents are returned when not set.
+        fields (List[str], optional): Projection, `_id` is always returned.
+    Returns:
+        AsyncIOMotorCursor: Cursor that fetches documents in batches of EXPORT_BATCH_SIZE.
+    """
+    query = dict(query or {})
+    if after is not None:
+        try:
+            query['_id'] = {'$gt': ObjectId(after)}
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid pagination token {after}")
+    projection = {f: True for f in fields} if fields else None
+    cursor = collection.find(query, projection).sort('_id', ASCENDING).batch_size(cfg.EXPORT_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def stream_page(collection: AsyncIOMotorCollection,
+                query: dict = None,
+                after: Optional[str] = None,
+                limit: Optional[int] = None,
+                fields: Optional[str] = None) -> StreamingResponse:
+    """Streams a page of documents as NDJSON. `fields` is a comma separated list of attributes. To fetch the next
+    page pass `_id` of the last line as `after`."""
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    return StreamingResponse(stream_documents(find_page(collection, query, after, limit, fields)),
+                             media_type=MEDIA_TYPE_NDJSON)
+
+
+def timestamp_range(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Filter for evidence `timestamp` (persisted as naive UTC ISO string) in [start, end)."""
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = _as_utc_iso(start)
+    if end is not None:
+        bounds['$lt'] = _as_utc_iso(end)
+    return {'timestamp': bounds} if bounds else {}
+
+
+def _as_utc_iso(t: datetime) -> str:
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t.isoformat()
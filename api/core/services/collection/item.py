@@ -1,35 +1,118 @@
-from typing import List
+import asyncio
+import json
+import logging
+from typing import List, AsyncIterator, Optional
 
 from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorClient
-from starlette.responses import JSONResponse
+from pydantic import ValidationError
+from starlette.responses import JSONResponse, StreamingResponse
 from fastapi import status
 import api.core.util.config as cfg
 from api.core.db.models.item import BasicItemModel
+from api.core.db.storage import Storage
+from api.core.services.collection.content_index import content_index
+from api.core.services.collection.export import stream_page
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.collection.variants import variants
+from api.core.services.reco.http_cache import response_versions
+from api.core.util.ndjson import iter_lines
 
+logger = logging.getLogger(__name__)
 
-async def get_all_items(conn: AsyncIOMotorClient) -> List[BasicItemModel]:
-    """Returns list of all BasicItemModels from item collection."""
-    cursor = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM].find()
-    items = await cursor.to_list(None)
-    return items
+N_IMPORT_ERRORS_REPORTED = 10
 
 
-async def get_item_by_item_id(conn: AsyncIOMotorClient, item_id: str) -> BasicItemModel:
-    doc = await conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM].find_one(filter={'id': item_id})
+async def get_all_items(conn: AsyncIOMotorClient,
+                        after: Optional[str] = None,
+                        limit: Optional[int] = None,
+                        fields: Optional[str] = None) -> StreamingResponse:
+    """Streams items from item collection as NDJSON (keyset paginated by `_id`, see `stream_page`)."""
+    return stream_page(conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM], after=after, limit=limit, fields=fields)
+
+
+async def get_item_by_item_id(storage: Storage, item_id: str) -> BasicItemModel:
+    doc = await storage.items.find_by_id(item_id)
     return BasicItemModel(**doc)
 
 
-async def create_or_update_items(conn: AsyncIOMotorClient, item_models: List[BasicItemModel]):
-    """Inserts or updates an existing (match by uid) item object to db."""
-    t = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM]
-    for item_model in item_models:
-        entry_req = jsonable_encoder(item_model, exclude_none=True)
-        await t.find_one_and_update({'id': item_model.id, 'type': item_model.type}, {"$set": entry_req},
-                                    upsert=True)
-    return JSONResponse(status_code=status.HTTP_201_CREATED)
+async def create_or_update_items(storage: Storage, item_models: List[BasicItemModel]):
+    """Inserts or updates existing (match by id and type) item objects to db in chunked bulk writes."""
+    documents = [jsonable_encoder(item_model, exclude_none=True) for item_model in item_models]
+    semaphore = asyncio.Semaphore(cfg.ITEM_BULK_CONCURRENCY)
+    results = await asyncio.gather(*[upsert_item_chunk(storage, documents[i:i + cfg.ITEM_BULK_CHUNK_SIZE], semaphore)
+                                     for i in range(0, len(documents), cfg.ITEM_BULK_CHUNK_SIZE)])
+    return JSONResponse(content=sum_upsert_results(results), status_code=status.HTTP_201_CREATED)
+
+
+async def import_items(storage: Storage, chunks: AsyncIterator[bytes], gzip: bool = False) -> dict:
+    """Streams NDJSON (one BasicItemModel per line) into item collection.
+
+    Lines are parsed and validated incrementally and upserted in chunks of ITEM_BULK_CHUNK_SIZE with at most
+    ITEM_BULK_CONCURRENCY chunks in flight, i.e. the import never holds the complete catalog in memory.
+
+    Returns:
+        dict: Number of inserted, updated and failed items and (the first) errors by line number.
+    """
+    semaphore = asyncio.Semaphore(cfg.ITEM_BULK_CONCURRENCY)
+    pending = set()
+    results = []
+    invalid = {'failed': 0, 'errors': []}
+    chunk = []
+    line_no = 0
+
+    async def schedule(documents):
+        if len(pending) >= cfg.ITEM_BULK_CONCURRENCY:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.remove(task)
+                results.append(task.result())
+        pending.add(asyncio.ensure_future(upsert_item_chunk(storage, documents, semaphore)))
+
+    async for line in iter_lines(chunks, gzip=gzip):
+        line_no += 1
+        try:
+            chunk.append(jsonable_encoder(BasicItemModel(**json.loads(line)), exclude_none=True))
+        except (ValueError, TypeError, ValidationError) as e:  # JSONDecodeError is a ValueError
+            invalid['failed'] += 1
+            if len(invalid['errors']) < N_IMPORT_ERRORS_REPORTED:
+                invalid['errors'].append({'line': line_no, 'error': str(e)})
+            continue
+        if len(chunk) >= cfg.ITEM_BULK_CHUNK_SIZE:
+            await schedule(chunk)
+            chunk = []
+    if chunk:
+        await schedule(chunk)
+    results.extend(await asyncio.gather(*pending))
+
+    res = sum_upsert_results(results)
+    res['failed'] += invalid['failed']
+    res['errors'] = invalid['errors']
+    logger.info(f"Item import finished after {line_no} lines: {res['inserted']} inserted, {res['updated']} updated, "
+                f"{res['failed']} failed")
+    return res
+
+
+async def upsert_item_chunk(storage: Storage, documents: List[dict], semaphore: asyncio.Semaphore) -> dict:
+    """Upserts encoded items (match by id and type) with their item codes (new items and parents of variants get new
+    codes), MongoDB storage uses a single unordered bulk write. The variant map and content-based relations of new or
+    changed items are updated afterwards (with CB_INCREMENTAL_ENABLED)."""
+    async with semaphore:
+        await item_codes.add_codes(storage, documents)
+        await item_codes.assign(storage, variants.parent_ids(documents))  # evidence of variants is built per parent
+        res = await storage.items.upsert_many(documents)
+    variants.update(documents)
+    await content_index.update(storage, documents)
+    response_versions.touch()
+    return res
+
+
+def sum_upsert_results(results: List[dict]) -> dict:
+    return {k: sum(r[k] for r in results) for k in ('inserted', 'updated', 'failed')}
 
 
-async def delete_items_by_item_id(conn: AsyncIOMotorClient, item_id: str) -> int:
-    res = await conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM].delete_many(filter={'id': item_id})
-    return res.deleted_count
+async def delete_items_by_item_id(storage: Storage, item_id: str) -> int:
+    res = await storage.items.delete_by_id(item_id)
+    variants.remove(item_id)
+    response_versions.touch()
+    return res
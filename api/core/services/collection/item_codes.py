@@ -0,0 +1,161 @@
+"""Item id dictionary: dense integer codes of item ids.
+
+Relations, user recommendations and evidence rollups reference items by code, items and (new) evidence carry their
+`item_code`. Codes are assigned when items are upserted and are never reassigned, the dictionary is stored in
+collection `item_code` (`_id` is the code, `id` the item id). Evidence of items without code (not upserted yet) is
+stored without code, it is not part of rollups (see `backfill_rollups`). Item ids are translated at
+the edges only: seed items of requests are encoded, recommended items are joined by code.
+
+Existing data (items, relations, user recommendations and rollups with item ids) is migrated with
+
+    python -m api.core.services.collection.item_codes
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+
+import api.core.util.config as cfg
+from api.core.db.mongodb_utils import MongoDBHelper
+from api.core.db.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+ASSIGN_ATTEMPTS = 5
+
+
+class ItemCodes:
+    """Cache of the item id dictionary of the serving process, entries are read from storage on first use and
+    assigned on demand (concurrent assignments of other processes are detected by the unique indexes and retried).
+    The cache belongs to one storage, it is cleared when used with another storage."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.ids: Dict[int, str] = {}
+        self._storage: Optional[Storage] = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _use(self, storage: Storage):
+        if storage is not self._storage:
+            self.codes, self.ids, self._storage = {}, {}, storage
+
+    def add(self, documents: Iterable[dict]):
+        for d in documents:
+            self.codes[d['id']] = d['_id']
+            self.ids[d['_id']] = d['id']
+
+    async def encode(self, storage: Storage, item_ids: List[str]) -> List[Optional[int]]:
+        """Returns codes of item ids, None for unknown ids."""
+        self._use(storage)
+        missing = [i for i in set(item_ids) if i not in self.codes]
+        if missing:
+            self.add(await storage.item_codes.find_by_ids(missing))
+        return [self.codes.get(i) for i in item_ids]
+
+    async def assign(self, storage: Storage, item_ids: List[str]) -> List[int]:
+        """Returns codes of item ids, unknown ids get the next free codes."""
+        missing = [i for i, code in zip(item_ids, await self.encode(storage, item_ids)) if code is None]
+        for _ in range(ASSIGN_ATTEMPTS):
+            missing = list(dict.fromkeys(i for i in missing if i not in self.codes))
+            if not missing:
+                break
+            start = await storage.item_codes.next_code()
+            self.add(await storage.item_codes.insert_many([{'_id': start + n, 'id': i} for n, i in enumerate(missing)]))
+            await self.encode(storage, missing)  # ids assigned concurrently by other processes
+        else:
+            raise RuntimeError(f"Could not assign codes to {len(missing)} items after {ASSIGN_ATTEMPTS} attempts")
+        return [self.codes[i] for i in item_ids]
+
+    async def decode(self, storage: Storage, item_codes: List[int]) -> List[Optional[str]]:
+        """Returns item ids of codes, None for unknown codes."""
+        self._use(storage)
+        missing = [c for c in set(item_codes) if c not in self.ids]
+        if missing:
+            self.add(await storage.item_codes.find_by_codes(missing))
+        return [self.ids.get(c) for c in item_codes]
+
+    async def add_codes(self, storage: Storage, documents: List[dict], field: str = 'id',
+                        assign: bool = True) -> List[dict]:
+        """Sets `item_code` of documents (item id in `field`, documents without are skipped), returns documents.
+        Without `assign`, documents of unknown item ids get no code (no dictionary writes)."""
+        with_id = [d for d in documents if d.get(field) is not None]
+        item_ids = [str(d[field]) for d in with_id]
+        codes = await (self.assign(storage, item_ids) if assign else self.encode(storage, item_ids))
+        for d, code in zip(with_id, codes):
+            if code is not None:
+                d[cfg.COLUMN_ITEM_CODE] = code
+        return documents
+
+
+item_codes = ItemCodes()
+
+
+def load_item_codes(db) -> Dict[str, int]:
+    """Returns the complete dictionary (item id -> code) for builders (synchronous database)."""
+    return {d['id']: d['_id'] for d in db[cfg.COLLECTION_NAME_ITEM_CODE].find()}
+
+
+def migrate(batch_size: int = 10000) -> int:
+    """Assigns codes to all item ids of items and evidence, sets `item_code` of items, replaces item ids of relations
+    and user recommendations by codes and rebuilds evidence rollups. Returns number of dictionary entries.
+
+    Run during a maintenance window (builds and ingestion stopped), relations with item ids are not served after
+    the serving processes are updated.
+    """
+    from api.core.services.collection.rollup import backfill_rollups
+    with MongoDBHelper(cfg.DB_NAME) as db:
+        dictionary = db[cfg.COLLECTION_NAME_ITEM_CODE]
+        dictionary.create_index('id', unique=True)
+        codes = load_item_codes(db)
+        item_ids = db[cfg.COLLECTION_NAME_ITEM].distinct('id') + db[cfg.COLLECTION_NAME_EVIDENCE].distinct(
+            cfg.COLUMN_ITEM_ID)
+        new = sorted({str(i) for i in item_ids if i is not None} - set(codes))
+        start = max(codes.values(), default=-1) + 1
+        for offset in range(0, len(new), batch_size):
+            dictionary.insert_many([{'_id': start + offset + n, 'id': i}
+                                    for n, i in enumerate(new[offset:offset + batch_size])])
+        codes.update({i: start + n for n, i in enumerate(new)})
+        logger.info(f"assigned {len(new)} new codes, dictionary contains {len(codes)} entries")
+
+        items = db[cfg.COLLECTION_NAME_ITEM]
+        _bulk(items, (UpdateOne({'_id': d['_id']}, {'$set': {cfg.COLUMN_ITEM_CODE: codes[str(d['id'])]}})
+                      for d in items.find({}, {'id': 1})), batch_size)
+        items.create_index([(cfg.COLUMN_ITEM_CODE, ASCENDING)])
+
+        relations = db[cfg.COLLECTION_NAME_RELATIONS]
+        _bulk(relations, (_encode_relation(d, codes) for d in relations.find(
+            {'$or': [{'item_id_seed': {'$type': 'string'}, 'base': 'item'},
+                     {'item_id_recommended': {'$type': 'string'}}]},
+            {'item_id_seed': 1, 'item_id_recommended': 1, 'base': 1})), batch_size)
+        user_recommendations = db[cfg.COLLECTION_NAME_USER_RECOMMENDATION]
+        _bulk(user_recommendations, (UpdateOne({'_id': d['_id']}, {'$set': {
+            'item_ids': [codes.get(str(i), i) for i in d['item_ids']]}})
+            for d in user_recommendations.find({'item_ids': {'$type': 'string'}}, {'item_ids': 1})), batch_size)
+    backfill_rollups(drop=True)
+    return len(codes)
+
+
+def _encode_relation(document: dict, codes: Dict[str, int]) -> UpdateOne:
+    update = {'item_id_recommended': codes.get(str(document['item_id_recommended']), document['item_id_recommended'])}
+    if document.get('base') == 'item':
+        update['item_id_seed'] = codes.get(str(document['item_id_seed']), document['item_id_seed'])
+    return UpdateOne({'_id': document['_id']}, {'$set': update})
+
+
+def _bulk(collection, operations: Iterable[UpdateOne], batch_size: int):
+    batch = []
+    for operation in operations:
+        batch.append(operation)
+        if len(batch) >= batch_size:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"migrate item ids to item codes in database [{cfg.DB_NAME}] ...")
+    logger.info(f"migration finished, dictionary contains {migrate()} entries")
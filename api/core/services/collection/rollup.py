@@ -0,0 +1,107 @@
+"""Evidence rollups: per (user_uid, item_code, name) counts with first and last timestamp.
+
+Rollups are maintained incrementally with batched `$inc` upserts whenever evidence is persisted. Existing evidence is
+backfilled with the migration command
+
+    python -m api.core.services.collection.rollup [--drop]
+"""
+import argparse
+import logging
+from typing import List
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, UpdateOne
+
+import api.core.util.config as cfg
+from api.core.db.mongodb_utils import MongoDBHelper
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY = [cfg.COLUMN_USER_UID, cfg.COLUMN_ITEM_CODE, cfg.COLUMN_NAME]
+EVIDENCE_KEY = [cfg.COLUMN_USER_UID, cfg.COLUMN_ITEM_ID, cfg.COLUMN_NAME]
+
+
+def build_rollup_updates(documents: List[dict]) -> List[UpdateOne]:
+    """Aggregates evidence documents by rollup key and returns one upsert per key. Documents without user or item
+    code are skipped."""
+    rollups = {}
+    for d in documents:
+        key = tuple(d.get(k) for k in ROLLUP_KEY)
+        if None in key:
+            continue
+        ts = d.get('timestamp')
+        r = rollups.get(key)
+        if r is None:
+            rollups[key] = [1, ts, ts]
+        else:
+            r[0] += 1
+            if ts is not None:
+                r[1] = ts if r[1] is None else min(r[1], ts)
+                r[2] = ts if r[2] is None else max(r[2], ts)
+    updates = []
+    for key, (count, first, last) in rollups.items():
+        update = {'$inc': {cfg.COLUMN_COUNT: count}}
+        if first is not None:
+            update['$min'] = {cfg.COLUMN_FIRST_TIMESTAMP: first}
+            update['$max'] = {cfg.COLUMN_LAST_TIMESTAMP: last}
+        updates.append(UpdateOne(dict(zip(ROLLUP_KEY, key)), update, upsert=True))
+    return updates
+
+
+async def update_rollups(collection: AsyncIOMotorCollection, documents: List[dict]) -> int:
+    """Applies persisted evidence documents to rollup collection, returns number of touched rollups."""
+    updates = build_rollup_updates(documents)
+    if not updates:
+        return 0
+    await collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+async def create_rollup_index(collection: AsyncIOMotorCollection):
+    """Unique rollup key index (required for concurrent upserts and the backfill `$merge`)."""
+    await collection.create_index([(k, ASCENDING) for k in ROLLUP_KEY], unique=True)
+
+
+def backfill_rollups(drop: bool = False) -> int:
+    """Recomputes rollups from the complete evidence collection (server side) and returns number of rollups.
+
+    Rollups of keys present in evidence are replaced, i.e. run the backfill before ingestion updates rollups
+    (or with `drop=True` during a maintenance window) to avoid counting evidence twice. Evidence is grouped by item id
+    (evidence of older versions has no item code), item codes are looked up in the item id dictionary per group.
+    """
+    with MongoDBHelper(cfg.DB_NAME) as db:
+        rollup = db[cfg.COLLECTION_NAME_EVIDENCE_ROLLUP]
+        if drop:
+            rollup.drop()
+        rollup.create_index([(k, ASCENDING) for k in ROLLUP_KEY], unique=True)
+        db[cfg.COLLECTION_NAME_EVIDENCE].aggregate([
+            {'$match': {k: {'$exists': True, '$ne': None} for k in EVIDENCE_KEY}},
+            {'$group': {'_id': {k: f"${k}" for k in EVIDENCE_KEY},
+                        cfg.COLUMN_COUNT: {'$sum': 1},
+                        cfg.COLUMN_FIRST_TIMESTAMP: {'$min': '$timestamp'},
+                        cfg.COLUMN_LAST_TIMESTAMP: {'$max': '$timestamp'}}},
+            {'$lookup': {'from': cfg.COLLECTION_NAME_ITEM_CODE, 'localField': f"_id.{cfg.COLUMN_ITEM_ID}",
+                         'foreignField': 'id', 'as': 'code'}},
+            {'$match': {'code': {'$ne': []}}},
+            {'$replaceRoot': {'newRoot': {
+                cfg.COLUMN_USER_UID: f"$_id.{cfg.COLUMN_USER_UID}",
+                cfg.COLUMN_ITEM_CODE: {'$arrayElemAt': ['$code._id', 0]},
+                cfg.COLUMN_NAME: f"$_id.{cfg.COLUMN_NAME}",
+                cfg.COLUMN_COUNT: f"${cfg.COLUMN_COUNT}",
+                cfg.COLUMN_FIRST_TIMESTAMP: f"${cfg.COLUMN_FIRST_TIMESTAMP}",
+                cfg.COLUMN_LAST_TIMESTAMP: f"${cfg.COLUMN_LAST_TIMESTAMP}"}}},
+            {'$merge': {'into': cfg.COLLECTION_NAME_EVIDENCE_ROLLUP,
+                        'on': ROLLUP_KEY,
+                        'whenMatched': 'replace',
+                        'whenNotMatched': 'insert'}}
+        ], allowDiskUse=True)
+        return rollup.count_documents({})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill evidence rollups from evidence collection.")
+    parser.add_argument('--drop', action='store_true', help="drop rollup collection before backfill")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"backfill rollups in database [{cfg.DB_NAME}] ...")
+    logger.info(f"backfill finished, rollup collection contains {backfill_rollups(drop=args.drop)} entries")
@@ -0,0 +1,54 @@
+from collections import OrderedDict, deque
+from typing import Deque, List
+
+import api.core.util.config as cfg
+from api.core.util.metrics import Gauge
+
+
+class SessionBuffer:
+    """Recent item interactions per user, kept in memory of the serving process and fed by evidence ingestion.
+
+    Every user has a ring buffer of the last `size` item ids (oldest ids are dropped). At most `max_users` users are
+    kept, the least recently active user is evicted first. Evidence of a user served by another process (worker) is
+    not seen, i.e. session recommendations need a single worker or sticky routing by user.
+
+    Attributes: #noqa
+        size (int): Item interactions kept per user.
+        max_users (int): Maximum number of users.
+    """
+
+    def __init__(self, size: int = cfg.SESSION_BUFFER_SIZE, max_users: int = cfg.SESSION_MAX_USERS):
+        self.size = size
+        self.max_users = max_users
+        self._sessions: 'OrderedDict[str, Deque[str]]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add(self, documents: List[dict]):
+        """Appends item interactions of evidence documents (with user uid and item id) in order of `documents`."""
+        for d in documents:
+            user_uid, item_id = d.get(cfg.COLUMN_USER_UID), d.get(cfg.COLUMN_ITEM_ID)
+            if user_uid is None or item_id is None:
+                continue
+            session = self._sessions.get(user_uid)
+            if session is None:
+                session = self._sessions[user_uid] = deque(maxlen=self.size)
+                if len(self._sessions) > self.max_users:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(user_uid)
+            session.append(str(item_id))
+
+    def recent(self, user_uid: str) -> List[str]:
+        """Returns item ids of user's recent interactions, most recent first."""
+        session = self._sessions.get(user_uid)
+        return list(reversed(session)) if session else []
+
+    def clear(self, user_uid: str):
+        self._sessions.pop(user_uid, None)
+
+
+session_buffer = SessionBuffer()
+
+Gauge("session_buffer_users", "Number of users in session buffer.", function=lambda: len(session_buffer))
@@ -0,0 +1,94 @@
+"""Item variants: map of variant item id to parent item id, maintained from item metadata (`ITEM_PARENT_ATTRIBUTE`).
+
+Serving resolves seed items with the in-memory map (one dictionary lookup), builders collapse evidence of variants
+into their parent before building the matrices (see `EvidencePipeline`), so relations are computed and stored per
+parent item. Parents are not resolved further, i.e. variants of variants are not supported.
+"""
+import logging
+from typing import Dict, Iterable, List
+
+import api.core.util.config as cfg
+from api.core.db.storage import Storage, storage_holder
+from api.core.util.metrics import Gauge
+from api.core.util.refresher import PeriodicRefresher
+
+logger = logging.getLogger(__name__)
+
+
+class Variants(PeriodicRefresher):
+    """In-memory variant -> parent map of the serving process, updated with item upserts and deletions of this process
+    and refreshed periodically from storage in the background (changes of other processes).
+
+    Attributes: #noqa
+        attribute (str): Item attribute with the parent item id (empty disables variants).
+        refresh_interval (float): Seconds between refreshes.
+        parents (Dict[str, str]): Parent item id per variant item id.
+    """
+
+    def __init__(self, attribute: str = cfg.ITEM_PARENT_ATTRIBUTE,
+                 refresh_interval: float = cfg.VARIANT_REFRESH_INTERVAL):
+        super().__init__(refresh_interval)
+        self.attribute = attribute
+        self.parents: Dict[str, str] = {}
+
+    def __len__(self):
+        return len(self.parents)
+
+    def resolve(self, item_id: str) -> str:
+        """Returns parent item id of variants, other item ids unchanged."""
+        return self.parents.get(item_id, item_id)
+
+    def parent_ids(self, documents: Iterable[dict]) -> List[str]:
+        """Returns parent item ids of item documents."""
+        if not self.attribute:
+            return []
+        return [str(d[self.attribute]) for d in documents if d.get(self.attribute) is not None]
+
+    def update(self, documents: Iterable[dict]):
+        """Applies upserted item documents, documents without parent attribute keep their stored parent (upserts
+        only set given attributes)."""
+        if not self.attribute:
+            return
+        for d in documents:
+            if self.attribute not in d:
+                continue
+            item_id, parent = str(d['id']), d[self.attribute]
+            if parent is None or str(parent) == item_id:
+                self.parents.pop(item_id, None)
+            else:
+                self.parents[item_id] = str(parent)
+
+    def remove(self, item_id: str):
+        self.parents.pop(item_id, None)
+
+    async def refresh(self, storage: Storage):
+        self.parents = await storage.items.parent_ids(self.attribute) if self.attribute else {}
+
+    def failure_message(self) -> str:
+        return f"Refreshing item variants failed, keep {len(self.parents)} variants"
+
+
+variants = Variants()
+
+Gauge("reco_item_variants", "Number of variant items in the in-memory variant map.", function=lambda: len(variants))
+
+
+async def start_variants():
+    if not cfg.ITEM_PARENT_ATTRIBUTE:
+        return
+    logger.info("load item variants...")
+    await variants.start(storage_holder.storage)
+
+
+async def stop_variants():
+    await variants.stop()
+
+
+def load_parent_ids(db) -> Dict[str, str]:
+    """Returns parent item id per variant item id for builders (synchronous database)."""
+    if not cfg.ITEM_PARENT_ATTRIBUTE:
+        return {}
+    attribute = cfg.ITEM_PARENT_ATTRIBUTE
+    cursor = db[cfg.COLLECTION_NAME_ITEM].find({attribute: {'$exists': True, '$ne': None}},
+                                               {'_id': 0, 'id': 1, attribute: 1})
+    return {d['id']: str(d[attribute]) for d in cursor if str(d[attribute]) != d['id']}
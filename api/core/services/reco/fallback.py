@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+from fastapi import Response
+
+import api.core.util.config as cfg
+from api.core.db.models.item import BasicItemModel
+from api.core.db.storage import Storage, storage_holder
+from api.core.util.metrics import Counter, Gauge
+from api.core.util.refresher import PeriodicRefresher
+from api.core.util.tracing import span
+
+logger = logging.getLogger(__name__)
+
+BUDGET_OVERRUNS = Counter("reco_budget_overruns_total", "Number of recommendation requests that exceeded their latency "
+                                                        "budget and returned fallback items.", ["route"])
+
+
+class FallbackItems(PeriodicRefresher):
+    """In-memory list of fallback items (popular or latest), refreshed periodically in the background.
+
+    Popular items are the items with most evidence (MongoDB storage: from evidence rollups), padded with latest items.
+
+    Attributes: #noqa
+        size (int): Number of kept items.
+        refresh_interval (float): Seconds between refreshes.
+        source (str): `popular` or `latest`.
+        items (List[BasicItemModel]): Current fallback items (empty until first refresh).
+    """
+
+    def __init__(self,
+                 size: int = cfg.RECO_FALLBACK_SIZE,
+                 refresh_interval: float = cfg.RECO_FALLBACK_REFRESH_INTERVAL,
+                 source: str = cfg.RECO_FALLBACK_SOURCE):
+        if source not in (cfg.TYPE_POPULAR, cfg.TYPE_LATEST):
+            raise ValueError(f"Unknown fallback source {source}, choose from {[cfg.TYPE_POPULAR, cfg.TYPE_LATEST]}")
+        super().__init__(refresh_interval)
+        self.size = size
+        self.source = source
+        self.items: List[BasicItemModel] = []
+
+    def get(self, n_recos: int) -> List[BasicItemModel]:
+        return self.items[:n_recos]
+
+    async def refresh(self, storage: Storage):
+        items = []
+        if self.source == cfg.TYPE_POPULAR:
+            items = await storage.items.find_by_ids(await storage.evidence.popular_item_ids(self.size))
+        if len(items) < self.size:
+            ids = {i['id'] for i in items}
+            # fetch enough latest items to pad after dropping the popular ones
+            items += [i for i in await storage.items.latest(self.size) if i['id'] not in ids][:self.size - len(items)]
+        self.items = [BasicItemModel(**i) for i in items]
+
+    def failure_message(self) -> str:
+        return f"Refreshing fallback items failed, keep {len(self.items)} items"
+
+
+fallback_items = FallbackItems()
+
+Gauge("reco_fallback_items", "Number of in-memory fallback items.", function=lambda: len(fallback_items.items))
+
+
+async def start_fallback_items():
+    logger.info("load fallback items...")
+    await fallback_items.start(storage_holder.storage)
+
+
+async def stop_fallback_items():
+    await fallback_items.stop()
+
+
+async def with_budget(response: Response,
+                      route: str,
+                      budget_ms: float,
+                      n_recos: int,
+                      func: Callable[..., Awaitable[List[BasicItemModel]]],
+                      /, *args, **kwargs) -> List[BasicItemModel]:
+    """Awaits recommendation method `func` for at most `budget_ms` milliseconds. When the budget is exceeded the call
+    is cancelled and fallback items are returned, flagged by response header `X-Reco-Fallback` (value is the
+    fallback source). A budget of 0 disables the deadline.
+
+    Args:
+        response (Response): Response of route (receives fallback header).
+        route (str): Route name used in metrics.
+        budget_ms (float): Latency budget in milliseconds.
+        n_recos (int): Number of items that should be returned.
+        func (Callable): Recommendation method, called with `args` and `kwargs`.
+    Returns:
+        List[BasicItemModel]: Items of recommendation method or fallback items.
+    """
+    if budget_ms <= 0:
+        return await func(*args, **kwargs)
+    try:
+        return await asyncio.wait_for(func(*args, **kwargs), budget_ms / 1000)
+    except asyncio.TimeoutError:
+        BUDGET_OVERRUNS.inc(route=route)
+        logger.warning(f"Latency budget of {budget_ms} ms exceeded for route {route} -> return fallback items")
+        with span('fallback'):
+            response.headers[cfg.HEADER_RECO_FALLBACK] = fallback_items.source
+            return fallback_items.get(n_recos)
@@ -0,0 +1,135 @@
+"""HTTP caching of recommendation responses.
+
+Recommendations only change with builds, item changes and (for requests with user uid) the user's consumed items. GET
+responses of the recommendation routes get a weak ETag of the relation build version, the item catalog version (both
+in memory, refreshed every `HTTP_CACHE_REFRESH_INTERVAL` seconds), path, query parameters and user, and Cache-Control
+`max-age`. Requests with a matching `If-None-Match` are answered with 304 before the route runs, i.e. without
+database queries (except loading the consumed items of the user, see `ConsumedItems.load`, the ETag covers the set of
+consumed items). Routes whose responses change between builds (random items, sessions, splitting) and fallback
+responses (latency budget exceeded) are not cached.
+"""
+import hashlib
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import api.core.util.config as cfg
+from api.core.db.storage import Storage, storage_holder
+from api.core.services.collection.consumed_items import consumed_items
+from api.core.util.metrics import Counter
+from api.core.util.refresher import PeriodicRefresher
+
+NOT_MODIFIED = Counter("reco_not_modified_total", "Number of recommendation requests answered with 304.")
+
+UNCACHED_PATHS = (cfg.ENDPOINT_UNPERSONALIZED + "/random",
+                  cfg.ENDPOINT_PERSONALIZED + cfg.ENDPOINT_SESSION,
+                  cfg.ENDPOINT_SPLITTING)
+
+
+class ResponseVersions(PeriodicRefresher):
+    """Relation build and item catalog versions of the storage, refreshed periodically in the background. Changes of
+    this process (item upserts, builds) are applied immediately with `touch`.
+
+    Attributes: #noqa
+        refresh_interval (float): Seconds between refreshes.
+        relations (str): Relation build version (None until first refresh).
+        items (str): Item catalog version (None until first refresh).
+    """
+
+    def __init__(self, refresh_interval: float = cfg.HTTP_CACHE_REFRESH_INTERVAL):
+        super().__init__(refresh_interval)
+        self.relations: Optional[str] = None
+        self.items: Optional[str] = None
+        self._local = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.relations is not None and self.items is not None
+
+    def touch(self):
+        """Changes the versions of this process (data changed before the next refresh)."""
+        self._local += 1
+
+    def etag(self, path: str, query: str, user_uid: Optional[str] = None) -> str:
+        """Weak ETag of the versions, the request and the user's consumed items (equal responses may differ in
+        encoding)."""
+        key = [self.relations, self.items, str(self._local), path, urlencode(sorted(parse_qsl(query)))]
+        if user_uid is not None:
+            key += [user_uid, consumed_items.digest(user_uid)]
+        return f'W/"{hashlib.blake2b("|".join(key).encode(), digest_size=12).hexdigest()}"'
+
+    async def refresh(self, storage: Storage):
+        self.relations = await storage.relations.version()
+        self.items = await storage.items.version()
+
+    def failure_message(self) -> str:
+        return f"Refreshing response versions failed, keep previous versions"
+
+
+response_versions = ResponseVersions()
+
+
+async def start_response_versions():
+    if cfg.HTTP_CACHE_ENABLED:
+        await response_versions.start(storage_holder.storage)
+
+
+async def stop_response_versions():
+    await response_versions.stop()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of `If-None-Match` (list of ETags or `*`) with `etag`."""
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag[2:] in (t[2:] if t.startswith('W/') else t for t in tags)
+
+
+class ConditionalGetMiddleware:
+    """ASGI middleware adding ETag and Cache-Control to recommendation responses and answering matching conditional
+    requests with 304 (see module documentation)."""
+
+    def __init__(self, app, versions: ResponseVersions = response_versions,
+                 prefix: Optional[str] = None, max_age: int = cfg.HTTP_CACHE_MAX_AGE, storage: Storage = None):
+        self.app = app
+        self.versions = versions
+        self.storage = storage  # None uses the storage of the app (opened at startup)
+        self.prefix = prefix if prefix is not None else (cfg.API_V1_STR or "") + cfg.ENDPOINT_RECOMMENDATION
+        self.max_age = max_age
+
+    def cacheable(self, scope) -> bool:
+        if scope["type"] != "http":  # e.g. lifespan scope without path
+            return False
+        path = scope["path"]
+        return scope["method"] in ("GET", "HEAD") and self.versions.ready \
+            and path.startswith(self.prefix) and not path[len(self.prefix):].startswith(UNCACHED_PATHS)
+
+    async def __call__(self, scope, receive, send):
+        if not self.cacheable(scope):
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        user_uid = request_headers.get(cfg.RECO_USER_UID)
+        if user_uid is not None:  # the route would load them after the ETag is computed
+            await consumed_items.load(self.storage or storage_holder.storage, user_uid)
+        etag = self.versions.etag(scope["path"], scope["query_string"].decode(errors="replace"), user_uid)
+        cache_headers = [(b"etag", etag.encode()),
+                         (b"cache-control", f"{'private' if user_uid else 'public'}, max-age={self.max_age}".encode()),
+                         (b"vary", cfg.RECO_USER_UID.encode())]
+        if etag_matches(request_headers.get("if-none-match", ""), etag):
+            NOT_MODIFIED.inc()
+            await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(raw=list(message.get("headers", [])))
+                if cfg.HEADER_RECO_FALLBACK.lower() not in headers:
+                    for name, value in cache_headers[:2]:
+                        headers.raw.append((name, value))
+                    headers.add_vary_header(cfg.RECO_USER_UID)
+                    message = {**message, "headers": headers.raw}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,98 @@
+"""Item partitions for filtered recommendations.
+
+Items are partitioned by the values of `RECO_PARTITION_ATTRIBUTES` (e.g. `type`), numeric attributes with bounds in
+`RECO_PARTITION_BUCKETS` (e.g. `price:10,50,100`) by bucket labels (`-10`, `10-50`, `50-100`, `100-`). Builders store
+neighbour lists of every seed item per partition of every non-empty combination of attributes, so a filtered request
+reads the list of its partition instead of filtering the recommendations.
+
+A partition key lists `attribute=value` pairs ordered by attribute and separated by commas, e.g.
+`price=10-50,type=product`. Requests pass the same format in any order.
+"""
+from bisect import bisect_right
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence
+
+import api.core.util.config as cfg
+
+
+def parse_buckets(text: str) -> Dict[str, List[str]]:
+    """Parses bucket bounds `attribute:bound,bound;attribute:bound,...` into ascending bounds per attribute."""
+    buckets = {}
+    for spec in filter(None, text.split(';')):
+        attribute, bounds = spec.split(':', 1)
+        buckets[attribute.strip()] = sorted((b.strip() for b in bounds.split(',') if b.strip()), key=float)
+    return buckets
+
+
+def bucket_label(value, bounds: Sequence[str]) -> Optional[str]:
+    """Label of the bucket containing `value` (lower bound inclusive), None for non-numeric values. Decimals and
+    numeric strings (e.g. encoded prices) are numeric."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        value = float(str(value))
+    except ValueError:
+        return None
+    position = bisect_right([float(b) for b in bounds], value)
+    lower = bounds[position - 1] if position > 0 else ''
+    upper = bounds[position] if position < len(bounds) else ''
+    return f"{lower}-{upper}"
+
+
+class Partitioning:
+    """Assigns items to partitions and normalizes requested partitions.
+
+    Attributes: #noqa
+        attributes (List[str]): Partition attributes, empty disables partitions.
+        buckets (Dict[str, List[str]]): Ascending bucket bounds of numeric attributes.
+    """
+
+    def __init__(self, attributes: Sequence[str] = cfg.RECO_PARTITION_ATTRIBUTES,
+                 buckets: str = cfg.RECO_PARTITION_BUCKETS):
+        self.attributes = sorted(attributes)
+        self.buckets = parse_buckets(buckets)
+
+    def __bool__(self):
+        return bool(self.attributes)
+
+    def values(self, item: dict) -> Dict[str, str]:
+        """Partition values of an item by attribute (attributes without value are missing)."""
+        res = {}
+        for attribute in self.attributes:
+            value = item.get(attribute)
+            if attribute in self.buckets:
+                value = bucket_label(value, self.buckets[attribute])
+            if value is not None and not isinstance(value, (list, dict)):
+                res[attribute] = str(value)
+        return res
+
+    def keys(self, item: dict) -> List[str]:
+        """Keys of all partitions of an item (every non-empty combination of its partition values)."""
+        values = sorted(self.values(item).items())
+        return [','.join(f"{a}={v}" for a, v in combination)
+                for size in range(1, len(values) + 1) for combination in combinations(values, size)]
+
+    def matches(self, partition: str, item: dict) -> bool:
+        """Whether an item belongs to a (normalized) partition."""
+        return partition in self.keys(item)
+
+    def key(self, partition: Optional[str]) -> Optional[str]:
+        """Normalizes a requested partition (`attribute=value` pairs separated by commas), None for no partition.
+
+        Raises:
+            ValueError: When the partition is malformed or has unknown attributes.
+        """
+        if not partition:
+            return None
+        values = {}
+        for pair in partition.split(','):
+            attribute, sep, value = pair.partition('=')
+            attribute, value = attribute.strip(), value.strip()
+            if not sep or not value or attribute not in self.attributes or attribute in values:
+                raise ValueError(f"Invalid partition {partition}, expected attribute=value pairs of "
+                                 f"{', '.join(self.attributes) or 'no attributes'}")
+            values[attribute] = value
+        return ','.join(f"{a}={values[a]}" for a in sorted(values))
+
+
+partitioning = Partitioning()
@@ -1,88 +1,271 @@
 # "A recommendation is an item!"
 
+import heapq
 import logging
-import random
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-import pymongo
-from motor.motor_asyncio import AsyncIOMotorClient
 import api.core.util.config as cfg
 from api.core.db.models.item import BasicItemModel
+from api.core.db.storage import Storage
+from api.core.services.collection.consumed_items import consumed_items
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.collection.session_buffer import session_buffer
+from api.core.services.collection.variants import variants
+from api.core.util.deadline import hedged
+from api.core.util.singleflight import SingleFlight
+from api.core.util.tracing import span
 
 logger = logging.getLogger(__name__)
 
+reco_flight = SingleFlight('reco')
 
-async def get_random_items(conn: AsyncIOMotorClient, n_recos=5, **kwargs) -> List[BasicItemModel]:
-    """Retrieve random items from 'item' collection.
+# relation types served by collaborative filtering (relations of other builders have own recommendation methods)
+CF_RELATION_TYPES = [cfg.TYPE_COLLABORATIVE_FILTERING,
+                     cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING,
+                     cfg.TYPE_USER_BASED_COLLABORATIVE_FILTERING]
+
+
+async def _load_consumed_items(storage: Storage, user_uid: Optional[str]):
+    """Loads consumed items of the user from storage unless loaded recently (see `ConsumedItems.load`)."""
+    if user_uid is not None:
+        with span('consumed_items'):
+            await consumed_items.load(storage, user_uid)
+
+
+async def get_random_items(storage: Storage, n_recos=5, user_uid: str = None, **kwargs) -> List[BasicItemModel]:
+    """Retrieve random items from item repository.
     Args:
-        conn (AsyncIOMotorClient): Session object used for retrieving items from db.
+        storage (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
+        user_uid (str, optional): Unique identifier of user, consumed items are excluded.
     Returns:
         List[BasicItemModel]: List of random items.
     """
-    cursor = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM].find()
-    res = random.sample(await cursor.to_list(None), n_recos)
-    res = [BasicItemModel(**i) for i in res]
-    return limit_returned_items(res, n_recos)
+    await _load_consumed_items(storage, user_uid)
+    n_fetch = consumed_items.fetch_size(user_uid, n_recos)
+    with span('storage'):
+        res = await storage.items.sample(n_fetch)
+    with span('models'):
+        res = [BasicItemModel(**i) for i in res]
+    return limit_returned_items(consumed_items.exclude(user_uid, res), n_recos)
 
 
-async def get_latest_items(conn: AsyncIOMotorClient, n_recos=5, **kwargs) -> List[BasicItemModel]:
-    """Retrieve the latest items from 'item' collection.
+async def get_latest_items(storage: Storage, n_recos=5, user_uid: str = None, **kwargs) -> List[BasicItemModel]:
+    """Retrieve the latest items from item repository.
     Args:
-        conn (AsyncIOMotorClient): Session object used for retrieving items from db.
+        storage (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
+        user_uid (str, optional): Unique identifier of user, consumed items are excluded.
     Returns:
         List[BasicItemModel]: List of random items.
     """
-    cursor = conn[cfg.DB_NAME][cfg.COLLECTION_NAME_ITEM] \
-        .find() \
-        .sort([('created_time', pymongo.DESCENDING)])
-    res = await cursor.to_list(n_recos)  # TODO: check if this returns sorted products of all or n_reco documents
-    res = [BasicItemModel(**i) for i in res]
+    await _load_consumed_items(storage, user_uid)
+    n_fetch = consumed_items.fetch_size(user_uid, n_recos)
+    res = await coalesce((cfg.TYPE_LATEST, n_fetch), _query_latest_items, storage, n_fetch)
+    return limit_returned_items(consumed_items.exclude(user_uid, res), n_recos)
+
+
+async def _query_latest_items(storage: Storage, n_recos: int) -> List[BasicItemModel]:
+    with span('storage'):
+        res = await storage.items.latest(n_recos)
+    with span('models'):
+        res = [BasicItemModel(**i) for i in res]
     return limit_returned_items(res, n_recos)
 
 
-async def get_collaborative_filtering_items(conn: AsyncIOMotorClient,
-                                            item_id_seed: int,
+async def get_collaborative_filtering_items(storage: Storage,
+                                            item_id_seed: str,
                                             base: str,
-                                            n_recos=5) -> List[BasicItemModel]:
-    """Retrieve item based collaborative filtered items from 'relation' db.
+                                            n_recos=5,
+                                            user_uid: str = None,
+                                            partition: str = None) -> List[BasicItemModel]:
+    """Retrieve item based collaborative filtered items from relation repository.
     Args:
-        conn (AsyncIOMotorClient): Session object used for retrieving items from db.
-        item_id_seed (int): ID of seed item that is used for finding similar items.
+        storage (Storage): Storage used for retrieving items.
+        item_id_seed (str): ID of seed item that is used for finding similar items.
         base (str): Type of filtering, i.e. "item" or "used".
         n_recos (int): Number of items that should be returned.
+        user_uid (str, optional): Unique identifier of user, consumed items are excluded.
+        partition (str, optional): Normalized partition key (see `partitions`), only items of the partition are
+            returned (from the precomputed relations of the partition).
     Returns:
         List[BasicItemModel]: List of similar (item-wise) items.
     """
-    res = []
-    pipeline = [
-        {'$match': {
-            'item_id_seed': str(quick_fix_adjust_item_id(item_id_seed)),
-            'base': base
-        }},
-        {
-            '$lookup': {
-                'from': cfg.COLLECTION_NAME_ITEM,
-                'localField': 'item_id_recommended',
-                'foreignField': 'id',
-                'as': 'item'
-            }
-        },
-        {'$unwind': '$item'},  # reduces and flattens the item (array) to a single object
-        {'$sort': {'similarity': -1}},
-        {'$limit': n_recos}
-    ]
-    async for doc in conn[cfg.DB_NAME][cfg.COLLECTION_NAME_RELATIONS].aggregate(pipeline):
-        res.append(BasicItemModel(**doc['item']))
+    return await _relation_items(storage, cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, CF_RELATION_TYPES, item_id_seed,
+                                 base, n_recos, user_uid, partition)
+
+
+async def get_als_items(storage: Storage,
+                        item_id_seed: str,
+                        base: str = "item",
+                        n_recos=5,
+                        user_uid: str = None) -> List[BasicItemModel]:
+    """Retrieve items with most similar latent factors (relations of `ImplicitALSBuilder`).
+    Args:
+        storage (Storage): Storage used for retrieving items.
+        item_id_seed (str): ID of seed item that is used for finding similar items.
+        base (str): Type of relations, i.e. "item" (item-to-item).
+        n_recos (int): Number of items that should be returned.
+        user_uid (str, optional): Unique identifier of user, consumed items are excluded.
+    Returns:
+        List[BasicItemModel]: List of similar items.
+    """
+    return await _relation_items(storage, cfg.TYPE_ALS, [cfg.TYPE_ALS], item_id_seed, base, n_recos, user_uid)
+
+
+async def get_content_based_items(storage: Storage,
+                                  item_id_seed: str,
+                                  base: str = "item",
+                                  n_recos=5,
+                                  user_uid: str = None) -> List[BasicItemModel]:
+    """Retrieve items with most similar metadata (relations of `ContentBasedBuilder`, available for new items).
+    Args:
+        storage (Storage): Storage used for retrieving items.
+        item_id_seed (str): ID of seed item that is used for finding similar items.
+        base (str): Type of relations, i.e. "item" (item-to-item).
+        n_recos (int): Number of items that should be returned.
+        user_uid (str, optional): Unique identifier of user, consumed items are excluded.
+    Returns:
+        List[BasicItemModel]: List of similar items.
+    """
+    return await _relation_items(storage, cfg.TYPE_CONTENT_BASED, [cfg.TYPE_CONTENT_BASED], item_id_seed, base,
+                                 n_recos, user_uid)
+
+
+async def _relation_items(storage: Storage,
+                          key_type: str,
+                          types: List[str],
+                          item_id_seed: str,
+                          base: str,
+                          n_recos: int,
+                          user_uid: str = None,
+                          partition: str = None) -> List[BasicItemModel]:
+    """Queries relation items of `types` (coalesced by `key_type`), over-fetching candidates for the user's consumed
+    items that are excluded afterwards."""
+    await _load_consumed_items(storage, user_uid)
+    n_fetch = consumed_items.fetch_size(user_uid, n_recos)
+    res = await coalesce((key_type, item_id_seed, base, n_fetch, partition),
+                         _query_relation_items, storage, item_id_seed, base, n_fetch, types, partition)
+    return limit_returned_items(consumed_items.exclude(user_uid, res), n_recos)
+
+
+async def _query_relation_items(storage: Storage,
+                                item_id_seed: str,
+                                base: str,
+                                n_recos: int,
+                                types: List[str],
+                                partition: str = None) -> List[BasicItemModel]:
+    seed = item_id_seed
+    if base == "item":  # relations of variants are stored for their parent and reference seed items by code
+        seed, = await item_codes.encode(storage, [variants.resolve(seed)])
+        if seed is None:
+            return []
+    with span('storage'):
+        docs = await storage.relations.recommended_items(seed, base, n_recos, types, partition)
+    backfill_types = [t for t in cfg.RECO_BACKFILL_TYPES if t not in types]
+    if len(docs) < n_recos and backfill_types:
+        with span('backfill'):
+            docs = backfill(docs, await storage.relations.recommended_items(seed, base, n_recos, backfill_types,
+                                                                            partition))
+    with span('models'):
+        res = [BasicItemModel(**doc) for doc in docs]
+    return limit_returned_items(res, n_recos)
+
+
+async def get_session_items(storage: Storage,
+                            user_uid: str,
+                            n_recos=5) -> List[BasicItemModel]:
+    """Retrieve items scored by the neighbours of the user's recent interactions (session buffer), recent
+    interactions weigh more (`SESSION_DECAY` per older interaction). Users without session get fallback items.
+    Args:
+        storage (Storage): Storage used for retrieving items.
+        user_uid (str): Unique identifier of user.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[BasicItemModel]: List of recommended items.
+    """
+    recent = session_buffer.recent(user_uid) if user_uid is not None else []
+    if not recent:
+        return await reco_str2fun[cfg.TYPE_FALLBACK](storage, n_recos, user_uid=user_uid)
+    recent = [variants.resolve(i) for i in recent]
+    await _load_consumed_items(storage, user_uid)
+    with span('storage'):
+        codes = dict(zip(recent, await item_codes.encode(storage, recent)))
+    weights = recency_weights([codes[i] for i in recent if codes[i] is not None], cfg.SESSION_DECAY)
+    with span('storage'):
+        neighbours = await storage.relations.neighbours(list(weights), "item", cfg.SESSION_NEIGHBOURS,
+                                                        cfg.SESSION_RELATION_TYPES)
+    with span('scoring'):
+        scored = score_session(weights, neighbours, consumed_items.fetch_size(user_uid, n_recos))
+    with span('storage'):
+        item_ids = [i for i in await item_codes.decode(storage, scored)
+                    if i is not None and not consumed_items.contains(user_uid, i)]
+        docs = await storage.items.find_by_ids(item_ids[:n_recos])
+    with span('models'):
+        res = [BasicItemModel(**doc) for doc in docs]
     return limit_returned_items(res, n_recos)
 
 
-def quick_fix_adjust_item_id(item_id: int):
-    """ quick fix for variants """
-    if len(str(item_id)) > 4:
-        item_id = str(item_id)[:-3]
-    return int(item_id)
+async def get_user_items(storage: Storage,
+                         user_uid: str,
+                         n_recos=5) -> List[BasicItemModel]:
+    """Retrieve precomputed recommended items of user (`UserItemBuilder`) with a single read. Users without
+    precomputed items get fallback items.
+    Args:
+        storage (Storage): Storage used for retrieving items.
+        user_uid (str): Unique identifier of user.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[BasicItemModel]: List of recommended items.
+    """
+    docs = []
+    if user_uid is not None:
+        await _load_consumed_items(storage, user_uid)
+        with span('storage'):
+            docs = await storage.user_recommendations.recommended_items(user_uid,
+                                                                        consumed_items.fetch_size(user_uid, n_recos))
+    if not docs:
+        return await reco_str2fun[cfg.TYPE_FALLBACK](storage, n_recos, user_uid=user_uid)
+    with span('models'):
+        res = [BasicItemModel(**doc) for doc in docs]
+    return limit_returned_items(consumed_items.exclude(user_uid, res), n_recos)
+
+
+def recency_weights(recent: List[int], decay: float) -> Dict[int, float]:
+    """Weights of recent item codes (most recent first): decay ** age, summed up for repeated items."""
+    weights: Dict[int, float] = {}
+    for age, item_id in enumerate(recent):
+        weights[item_id] = weights.get(item_id, 0) + decay ** age
+    return weights
+
+
+def score_session(weights: Dict[int, float], neighbours: Dict[int, List[Tuple[int, float]]], n: int) -> List[int]:
+    """Returns `n` item codes with highest sum of seed weight * similarity over the neighbour lists of seed items,
+    seed items themselves are excluded. Candidates are at most SESSION_BUFFER_SIZE * SESSION_NEIGHBOURS items, a
+    single pass over them is faster than converting them to arrays."""
+    scores: Dict[int, float] = {}
+    for seed, weight in weights.items():
+        for item_id, similarity in neighbours.get(seed, ()):
+            scores[item_id] = scores.get(item_id, 0) + weight * similarity
+    for seed in weights:
+        scores.pop(seed, None)
+    return heapq.nlargest(n, scores, key=scores.__getitem__)
+
+
+async def coalesce(key: tuple, query, *args) -> List[BasicItemModel]:
+    """Runs query, concurrent calls with equal key share a single query (see `SingleFlight`). Every caller gets its
+    own list (items are shared and must not be modified). Queries are hedged after `RECO_HEDGE_AFTER_MS`."""
+    hedge_after = cfg.RECO_HEDGE_AFTER_MS / 1000
+    if not cfg.RECO_SINGLEFLIGHT_ENABLED:
+        return await hedged(key[0], hedge_after, query, *args)
+    return list(await reco_flight.do(key, hedged, key[0], hedge_after, query, *args))
+
+
+def backfill(docs: List[dict], backfill_docs: List[dict]) -> List[dict]:
+    """Appends items of `backfill_docs` (relations of RECO_BACKFILL_TYPES, e.g. content-based relations of new items
+    without evidence) that are not in `docs`."""
+    ids = {d['id'] for d in docs}
+    return docs + [d for d in backfill_docs if d['id'] not in ids]
 
 
 def limit_returned_items(items, n_recos) -> List[BasicItemModel]:
@@ -95,6 +278,8 @@ def limit_returned_items(items, n_recos) -> List[BasicItemModel]:
 
 
 reco_str2fun = {
+    cfg.TYPE_ALS: get_als_items,
+    cfg.TYPE_CONTENT_BASED: get_content_based_items,
     cfg.TYPE_FALLBACK: get_random_items,
     cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING: get_collaborative_filtering_items,
     cfg.TYPE_LATEST: get_latest_items,
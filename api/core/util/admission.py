@@ -0,0 +1,194 @@
+"""Admission control: per-client rate limits and concurrency limits per route class.
+
+Requests are classified as `reco` (recommendation routes) or `write` (PUT/POST/PATCH/DELETE of collection routes, e.g.
+evidence tracking and user creation), other routes are not limited. Each class has
+
+- a token bucket per client (`ADMISSION_CLIENT_HEADER` or client address): requests exceeding the client's rate are
+  rejected with 429 and `Retry-After`,
+- a concurrency limit: requests exceeding it are rejected with 503.
+
+Recommendation reads have priority: they wait up to `ADMISSION_RECO_MAX_WAIT_MS` for a slot, writes are shed
+immediately and also while recommendation reads wait, so tracker bursts cannot occupy the database connections reads
+need. Rate limiting is pure arithmetic on in-memory buckets (no I/O), the number of tracked clients per class is
+bounded (least recently seen clients are dropped).
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+import api.core.util.config as cfg
+from api.core.util.metrics import Counter, Gauge
+
+ROUTE_CLASS_RECO = "reco"
+ROUTE_CLASS_WRITE = "write"
+WRITE_METHODS = ("PUT", "POST", "PATCH", "DELETE")
+
+REJECTED = Counter("reco_admission_rejected_total", "Number of requests rejected by admission control.",
+                   ["route_class", "reason"])
+IN_FLIGHT = Gauge("reco_admission_in_flight", "Number of admitted requests in flight.", ["route_class"])
+
+
+class RateLimiter:
+    """Token buckets (`rate` tokens per second, at most `burst` tokens) per client. A rate of 0 disables the limit.
+
+    Attributes: #noqa
+        rate (float): Tokens (requests) per second and client.
+        burst (float): Bucket size, i.e. max. requests of a client in a burst.
+        max_clients (int): Max. number of tracked clients.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = cfg.ADMISSION_MAX_CLIENTS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # client -> [tokens, last update]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, client: str) -> float:
+        """Takes a token of the client's bucket, returns 0 when admitted, else seconds until a token is available."""
+        if self.rate <= 0:
+            return 0
+        now = self._clock()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / self.rate
+
+
+class ConcurrencyLimit:
+    """Max. number of requests in flight, requests wait at most `max_wait` seconds for a slot (0 rejects at once).
+    A limit of 0 disables the limit."""
+
+    def __init__(self, limit: int, max_wait: float = 0):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self._released: Optional[asyncio.Condition] = None
+
+    async def acquire(self) -> bool:
+        if self.limit <= 0 or (self.active < self.limit and not self.waiting):
+            self.active += 1
+            return True
+        if self.max_wait <= 0:
+            return False
+        if self._released is None:
+            self._released = asyncio.Condition()
+        self.waiting += 1
+        try:
+            async with self._released:
+                await asyncio.wait_for(self._released.wait_for(lambda: self.active < self.limit), self.max_wait)
+                self.active += 1
+                return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def release(self):
+        self.active -= 1
+        if self.waiting:
+            async with self._released:
+                self._released.notify_all()  # waiters check for a free slot, timed out waiters may miss a notify
+
+
+class AdmissionControl:
+    """Rate and concurrency limits of the route classes (see module documentation).
+
+    Attributes: #noqa
+        prefix (str): Path prefix of the API routes.
+        client_header (str): Request header identifying the client (empty uses the client address).
+        rate_limits (Dict[str, RateLimiter]): Rate limiter per route class.
+        concurrency_limits (Dict[str, ConcurrencyLimit]): Concurrency limit per route class.
+    """
+
+    def __init__(self, prefix: Optional[str] = None, client_header: str = cfg.ADMISSION_CLIENT_HEADER,
+                 rate_limits: Dict[str, RateLimiter] = None,
+                 concurrency_limits: Dict[str, ConcurrencyLimit] = None):
+        self.prefix = prefix if prefix is not None else cfg.API_V1_STR or ""
+        self.client_header = client_header
+        self.rate_limits = rate_limits if rate_limits is not None else {
+            ROUTE_CLASS_RECO: RateLimiter(cfg.ADMISSION_RECO_RATE, cfg.ADMISSION_RECO_BURST),
+            ROUTE_CLASS_WRITE: RateLimiter(cfg.ADMISSION_WRITE_RATE, cfg.ADMISSION_WRITE_BURST)}
+        self.concurrency_limits = concurrency_limits if concurrency_limits is not None else {
+            ROUTE_CLASS_RECO: ConcurrencyLimit(cfg.ADMISSION_RECO_CONCURRENCY, cfg.ADMISSION_RECO_MAX_WAIT_MS / 1000),
+            ROUTE_CLASS_WRITE: ConcurrencyLimit(cfg.ADMISSION_WRITE_CONCURRENCY)}
+
+    def route_class(self, scope) -> Optional[str]:
+        path = scope["path"]
+        if path.startswith(self.prefix + cfg.ENDPOINT_RECOMMENDATION):
+            return ROUTE_CLASS_RECO
+        if path.startswith(self.prefix + cfg.ENDPOINT_COLLECTION) and scope["method"] in WRITE_METHODS:
+            return ROUTE_CLASS_WRITE
+        return None
+
+    def client(self, scope) -> str:
+        if self.client_header:
+            client = Headers(scope=scope).get(self.client_header)
+            if client:
+                return client
+        return scope["client"][0] if scope.get("client") else ""
+
+    def priority_waiting(self) -> bool:
+        """Whether recommendation reads wait for a slot (writes are shed meanwhile)."""
+        reco = self.concurrency_limits.get(ROUTE_CLASS_RECO)
+        return reco is not None and reco.waiting > 0
+
+
+admission_control = AdmissionControl()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission control (see module documentation)."""
+
+    def __init__(self, app, control: AdmissionControl = admission_control):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        route_class = self.control.route_class(scope) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+        rate_limit = self.control.rate_limits.get(route_class)
+        retry_after = rate_limit.acquire(self.control.client(scope)) if rate_limit is not None else 0
+        if retry_after:
+            await self.reject(scope, receive, send, route_class, 429, "Rate limit exceeded, retry later", retry_after)
+            return
+        limit = self.control.concurrency_limits.get(route_class)
+        if limit is not None:
+            if (route_class == ROUTE_CLASS_WRITE and self.control.priority_waiting()) or not await limit.acquire():
+                await self.reject(scope, receive, send, route_class, 503, "Server is overloaded, retry later", 1)
+                return
+        IN_FLIGHT.inc(route_class=route_class)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            IN_FLIGHT.dec(route_class=route_class)
+            if limit is not None:
+                await limit.release()
+
+    @staticmethod
+    async def reject(scope, receive, send, route_class: str, status_code: int, detail: str, retry_after: float):
+        REJECTED.inc(route_class=route_class, reason="rate" if status_code == 429 else "concurrency")
+        response = JSONResponse({"detail": detail}, status_code=status_code,
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        await response(scope, receive, send)
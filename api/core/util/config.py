@@ -1,4 +1,5 @@
 import os
+from typing import List
 
 from dotenv import load_dotenv
 
@@ -18,22 +19,177 @@ CORS_ORIGIN_REGEX: str = os.environ.get('CORS_ORIGIN_REGEX')
 DB_URL: str = os.environ.get('DB_URL')
 DB_NAME: str = os.environ.get('DB_NAME')
 
+# Database connection pools (async client serves requests, process-wide sync client is used by builders)
+DB_MAX_POOL_SIZE: int = int(os.environ.get('DB_MAX_POOL_SIZE', 100))
+DB_MIN_POOL_SIZE: int = int(os.environ.get('DB_MIN_POOL_SIZE', 10))
+DB_SYNC_MAX_POOL_SIZE: int = int(os.environ.get('DB_SYNC_MAX_POOL_SIZE', 10))
+DB_SYNC_MIN_POOL_SIZE: int = int(os.environ.get('DB_SYNC_MIN_POOL_SIZE', 0))
+DB_MAX_IDLE_TIME_MS: int = int(os.environ.get('DB_MAX_IDLE_TIME_MS', 300000))  # close idle pooled connections
+DB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.environ.get('DB_WAIT_QUEUE_TIMEOUT_MS', 5000))  # wait for pooled connection
+# Read preferences (primary, primaryPreferred, secondary, secondaryPreferred, nearest) of clients (all writes and
+# remaining reads), recommendation queries and builder evidence reads
+DB_READ_PREFERENCE: str = os.environ.get('DB_READ_PREFERENCE', 'primary')
+DB_READ_PREFERENCE_RECO: str = os.environ.get('DB_READ_PREFERENCE_RECO', 'primary')
+DB_READ_PREFERENCE_BUILDER: str = os.environ.get('DB_READ_PREFERENCE_BUILDER', 'primary')
+
+# Storage backend of the API: mongodb or memory (in-process, loads a snapshot of DB_URL at startup when set)
+STORAGE_BACKEND: str = os.environ.get('STORAGE_BACKEND', 'mongodb')
+
+# Evidence ingestion (write-behind buffer, flushed on size or time threshold)
+EVIDENCE_BUFFER_ENABLED: bool = os.environ.get('EVIDENCE_BUFFER_ENABLED', 'true').lower() == 'true'
+EVIDENCE_BUFFER_MAX_SIZE: int = int(os.environ.get('EVIDENCE_BUFFER_MAX_SIZE', 50000))
+EVIDENCE_BUFFER_FLUSH_SIZE: int = int(os.environ.get('EVIDENCE_BUFFER_FLUSH_SIZE', 1000))
+EVIDENCE_BUFFER_FLUSH_INTERVAL: float = float(os.environ.get('EVIDENCE_BUFFER_FLUSH_INTERVAL', 1.0))  # seconds
+EVIDENCE_BUFFER_PUT_TIMEOUT: float = float(os.environ.get('EVIDENCE_BUFFER_PUT_TIMEOUT', 0.5))  # seconds
+EVIDENCE_MAX_BATCH_BYTES: int = int(os.environ.get('EVIDENCE_MAX_BATCH_BYTES', 10 * 1024 * 1024))  # decompressed
+# Per (user, item, evidence name) rollups, maintained on ingest and optionally used by builders
+EVIDENCE_ROLLUP_ENABLED: bool = os.environ.get('EVIDENCE_ROLLUP_ENABLED', 'true').lower() == 'true'
+EVIDENCE_PIPELINE_USE_ROLLUP: bool = os.environ.get('EVIDENCE_PIPELINE_USE_ROLLUP', 'false').lower() == 'true'
+
+# Item upserts (chunked bulk writes, number of chunks written concurrently)
+ITEM_BULK_CHUNK_SIZE: int = int(os.environ.get('ITEM_BULK_CHUNK_SIZE', 1000))
+ITEM_BULK_CONCURRENCY: int = int(os.environ.get('ITEM_BULK_CONCURRENCY', 4))
+
+# Collection exports (cursor batch size of streamed NDJSON exports)
+EXPORT_BATCH_SIZE: int = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+# Latency budgets of recommendation routes (0 disables), exceeding requests return in-memory fallback items
+RECO_LATENCY_BUDGET_MS_PERS: float = float(os.environ.get('RECO_LATENCY_BUDGET_MS_PERS', 300))
+RECO_LATENCY_BUDGET_MS_SPLIT: float = float(os.environ.get('RECO_LATENCY_BUDGET_MS_SPLIT', 400))
+RECO_LATENCY_BUDGET_MS_UNPERS: float = float(os.environ.get('RECO_LATENCY_BUDGET_MS_UNPERS', 300))
+RECO_FALLBACK_SOURCE: str = os.environ.get('RECO_FALLBACK_SOURCE', 'popular')  # popular or latest
+RECO_FALLBACK_SIZE: int = int(os.environ.get('RECO_FALLBACK_SIZE', 50))
+RECO_FALLBACK_REFRESH_INTERVAL: float = float(os.environ.get('RECO_FALLBACK_REFRESH_INTERVAL', 300))  # seconds
+# Start a second (hedged) query when a recommendation query has not completed after this time (0 disables)
+RECO_HEDGE_AFTER_MS: float = float(os.environ.get('RECO_HEDGE_AFTER_MS', 0))
+
+# Coalesce concurrent identical recommendation queries into one database query
+RECO_SINGLEFLIGHT_ENABLED: bool = os.environ.get('RECO_SINGLEFLIGHT_ENABLED', 'true').lower() == 'true'
+
+# HTTP caching of recommendation responses (ETag of build and catalog versions refreshed every interval, Cache-Control
+# max-age) and compression (gzip, brotli when installed) of responses of at least HTTP_COMPRESSION_MIN_SIZE bytes
+HTTP_CACHE_ENABLED: bool = os.environ.get('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+HTTP_CACHE_MAX_AGE: int = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))  # seconds
+HTTP_CACHE_REFRESH_INTERVAL: float = float(os.environ.get('HTTP_CACHE_REFRESH_INTERVAL', 10))  # seconds
+HTTP_COMPRESSION_ENABLED: bool = os.environ.get('HTTP_COMPRESSION_ENABLED', 'true').lower() == 'true'
+HTTP_COMPRESSION_MIN_SIZE: int = int(os.environ.get('HTTP_COMPRESSION_MIN_SIZE', 1024))  # bytes
+
+# Admission control: per client token buckets (requests per second and burst, 0 disables) and concurrency limits of
+# recommendation reads and collection writes (0 disables). Reads wait up to ADMISSION_RECO_MAX_WAIT_MS for a slot,
+# writes are rejected at once. Clients are identified by ADMISSION_CLIENT_HEADER (empty uses the client address)
+ADMISSION_ENABLED: bool = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_CLIENT_HEADER: str = os.environ.get('ADMISSION_CLIENT_HEADER', '')
+ADMISSION_MAX_CLIENTS: int = int(os.environ.get('ADMISSION_MAX_CLIENTS', 100000))  # tracked clients per route class
+ADMISSION_RECO_RATE: float = float(os.environ.get('ADMISSION_RECO_RATE', 0))
+ADMISSION_RECO_BURST: float = float(os.environ.get('ADMISSION_RECO_BURST', 100))
+ADMISSION_RECO_CONCURRENCY: int = int(os.environ.get('ADMISSION_RECO_CONCURRENCY', DB_MAX_POOL_SIZE))
+ADMISSION_RECO_MAX_WAIT_MS: float = float(os.environ.get('ADMISSION_RECO_MAX_WAIT_MS', 100))
+ADMISSION_WRITE_RATE: float = float(os.environ.get('ADMISSION_WRITE_RATE', 0))
+ADMISSION_WRITE_BURST: float = float(os.environ.get('ADMISSION_WRITE_BURST', 50))
+ADMISSION_WRITE_CONCURRENCY: int = int(os.environ.get('ADMISSION_WRITE_CONCURRENCY', max(1, DB_MAX_POOL_SIZE // 4)))
+
+# Metrics (Prometheus text format on /metrics)
+METRICS_ENABLED: bool = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Request tracing (Server-Timing header for sampled requests and requests with debug header, slow request log)
+TRACING_ENABLED: bool = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+TRACING_SAMPLE_RATE: float = float(os.environ.get('TRACING_SAMPLE_RATE', 0.0))  # fraction of requests
+TRACING_DEBUG_HEADER: str = os.environ.get('TRACING_DEBUG_HEADER', 'reco-debug')
+TRACING_SLOW_REQUEST_MS: float = float(os.environ.get('TRACING_SLOW_REQUEST_MS', 0))  # 0 disables slow request log
+
+# Implicit ALS builder (latent factors, iterations, L2 regularization, confidence scaling, threads solving blocks of
+# rows and max. interactions per block, memory of a block is about ALS_BLOCK_NNZ * ALS_FACTORS^2 * 4 bytes)
+ALS_FACTORS: int = int(os.environ.get('ALS_FACTORS', 64))
+ALS_ITERATIONS: int = int(os.environ.get('ALS_ITERATIONS', 15))
+ALS_REGULARIZATION: float = float(os.environ.get('ALS_REGULARIZATION', 0.01))
+ALS_ALPHA: float = float(os.environ.get('ALS_ALPHA', 40.0))
+ALS_NUM_THREADS: int = int(os.environ.get('ALS_NUM_THREADS', 1))
+ALS_BLOCK_NNZ: int = int(os.environ.get('ALS_BLOCK_NNZ', 2048))
+ALS_TOPK_BLOCK_ELEMENTS: int = int(os.environ.get('ALS_TOPK_BLOCK_ELEMENTS', 2 ** 22))  # scores per top-k block
+ALS_FACTOR_PATH: str = os.environ.get('ALS_FACTOR_PATH')  # write factor file after builds (optional)
+
+# Content-based builder (TF-IDF of item name, type and extra attributes, neighbours per item, seed items per block
+# of the similarity product), with CB_INCREMENTAL_ENABLED the serving process keeps the index in memory and updates
+# relations of new or changed items on item upserts (one process only, further processes of the host holding the
+# lock file fail at startup)
+CB_N_RECOS: int = int(os.environ.get('CB_N_RECOS', 10))
+CB_BLOCK_SIZE: int = int(os.environ.get('CB_BLOCK_SIZE', 256))
+CB_MAX_DF: float = float(os.environ.get('CB_MAX_DF', 0.5))  # ignore terms of more than this fraction of items
+CB_INCREMENTAL_ENABLED: bool = os.environ.get('CB_INCREMENTAL_ENABLED', 'false').lower() == 'true'
+CB_INCREMENTAL_LOCK_PATH: str = os.environ.get('CB_INCREMENTAL_LOCK_PATH',
+                                               f'/tmp/reco-content-index-{DB_NAME}.lock')
+
+# Session recommendations (recent item interactions per user kept in memory, max. users, recency decay per
+# interaction, neighbours per recent item, relation types of neighbours)
+SESSION_BUFFER_SIZE: int = int(os.environ.get('SESSION_BUFFER_SIZE', 20))
+SESSION_MAX_USERS: int = int(os.environ.get('SESSION_MAX_USERS', 100000))
+SESSION_DECAY: float = float(os.environ.get('SESSION_DECAY', 0.8))
+SESSION_NEIGHBOURS: int = int(os.environ.get('SESSION_NEIGHBOURS', 20))
+SESSION_RELATION_TYPES: List[str] = os.environ.get('SESSION_RELATION_TYPES', 'cf,cf_ib,cf_ub,als,cb').split(',')
+
+# User-to-item builder (recommended items per user, neighbours per item of the truncated item-item similarity, users
+# per block of the score product)
+USER_RECO_N_RECOS: int = int(os.environ.get('USER_RECO_N_RECOS', 20))
+USER_RECO_NEIGHBOURS: int = int(os.environ.get('USER_RECO_NEIGHBOURS', 50))
+USER_RECO_BLOCK_SIZE: int = int(os.environ.get('USER_RECO_BLOCK_SIZE', 1024))
+
+# Exclude items consumed by the user (evidence names) from recommendations, kept in memory for max. users and loaded
+# from stored evidence on first use (again after RECO_EXCLUDE_REFRESH_INTERVAL seconds, evidence of other processes),
+# at most RECO_EXCLUDE_MAX_OVERFETCH additional candidates are fetched to make up for excluded items
+RECO_EXCLUDE_ENABLED: bool = os.environ.get('RECO_EXCLUDE_ENABLED', 'true').lower() == 'true'
+RECO_EXCLUDE_EVIDENCE_NAMES: List[str] = os.environ.get('RECO_EXCLUDE_EVIDENCE_NAMES', 'purchase').split(',')
+RECO_EXCLUDE_MAX_USERS: int = int(os.environ.get('RECO_EXCLUDE_MAX_USERS', 100000))
+RECO_EXCLUDE_MAX_OVERFETCH: int = int(os.environ.get('RECO_EXCLUDE_MAX_OVERFETCH', 20))
+RECO_EXCLUDE_REFRESH_INTERVAL: float = float(os.environ.get('RECO_EXCLUDE_REFRESH_INTERVAL', 300))
+
+# Relation types used to fill up relation based recommendations with less than the requested items (empty disables)
+RECO_BACKFILL_TYPES: List[str] = [t for t in os.environ.get('RECO_BACKFILL_TYPES', 'cb').split(',') if t]
+
+# Item attributes partitioning relations of the collaborative filtering builder for filtered recommendations, bucket
+# bounds of numeric attributes as "attribute:bound,bound;attribute:..." (empty attributes disable partitions)
+RECO_PARTITION_ATTRIBUTES: List[str] = [a for a in os.environ.get('RECO_PARTITION_ATTRIBUTES', '').split(',') if a]
+RECO_PARTITION_BUCKETS: str = os.environ.get('RECO_PARTITION_BUCKETS', 'price:10,50,100')
+RECO_PARTITION_N_RECOS: int = int(os.environ.get('RECO_PARTITION_N_RECOS', 10))
+
+# Item variants (e.g. sizes or colors of a product): item attribute with the id of the parent item (empty disables).
+# Seed items are resolved to their parent with an in-memory map refreshed every VARIANT_REFRESH_INTERVAL seconds,
+# builders collapse evidence of variants into their parent with BUILDER_COLLAPSE_VARIANTS
+ITEM_PARENT_ATTRIBUTE: str = os.environ.get('ITEM_PARENT_ATTRIBUTE', 'parent_id')
+VARIANT_REFRESH_INTERVAL: float = float(os.environ.get('VARIANT_REFRESH_INTERVAL', 300))  # seconds
+BUILDER_COLLAPSE_VARIANTS: bool = os.environ.get('BUILDER_COLLAPSE_VARIANTS', 'true').lower() == 'true'
+
+# Builder profiling: peak memory per stage via tracemalloc (slows down builds considerably), RSS of the process is
+# always sampled every BUILDER_PROFILE_RSS_INTERVAL seconds during a stage
+BUILDER_PROFILE_MEMORY: bool = os.environ.get('BUILDER_PROFILE_MEMORY', 'false').lower() == 'true'
+BUILDER_PROFILE_RSS_INTERVAL: float = float(os.environ.get('BUILDER_PROFILE_RSS_INTERVAL', 0.05))
+
 # Database collection names
+COLLECTION_NAME_BUILD_HISTORY = "build_history"
 COLLECTION_NAME_EVIDENCE = "evidence"
+COLLECTION_NAME_EVIDENCE_ROLLUP = "evidence_rollup"
 COLLECTION_NAME_ITEM = "item"
+COLLECTION_NAME_ITEM_CODE = "item_code"
 COLLECTION_NAME_RELATIONS = "relation"
 COLLECTION_NAME_SPLITTING_CONFIG = "splitting"
 COLLECTION_NAME_USER = "user"
+COLLECTION_NAME_USER_RECOMMENDATION = "user_recommendation"
 
 # Database column names
 COLUMN_CONFIDENCE = "confidence"
+COLUMN_COUNT = "count"
+COLUMN_FIRST_TIMESTAMP = "first_timestamp"
 COLUMN_ITEM_ID_SEED = "item_id_seed"
 COLUMN_ITEM_ID = "item_id"
+COLUMN_ITEM_CODE = "item_code"
 COLUMN_ORDER_CODE = "order_code"
+COLUMN_PARTITION = "partition"
 COLUMN_ITEM_ID_RECOMMENDED = "item_id_recommended"
+COLUMN_LAST_TIMESTAMP = "last_timestamp"
+COLUMN_NAME = "name"
 COLUMN_SIMILARITY = "similarity"
 COLUMN_SUPPORT = "support"
 COLUMN_USER_ID = "user_id"
+COLUMN_USER_UID = "user_uid"
 
 COLUMNS_RELATION_FBT = [COLUMN_ITEM_ID_SEED, COLUMN_ITEM_ID_RECOMMENDED, COLUMN_CONFIDENCE, COLUMN_SUPPORT]
 COLUMNS_RELATION_ICF = [COLUMN_ITEM_ID_SEED, COLUMN_ITEM_ID_RECOMMENDED, COLUMN_SIMILARITY]
@@ -47,17 +203,26 @@ RECO_CANVAS_ID = "reco-canvas-id"
 RECO2JS_ID = "reco2js_id"
 RECO_USER_UID = "reco_user_uid"
 
+# Response headers
+HEADER_RECO_FALLBACK = "X-Reco-Fallback"
+
 # Recommendation types
 TYPE_COLLABORATIVE_FILTERING = "cf"
 TYPE_ITEM_BASED_COLLABORATIVE_FILTERING = TYPE_COLLABORATIVE_FILTERING + "_ib"
 TYPE_USER_BASED_COLLABORATIVE_FILTERING = TYPE_COLLABORATIVE_FILTERING + "_ub"
 
+TYPE_ALS = "als"
+TYPE_CONTENT_BASED = "cb"
 TYPE_FALLBACK = "fallback"
 TYPE_FREQUENTLY_BOUGHT_TOGETHER = "frequently_bought_together"
 TYPE_LATEST = "latest"
+TYPE_POPULAR = "popular"
 TYPE_RANDOM_RECOMMENDATIONS = "random"
+TYPE_SESSION = "session"
+TYPE_USER_ITEMS = "user_items"
 
 # Routes 1st level
+ENDPOINT_METRICS = "/metrics"
 ENDPOINT_BUILDER = "/bld"
 ENDPOINT_COLLECTION = "/col"
 ENDPOINT_RECOMMENDATION = "/rec"
@@ -69,7 +234,11 @@ ENDPOINT_SPLITTING = "/split"
 ENDPOINT_UNPERSONALIZED = "/unpers"
 ENDPOINT_USER = "/user"
 # Routes 3rd level
+ENDPOINT_ALS = "/als"
+ENDPOINT_CONTENT_BASED = "/cb"
 ENDPOINT_COLLABORATIVE_FILTERING = "/cf"
+ENDPOINT_IMPORT = "/import"
+ENDPOINT_SESSION = "/session"
 
 # Tags
 TAG_BUILDER = "Builder"
@@ -0,0 +1,34 @@
+"""Hedged calls for idempotent reads."""
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from api.core.util.metrics import Counter
+
+HEDGED_CALLS = Counter("hedged_calls_total", "Number of hedged second attempts by winning attempt.", ["name", "winner"])
+
+
+async def hedged(name: str, delay: float, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Calls `func` and, when it has not completed after `delay` seconds, starts a second attempt. Returns the result
+    of the first successful attempt (or raises the exception of the last failed one), the other attempt is cancelled.
+    Only use for idempotent reads."""
+    first = asyncio.ensure_future(func(*args, **kwargs))
+    if delay <= 0:
+        return await first
+    attempts = {first}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return first.result()
+        second = asyncio.ensure_future(func(*args, **kwargs))
+        attempts.add(second)
+        pending = attempts
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            successful = [a for a in done if a.exception() is None]
+            if successful or not pending:  # otherwise wait for the remaining attempt
+                winner = successful[0] if successful else done.pop()
+                HEDGED_CALLS.inc(name=name, winner="first" if winner is first else "second")
+                return winner.result()
+    finally:
+        for attempt in attempts:
+            attempt.cancel()  # no-op for completed attempts
@@ -0,0 +1,303 @@
+"""In-process metrics in Prometheus text format.
+
+Metrics are kept in plain dictionaries guarded by a lock (builders and pymongo listeners run in threads), recording a
+sample is a dictionary update and a bisect. `MetricsMiddleware` records route latencies, `CommandTimer` records
+MongoDB command durations and `PoolMonitor` connection pool usage (both registered as pymongo event listeners) and
+`/metrics` renders the registry.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+import api.core.util.config as cfg
+
+CONTENT_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUILD_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List["Metric"] = []
+
+    def register(self, metric: "Metric"):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics) + "\n"
+
+
+registry = Registry()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)  # the global registry is rendered by `/metrics`
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels(self, key: Tuple, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+                         + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {v}" for k, v in values]
+
+
+class Gauge(Metric):
+    """Gauge that is either set explicitly or read from `function` when rendered."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None, registry: Registry = registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {self.function()}"]
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {v}" for k, v in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Registry = registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0] * (len(self.buckets) + 2)
+            v[i] += 1
+            v[-1] += value
+
+    def count(self, **labels) -> int:
+        v = self._values.get(self._key(labels))
+        return sum(v[:-1]) if v else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for k, v in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), v[:-1]):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(k, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(k)} {v[-1]}")
+            lines.append(f"{self.name}_count{self._labels(k)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "Number of HTTP requests.", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency.", ["method", "route"])
+MONGODB_COMMAND_DURATION = Histogram("mongodb_command_duration_seconds", "MongoDB command duration.",
+                                     ["collection", "command"])
+MONGODB_COMMAND_FAILURES = Counter("mongodb_command_failures_total", "Number of failed MongoDB commands.",
+                                   ["collection", "command"])
+MONGODB_POOL_CHECKOUT_WAIT = Histogram("mongodb_pool_checkout_wait_seconds",
+                                       "Time waiting for a pooled MongoDB connection.", ["client"])
+MONGODB_POOL_CHECKOUT_FAILURES = Counter("mongodb_pool_checkout_failures_total",
+                                         "Number of failed MongoDB connection checkouts.", ["client", "reason"])
+MONGODB_POOL_CONNECTIONS = Gauge("mongodb_pool_connections", "Number of open pooled MongoDB connections.", ["client"])
+MONGODB_POOL_CONNECTIONS_IN_USE = Gauge("mongodb_pool_connections_in_use",
+                                        "Number of checked out MongoDB connections.", ["client"])
+MONGODB_POOL_MAX_SIZE = Gauge("mongodb_pool_max_size", "Max. size of MongoDB connection pool (per server).", ["client"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Number of cache lookups.", ["cache", "result"])
+BUILDER_DURATION = Histogram("builder_duration_seconds", "Builder run duration per stage.", ["builder", "stage"],
+                             buckets=BUILD_BUCKETS)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class CommandTimer(monitoring.CommandListener):
+    """pymongo command listener that records command durations per collection and command name."""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if isinstance(collection, str):
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGODB_COMMAND_DURATION.observe(event.duration_micros / 1e6, collection=collection,
+                                             command=event.command_name)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGODB_COMMAND_DURATION.observe(event.duration_micros / 1e6, collection=collection,
+                                             command=event.command_name)
+            MONGODB_COMMAND_FAILURES.inc(collection=collection, command=event.command_name)
+
+
+command_timer = CommandTimer()
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """pymongo connection pool listener recording open and checked out connections and checkout wait times of a
+    client. Pool saturation is `mongodb_pool_connections_in_use / mongodb_pool_max_size`."""
+
+    def __init__(self, client: str, max_pool_size: int):
+        self.client = client
+        self._checkout_started = threading.local()  # checkouts start and end in the calling thread
+        MONGODB_POOL_MAX_SIZE.set(max_pool_size, client=client)
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.time = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._observe_wait()
+        MONGODB_POOL_CONNECTIONS_IN_USE.inc(client=self.client)
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait()
+        MONGODB_POOL_CHECKOUT_FAILURES.inc(client=self.client, reason=event.reason)
+
+    def connection_checked_in(self, event):
+        MONGODB_POOL_CONNECTIONS_IN_USE.dec(client=self.client)
+
+    def connection_created(self, event):
+        MONGODB_POOL_CONNECTIONS.inc(client=self.client)
+
+    def connection_closed(self, event):
+        MONGODB_POOL_CONNECTIONS.dec(client=self.client)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def _observe_wait(self):
+        started = getattr(self._checkout_started, "time", None)
+        if started is not None:
+            MONGODB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, client=self.client)
+            self._checkout_started.time = None
+
+
+def event_listeners(client: str, max_pool_size: int) -> list:
+    """pymongo event listeners to pass to (motor) clients, `client` labels the pool metrics."""
+    return [command_timer, PoolMonitor(client, max_pool_size)] if cfg.METRICS_ENABLED else []
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count and latency per route template (e.g. `/api/v1/col/item`)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self._route(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=scope["method"], route=route)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status_code)
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "<unmatched>"
+        route = self._routes.get(endpoint)
+        if route is None:
+            paths = {getattr(r, "endpoint", None): r.path for r in scope["app"].routes}
+            route = self._routes[endpoint] = paths.get(endpoint, "<unknown>")
+        return route
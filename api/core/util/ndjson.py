@@ -0,0 +1,46 @@
+import json
+import zlib
+from datetime import datetime, date
+from typing import AsyncIterator
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+
+
+def is_gzip(content_type: str, content_encoding: str) -> bool:
+    """Request body is gzip compressed, either by content encoding or by gzip content type."""
+    return "gzip" in (content_encoding or "").lower() or "gzip" in (content_type or "").lower()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], gzip: bool = False) -> AsyncIterator[bytes]:
+    """Yields non-empty lines from a (optionally gzip compressed) byte stream without reading the complete stream
+    into memory."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+    rest = b""
+    async for chunk in chunks:
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        if not chunk:
+            continue
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if decompressor is not None:
+        rest += decompressor.flush()
+    for line in rest.split(b"\n"):
+        if line.strip():
+            yield line
+
+
+def _encode_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    return str(o)  # ObjectId, Decimal128, ...
+
+
+async def stream_documents(cursor: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Encodes documents from a (motor) cursor as NDJSON lines while iterating, i.e. memory is bound by the cursor
+    batch size and not by the number of documents."""
+    async for doc in cursor:
+        yield json.dumps(doc, default=_encode_default).encode() + b"\n"
@@ -0,0 +1,52 @@
+"""In-memory state of the serving process refreshed periodically from storage in the background."""
+import asyncio
+import logging
+from typing import Optional
+
+from pymongo.errors import PyMongoError
+
+
+class PeriodicRefresher:
+    """Base of in-memory state that is loaded at startup and refreshed every `refresh_interval` seconds. Subclasses
+    implement `refresh` and `failure_message`. Failed refreshes (database errors) are logged with the logger of the
+    subclass module and keep the previous state.
+
+    Attributes: #noqa
+        refresh_interval (float): Seconds between refreshes.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, storage):
+        raise NotImplementedError
+
+    def failure_message(self) -> str:
+        """Log message of a failed refresh (the error is appended)."""
+        raise NotImplementedError
+
+    async def start(self, storage):
+        """Loads state and starts periodic refresh. Must be called from within the running event loop."""
+        await self._refresh_logged(storage)
+        self._task = asyncio.ensure_future(self._run(storage))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_logged(self, storage):
+        try:
+            await self.refresh(storage)
+        except PyMongoError as e:
+            logging.getLogger(type(self).__module__).error(f"{self.failure_message()}: {e}")
+
+    async def _run(self, storage):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self._refresh_logged(storage)
@@ -0,0 +1,44 @@
+"""Coalescing of concurrent identical calls (single flight)."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from api.core.util.metrics import record_cache_lookup
+from api.core.util.tracing import span
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, concurrent callers with the same key await the in-flight call and
+    receive its result or exception.
+
+    The call runs as a task that is shielded from cancellation of individual callers, a cancelled caller does not
+    cancel the call for the others. Keys are removed when the call completes, so the in-flight map only holds
+    running calls. Coalesced calls are counted as cache hits (`cache="singleflight_<name>"`).
+
+    Attributes: #noqa
+        name (str): Name used in metrics and trace spans.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        future = self._calls.get(key)
+        coalesced = future is not None
+        record_cache_lookup(f"singleflight_{self.name}", hit=coalesced)
+        if not coalesced:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+            return await asyncio.shield(future)
+        with span('coalesced'):
+            return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # retrieved by callers, avoids "exception was never retrieved" when all were cancelled
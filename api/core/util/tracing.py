@@ -0,0 +1,174 @@
+"""Lightweight request tracing with nested spans.
+
+A trace lives in a context variable for the duration of a request, `span(name)` records a nested span in the current
+trace and is a no-op outside of traced requests. `TracingMiddleware` starts traces for sampled requests and requests
+with the debug header (returned as `Server-Timing` header) and, when a slow request threshold is set, for all requests
+to log the spans of slow ones. Routes created with `TracedRoute` additionally record the endpoint function, response
+validation (pydantic/`jsonable_encoder`) and JSON rendering.
+"""
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi.datastructures import DefaultPlaceholder, Default
+from fastapi.routing import APIRoute
+from starlette.responses import JSONResponse
+
+import api.core.util.config as cfg
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """Spans of a single request, recorded in order of completion with start offset and nesting depth."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[dict] = []
+        self.marks: Dict[str, float] = {}
+        self._depth = 0
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.add(name, start, time.perf_counter())
+
+    def add(self, name: str, start: float, end: float):
+        self.spans.append({'name': name, 'start_ms': round((start - self.start) * 1000, 3),
+                           'duration_ms': round((end - start) * 1000, 3), 'depth': self._depth})
+
+    def finish(self) -> float:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+        return self.duration
+
+    def server_timing(self) -> str:
+        """Renders spans as `Server-Timing` header value, durations of spans with equal names are summed up."""
+        durations: Dict[str, float] = {}
+        for s in self.spans:
+            durations[s['name']] = durations.get(s['name'], 0) + s['duration_ms']
+        durations['total'] = (time.perf_counter() - self.start) * 1000
+        return ", ".join(f"{name};dur={duration:.3f}" for name, duration in durations.items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Records a span named `name` in the current trace (no-op when request is not traced)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+class TracingMiddleware:
+    """ASGI middleware starting a trace for sampled requests (`TRACING_SAMPLE_RATE`) and requests with the debug
+    header (`TRACING_DEBUG_HEADER`), which get a `Server-Timing` response header. With `TRACING_SLOW_REQUEST_MS` set,
+    every request is traced and requests exceeding the threshold are logged with their spans."""
+
+    def __init__(self, app):
+        self.app = app
+        self._debug_header = cfg.TRACING_DEBUG_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        sampled = any(k == self._debug_header for k, _ in scope["headers"]) \
+            or random.random() < cfg.TRACING_SAMPLE_RATE
+        if not sampled and cfg.TRACING_SLOW_REQUEST_MS <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and sampled:
+                message["headers"] = list(message.get("headers", [])) + \
+                    [(b"server-timing", trace.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            duration_ms = trace.finish() * 1000
+            if 0 < cfg.TRACING_SLOW_REQUEST_MS <= duration_ms:
+                logger.warning(json.dumps({'event': 'slow_request', 'method': scope["method"], 'path': scope["path"],
+                                           'query': scope["query_string"].decode(errors="replace"),
+                                           'duration_ms': round(duration_ms, 3), 'spans': trace.spans}))
+
+
+class TracedJSONResponse(JSONResponse):
+    """JSON response recording `validate` (endpoint return until rendering) and `render` spans."""
+
+    def render(self, content) -> bytes:
+        trace = _current_trace.get()
+        if trace is None:
+            return super().render(content)
+        start = time.perf_counter()
+        endpoint_end = trace.marks.pop('endpoint_end', None)
+        if endpoint_end is not None:
+            trace.add('validate', endpoint_end, start)
+        body = super().render(content)
+        trace.add('render', start, time.perf_counter())
+        return body
+
+
+class TracedRoute(APIRoute):
+    """API route recording spans for endpoint function, response validation and JSON rendering (see
+    `TracedJSONResponse`), use as `APIRouter(route_class=TracedRoute)`."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        if isinstance(self.response_class, DefaultPlaceholder) and self.response_class.value is JSONResponse:
+            self.response_class = Default(TracedJSONResponse)
+        return super().get_route_handler()
+
+
+def _traced_endpoint(endpoint):
+    """Wraps endpoint function in an `endpoint` span (signature is kept for FastAPI's dependency injection). Routes
+    are re-created when routers are included, so endpoints are wrapped only once."""
+    if getattr(endpoint, '_traced', False):
+        return endpoint
+
+    def mark_end():
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.marks['endpoint_end'] = time.perf_counter()
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with span('endpoint'):
+                res = await endpoint(*args, **kwargs)
+            mark_end()
+            return res
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with span('endpoint'):
+                res = endpoint(*args, **kwargs)
+            mark_end()
+            return res
+    wrapper._traced = True
+    return wrapper
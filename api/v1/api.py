@@ -1,6 +1,5 @@
 from fastapi import APIRouter
 
-from api.v1.builder import builder
 from api.v1.collection import user, item, evidence
 from api.v1.reco import splitting
 from api.v1.reco import collaborative_filtering
@@ -8,9 +7,6 @@ from api.v1.reco import unpersonalized
 
 api_router = APIRouter()
 
-# Builder router
-api_router.include_router(builder.api_router)
-
 # Collection router
 api_router.include_router(evidence.api_router)
 api_router.include_router(item.api_router)
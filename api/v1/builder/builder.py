@@ -1,12 +1,21 @@
+import asyncio
 import logging
 
 from fastapi import APIRouter, status, Depends
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 
+from api.core.db.mongodb_utils import MongoDBHelper
 from api.core.services.authentification.basic_auth import check_basic_auth
-from api.core.services.builder.CollaborativeFilteringBuilder import CollaborativeFilteringBuilder
+from api.core.services.builder.profiling import BuildProfiler
+from api.core.services.collection.content_index import content_index
 from api.core.services.collection.evidence import EvidencePipeline
-from api.core.util.config import ENDPOINT_BUILDER, TAG_BUILDER
+from api.core.services.collection.evidence_buffer import evidence_buffer
+from api.core.services.reco.http_cache import response_versions
+from api.core.services.reco.partitions import partitioning
+import api.core.util.config as cfg
+from api.core.util.config import ENDPOINT_BUILDER, TAG_BUILDER, EVIDENCE_PIPELINE_USE_ROLLUP, ENDPOINT_ALS, \
+    ENDPOINT_CONTENT_BASED, ENDPOINT_USER
 
 api_router = APIRouter(prefix=ENDPOINT_BUILDER, tags=[TAG_BUILDER])
 
@@ -14,20 +23,165 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+async def run_build(func, *args) -> JSONResponse:
+    """Runs builder function in threadpool (builders block), cached recommendation responses of this process are
+    invalidated afterwards (other processes with the next version refresh)."""
+    res = await run_in_threadpool(func, *args)
+    response_versions.touch()
+    return res
+
+
 @api_router.put("")
-def collaborative_filtering_builder(auth: str = Depends(check_basic_auth),
-                                    base: str = 'item'):
-    """Runs CF builder and stores reco in db."""
+async def collaborative_filtering_builder(auth: str = Depends(check_basic_auth),
+                                          base: str = 'item',
+                                          use_rollup: bool = EVIDENCE_PIPELINE_USE_ROLLUP):
+    """Runs CF builder and stores reco in db. With `use_rollup` the builder reads evidence rollups instead of raw
+    evidence. With `RECO_PARTITION_ATTRIBUTES` relations per item partition are built in addition."""
     logger.info(f"Collaborative filtering endpoint called with based {base}")
+    await evidence_buffer.flush()  # build on all acknowledged evidence
+    return await run_build(run_collaborative_filtering_builder, use_rollup)
 
-    evidence_pipeline = EvidencePipeline()
 
-    cfb = CollaborativeFilteringBuilder(df=evidence_pipeline.get_raw_evidence())
+def run_collaborative_filtering_builder(use_rollup: bool):
+    """Runs CF builder synchronously (called in threadpool since builder blocks)."""
+    from api.core.services.builder.CollaborativeFilteringBuilder import CollaborativeFilteringBuilder  # numpy, scipy
+    evidence_pipeline = EvidencePipeline(use_rollup=use_rollup)
+    profiler = BuildProfiler(CollaborativeFilteringBuilder.__name__)
+    with profiler.stage('get_rollup_evidence' if use_rollup else 'get_raw_evidence'):
+        df = evidence_pipeline.get_evidence()
+    profiler.annotate(rows=len(df))
+    items = None
+    if partitioning:
+        with profiler.stage('get_items'):
+            with MongoDBHelper(cfg.DB_NAME) as db:
+                items = list(db[cfg.COLLECTION_NAME_ITEM].find({}, {'_id': 0, cfg.COLUMN_ITEM_CODE: 1,
+                                                                    **{a: 1 for a in partitioning.attributes}}))
+
+    cfb = CollaborativeFilteringBuilder(df=df, profiler=profiler, items=items)
     cfb.run()
     cfb.store_relations()
+    report = cfb.store_build_history(used_evidence_size=len(cfb.df),
+                                     inserted_relations=len(cfb.relations),
+                                     use_rollup=use_rollup)
 
     return JSONResponse(content={'builder': str(cfb.__class__),
                                  'status': 'successful',
                                  'used_evidence_size': len(cfb.df),
-                                 'inserted_relations': len(cfb.relations)},
+                                 'inserted_relations': len(cfb.relations),
+                                 'profile': report},
+                        status_code=status.HTTP_201_CREATED)
+
+
+@api_router.put(ENDPOINT_ALS)
+async def implicit_als_builder(auth: str = Depends(check_basic_auth),
+                               factors: int = cfg.ALS_FACTORS,
+                               iterations: int = cfg.ALS_ITERATIONS,
+                               user_relations: bool = False,
+                               use_rollup: bool = EVIDENCE_PIPELINE_USE_ROLLUP):
+    """Runs implicit ALS builder and stores item-to-item (and with `user_relations` user-to-item) relations in db.
+    Factors are written to `ALS_FACTOR_PATH` when set."""
+    logger.info(f"Implicit ALS endpoint called with {factors} factors and {iterations} iterations")
+    await evidence_buffer.flush()
+    return await run_build(run_implicit_als_builder, factors, iterations, user_relations, use_rollup)
+
+
+def run_implicit_als_builder(factors: int, iterations: int, user_relations: bool, use_rollup: bool):
+    """Runs implicit ALS builder synchronously (called in threadpool since builder blocks)."""
+    from api.core.services.builder.ImplicitALSBuilder import ImplicitALSBuilder  # numpy, scipy
+    evidence_pipeline = EvidencePipeline(use_rollup=use_rollup)
+    profiler = BuildProfiler(ImplicitALSBuilder.__name__)
+    with profiler.stage('get_rollup_evidence' if use_rollup else 'get_raw_evidence'):
+        df = evidence_pipeline.get_evidence()
+    profiler.annotate(rows=len(df))
+
+    builder = ImplicitALSBuilder(df=df, factors=factors, iterations=iterations, user_relations=user_relations,
+                                 profiler=profiler)
+    builder.run()
+    builder.store_relations()
+    if cfg.ALS_FACTOR_PATH:
+        builder.save_factors(cfg.ALS_FACTOR_PATH)
+    report = builder.store_build_history(used_evidence_size=len(df),
+                                         inserted_relations=len(builder.relations),
+                                         use_rollup=use_rollup,
+                                         factors=factors,
+                                         iterations=iterations)
+
+    return JSONResponse(content={'builder': str(builder.__class__),
+                                 'status': 'successful',
+                                 'used_evidence_size': len(df),
+                                 'inserted_relations': len(builder.relations),
+                                 'profile': report},
+                        status_code=status.HTTP_201_CREATED)
+
+
+@api_router.put(ENDPOINT_CONTENT_BASED)
+async def content_based_builder(auth: str = Depends(check_basic_auth),
+                                n_recos: int = cfg.CB_N_RECOS):
+    """Runs content-based builder on all items and replaces content-based relations in db. With
+    `CB_INCREMENTAL_ENABLED` the built index is used for incremental updates on item upserts."""
+    logger.info(f"Content-based endpoint called with {n_recos} relations per item")
+    return await run_build(run_content_based_builder, n_recos, asyncio.get_event_loop())
+
+
+def run_content_based_builder(n_recos: int, loop: asyncio.AbstractEventLoop):
+    """Runs content-based builder synchronously (called in threadpool since builder blocks), the index is replaced
+    in the event loop `loop` (waits for running incremental updates)."""
+    from api.core.services.builder.ContentBasedBuilder import ContentBasedBuilder  # numpy, scipy
+    profiler = BuildProfiler(ContentBasedBuilder.__name__)
+    with profiler.stage('get_items'):
+        with MongoDBHelper(cfg.DB_NAME) as db:
+            items = list(db[cfg.COLLECTION_NAME_ITEM].find())
+    profiler.annotate(rows=len(items))
+
+    builder = ContentBasedBuilder(items=items, n_recos=n_recos, profiler=profiler)
+    builder.run()
+    builder.store_relations()
+    if cfg.CB_INCREMENTAL_ENABLED:
+        asyncio.run_coroutine_threadsafe(content_index.replace(builder.index), loop).result()
+    report = builder.store_build_history(used_items=len(items),
+                                         inserted_relations=len(builder.relations),
+                                         n_recos=n_recos)
+
+    return JSONResponse(content={'builder': str(builder.__class__),
+                                 'status': 'successful',
+                                 'used_items': len(items),
+                                 'inserted_relations': len(builder.relations),
+                                 'profile': report},
+                        status_code=status.HTTP_201_CREATED)
+
+
+@api_router.put(ENDPOINT_USER)
+async def user_item_builder(auth: str = Depends(check_basic_auth),
+                            n_recos: int = cfg.USER_RECO_N_RECOS,
+                            neighbours: int = cfg.USER_RECO_NEIGHBOURS,
+                            use_rollup: bool = EVIDENCE_PIPELINE_USE_ROLLUP):
+    """Runs user-to-item builder and replaces the precomputed recommended items of all users in db."""
+    logger.info(f"User-to-item endpoint called with {n_recos} items per user and {neighbours} neighbours per item")
+    await evidence_buffer.flush()
+    return await run_build(run_user_item_builder, n_recos, neighbours, use_rollup)
+
+
+def run_user_item_builder(n_recos: int, neighbours: int, use_rollup: bool):
+    """Runs user-to-item builder synchronously (called in threadpool since builder blocks)."""
+    from api.core.services.builder.UserItemBuilder import UserItemBuilder  # numpy, pandas, scipy
+    evidence_pipeline = EvidencePipeline(use_rollup=use_rollup)
+    profiler = BuildProfiler(UserItemBuilder.__name__)
+    with profiler.stage('get_rollup_evidence' if use_rollup else 'get_raw_evidence'):
+        df = evidence_pipeline.get_evidence()
+    profiler.annotate(rows=len(df))
+
+    builder = UserItemBuilder(df=df, n_recos=n_recos, neighbours=neighbours, profiler=profiler)
+    builder.run()
+    builder.store_relations()
+    report = builder.store_build_history(used_evidence_size=len(df),
+                                         inserted_users=len(builder.relations),
+                                         use_rollup=use_rollup,
+                                         n_recos=n_recos,
+                                         neighbours=neighbours)
+
+    return JSONResponse(content={'builder': str(builder.__class__),
+                                 'status': 'successful',
+                                 'used_evidence_size': len(df),
+                                 'inserted_users': len(builder.relations),
+                                 'profile': report},
                         status_code=status.HTTP_201_CREATED)
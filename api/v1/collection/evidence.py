@@ -1,46 +1,57 @@
 import logging
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Request
 import api.core.services.collection.evidence as service_evidence
 from api.core.db.models.evidence import BasicEvidenceModel
 from api.core.services.authentification.basic_auth import check_basic_auth
+from api.core.services.collection.evidence_format import EVIDENCE_REQUEST_BODY
 
 from api.core.util.config import ENDPOINT_COLLECTION, TAG_EVIDENCE, ENDPOINT_EVIDENCE
 
 from api.core.db.mongodb import AsyncIOMotorClient, get_database
+from api.core.db.storage import Storage, get_storage
+from api.core.util.ndjson import MEDIA_TYPE_NDJSON
 
 api_router = APIRouter(prefix=ENDPOINT_COLLECTION + ENDPOINT_EVIDENCE, tags=[TAG_EVIDENCE])
 
 logger = logging.getLogger(__name__)
 
 
-@api_router.get("/all", response_model=List[BasicEvidenceModel])
+@api_router.get("/all", responses={200: {'content': {MEDIA_TYPE_NDJSON: {}}}})
 async def get_all_evidence(auth: str = Depends(check_basic_auth),
-                           db: AsyncIOMotorClient = Depends(get_database)):
-    """Lists all evidence objects from db."""
-    return await service_evidence.get_all_evidence(db)
+                           db: AsyncIOMotorClient = Depends(get_database),
+                           after: Optional[str] = None,
+                           limit: Optional[int] = None,
+                           fields: Optional[str] = None,
+                           start: Optional[datetime] = None,
+                           end: Optional[datetime] = None):
+    """Streams evidence objects from db as NDJSON ordered by `_id`. Pass `_id` of the last line as `after` to fetch
+    the next page, `fields` (comma separated) to limit returned attributes and `start`/`end` to filter by timestamp."""
+    return await service_evidence.get_all_evidence(db, after, limit, fields, start, end)
 
 
 @api_router.get("", response_model=List[BasicEvidenceModel])
 async def get_evidence_for_user(user_uid: str,
                                 auth: str = Depends(check_basic_auth),
-                                db: AsyncIOMotorClient = Depends(get_database)):
+                                db: Storage = Depends(get_storage)):
     return await service_evidence.get_evidence_for_user(db, user_uid)
 
 
-@api_router.put("", response_model=int)
-async def put_evidence(object_list: List[BasicEvidenceModel],
-                       req: Request,
-                       conn: AsyncIOMotorClient = Depends(get_database)):
-    """Adds a list of evidence models into MongoDB, returns number of inserted evidence objects."""
-    object_list = await service_evidence.process_evidence(req, object_list)
-    return await service_evidence.create_evidence(conn, object_list)
+@api_router.put("", response_model=int, openapi_extra=EVIDENCE_REQUEST_BODY)
+async def put_evidence(req: Request,
+                       conn: Storage = Depends(get_storage)):
+    """Adds a list of evidence models into MongoDB, returns number of accepted evidence objects. Request body is a
+    JSON array, NDJSON or msgpack batch (optionally gzip compressed, see `evidence_format`). Evidence is persisted
+    write-behind (see evidence buffer), HTTP 429 is returned when the buffer is full."""
+    documents = await service_evidence.process_evidence(req)
+    return await service_evidence.create_evidence(conn, documents)
 
 
 @api_router.delete("", response_model=int)
 async def delete_evidence_for_user(user_uid: str,
                                    auth: str = Depends(check_basic_auth),
-                                   conn: AsyncIOMotorClient = Depends(get_database)):
+                                   conn: Storage = Depends(get_storage)):
     """Deletes all evidence entries for given user uid and returns number of deleted documents."""
     return await service_evidence.delete_evidence(conn, user_uid)
@@ -1,42 +1,59 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Body
+from fastapi import APIRouter, Depends, Body, Request
 import api.core.services.collection.item as service_item
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from api.core.db.models.item import BasicItemModel
 from api.core.db.mongodb import get_database
+from api.core.db.storage import Storage, get_storage
 from api.core.services.authentification.basic_auth import check_basic_auth
-from api.core.util.config import ENDPOINT_ITEM, ENDPOINT_COLLECTION, TAG_ITEM
+from api.core.util.config import ENDPOINT_ITEM, ENDPOINT_COLLECTION, TAG_ITEM, ENDPOINT_IMPORT
+from api.core.util.ndjson import MEDIA_TYPE_NDJSON, is_gzip
 
 api_router = APIRouter(prefix=ENDPOINT_COLLECTION + ENDPOINT_ITEM, tags=[TAG_ITEM])
 
 
-@api_router.get("/all", response_model=List[BasicItemModel])
+@api_router.get("/all", responses={200: {'content': {MEDIA_TYPE_NDJSON: {}}}})
 async def get_all_items(auth: str = Depends(check_basic_auth),
-                        db: AsyncIOMotorClient = Depends(get_database)):
-    """Lists all evidence objects from db."""
-    return await service_item.get_all_items(db)
+                        db: AsyncIOMotorClient = Depends(get_database),
+                        after: Optional[str] = None,
+                        limit: Optional[int] = None,
+                        fields: Optional[str] = None):
+    """Streams item objects from db as NDJSON ordered by `_id`. Pass `_id` of the last line as `after` to fetch the
+    next page and `fields` (comma separated) to limit returned attributes."""
+    return await service_item.get_all_items(db, after, limit, fields)
 
 
 @api_router.get("", response_model=BasicItemModel)
 async def get_items_by_id(item_id: str,
-                          db: AsyncIOMotorClient = Depends(get_database)):
+                          db: Storage = Depends(get_storage)):
     """Returns items by id."""
     return await service_item.get_item_by_item_id(db, item_id)
 
 
 @api_router.post("", response_model=str)
 async def post_items(auth: str = Depends(check_basic_auth),
-                     db: AsyncIOMotorClient = Depends(get_database),
+                     db: Storage = Depends(get_storage),
                      item_models: List[BasicItemModel] = Body(...)):
     """Adds and/or updates (by item ID) a list of item model entries into database."""
     return await service_item.create_or_update_items(db, item_models)
 
 
+@api_router.post(ENDPOINT_IMPORT, response_model=dict,
+                 openapi_extra={'requestBody': {'content': {MEDIA_TYPE_NDJSON: {}, 'application/gzip': {}}}})
+async def import_items(req: Request,
+                       auth: str = Depends(check_basic_auth),
+                       db: Storage = Depends(get_storage)):
+    """Streams NDJSON request body (one item model per line, optionally gzip compressed) into database. Returns
+    number of inserted, updated and failed items."""
+    gzip = is_gzip(req.headers.get('content-type'), req.headers.get('content-encoding'))
+    return await service_item.import_items(db, req.stream(), gzip=gzip)
+
+
 @api_router.delete("", response_model=int)
 async def delete_items_by_item_id(item_id: str,
                                   auth: str = Depends(check_basic_auth),
-                                  db: AsyncIOMotorClient = Depends(get_database)):
+                                  db: Storage = Depends(get_storage)):
     """Deletes items with id [item_id] and returns number of deleted entries."""
     return await service_item.delete_items_by_item_id(db, item_id)
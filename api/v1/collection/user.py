@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Request, Body
 from pydantic import BaseModel
@@ -8,22 +8,29 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from api.core.db.models.user import BasicUserModel
 from api.core.db.mongodb import get_database
+from api.core.db.storage import Storage, get_storage
 from api.core.services.authentification.basic_auth import check_basic_auth
 
 from api.core.util.config import ENDPOINT_COLLECTION, ENDPOINT_USER, TAG_USER
+from api.core.util.ndjson import MEDIA_TYPE_NDJSON
 
 api_router = APIRouter(prefix=ENDPOINT_COLLECTION + ENDPOINT_USER, tags=[TAG_USER])
 
 
-@api_router.get("/all", response_model=List[BasicUserModel])
+@api_router.get("/all", responses={200: {'content': {MEDIA_TYPE_NDJSON: {}}}})
 async def get_all_user(auth: str = Depends(check_basic_auth),
-                       db: AsyncIOMotorClient = Depends(get_database)):
-    return await service_user.get_all_user(db)
+                       db: AsyncIOMotorClient = Depends(get_database),
+                       after: Optional[str] = None,
+                       limit: Optional[int] = None,
+                       fields: Optional[str] = None):
+    """Streams user objects from db as NDJSON ordered by `_id`. Pass `_id` of the last line as `after` to fetch the
+    next page and `fields` (comma separated) to limit returned attributes."""
+    return await service_user.get_all_user(db, after, limit, fields)
 
 
 @api_router.get("/id", response_model=BasicUserModel)
 async def get_user(auth: str = Depends(check_basic_auth),
-                   db: AsyncIOMotorClient = Depends(get_database),
+                   db: Storage = Depends(get_storage),
                    reco2js_id: str = None):
     """Returns most probabilistic user matching keys. Returns dummy user when none is found."""
     return await service_user.get_user_by_reco2js_id(db, reco2js_id)
@@ -32,7 +39,7 @@ async def get_user(auth: str = Depends(check_basic_auth),
 @api_router.post("", response_model=str)
 async def user_unique_identifier(req: Request,
                                  user: dict = Body(...),
-                                 db: AsyncIOMotorClient = Depends(get_database)):
+                                 db: Storage = Depends(get_storage)):
     """Returns most probabilistic user uid matching reco2js_id from header or creates new user when none is found,
     takes body and inserts or updates data."""
     user = await service_user.get_or_upsert_unique_user(db, req, user)
@@ -41,7 +48,7 @@ async def user_unique_identifier(req: Request,
 
 # @api_router.post("")
 # async def post_user(auth: str = Depends(check_basic_auth),
-#                     db: AsyncIOMotorClient = Depends(get_database),
+#                     db: Storage = Depends(get_storage),
 #                     user: BasicUserModel = Body(...)):
 #     """Adds a new user model entry into database (no identity check)."""
 #     return await service_user.create_user(db, user)
@@ -50,6 +57,6 @@ async def user_unique_identifier(req: Request,
 @api_router.delete("", response_model=int)
 async def delete_users_by_reco2js_id(reco2js_id: str,
                                      auth: str = Depends(check_basic_auth),
-                                     db: AsyncIOMotorClient = Depends(get_database)):
+                                     db: Storage = Depends(get_storage)):
     """Deletes users that contain reco2js_id and returns number of deleted entries."""
     return await service_user.delete_users_by_reco2js_id(db, reco2js_id)
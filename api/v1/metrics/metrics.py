@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from api.core.util.config import ENDPOINT_METRICS
+from api.core.util.metrics import registry, CONTENT_TYPE_PROMETHEUS
+
+api_metrics_router = APIRouter()
+
+
+@api_metrics_router.get(ENDPOINT_METRICS, include_in_schema=False)
+async def metrics():
+    """Exposes metrics in Prometheus text format."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE_PROMETHEUS)
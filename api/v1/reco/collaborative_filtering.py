@@ -1,30 +1,132 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 import api.core.util.config as cfg
 from api.core.db.models.item import BasicItemModel
-from api.core.db.mongodb import get_database
+from api.core.db.storage import Storage, get_storage
+from api.core.util.tracing import TracedRoute
 import api.core.services.reco.recommendation as rec_service
+from api.core.services.reco.fallback import with_budget
+from api.core.services.reco.partitions import partitioning
 from api.core.util.config import ENDPOINT_RECOMMENDATION, TAG_RECOMMENDATIONS, ENDPOINT_PERSONALIZED, \
-    ENDPOINT_COLLABORATIVE_FILTERING
+    ENDPOINT_COLLABORATIVE_FILTERING, ENDPOINT_ALS, ENDPOINT_CONTENT_BASED, ENDPOINT_SESSION, ENDPOINT_USER
 
-api_router = APIRouter(prefix=ENDPOINT_RECOMMENDATION + ENDPOINT_PERSONALIZED, tags=[TAG_RECOMMENDATIONS])
+api_router = APIRouter(prefix=ENDPOINT_RECOMMENDATION + ENDPOINT_PERSONALIZED, tags=[TAG_RECOMMENDATIONS],
+                       route_class=TracedRoute)
 
 
 @api_router.get(ENDPOINT_COLLABORATIVE_FILTERING, response_model=List[BasicItemModel])
-async def get_collaborative_filtering(item_id_seed: int,
+async def get_collaborative_filtering(item_id_seed: str,
+                                      req: Request,
+                                      response: Response,
                                       base: str = "item",
                                       n_recos: int = cfg.N_RECOS_DEFAULT,
-                                      db: AsyncIOMotorClient = Depends(get_database)):
-    """Return list of items from collaborative filtering given a seed item ID.
+                                      partition: str = None,
+                                      db: Storage = Depends(get_storage)):
+    """Return list of items from collaborative filtering given a seed item ID (fallback items when latency budget is
+    exceeded, see `with_budget`).
     Args:
-        item_id_seed (int): ID of seed item that is used for finding item-wise similar items.
+        item_id_seed (str): ID of seed item that is used for finding item-wise similar items.
+        req (Request): Object to retrieve identifying values from call (consumed items of user are excluded).
+        response (Response): Response object (receives fallback header).
         base (str): Type of filtering, i.e. "item" or "used".
-        db (Session): Session object used for retrieving items from db.
+        db (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
+        partition (str, optional): Only items of partition, e.g. "type=product,price=10-50" (`RECO_PARTITION_*`).
     Returns:
         List[Item]: List of similar (item-wise) items.
     """
-    return await rec_service.get_collaborative_filtering_items(db, item_id_seed=item_id_seed, base=base,
-                                                               n_recos=n_recos)
+    try:
+        partition = partitioning.key(partition)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    items = await with_budget(response, "cf", cfg.RECO_LATENCY_BUDGET_MS_PERS, n_recos,
+                              rec_service.get_collaborative_filtering_items, db, item_id_seed=item_id_seed, base=base,
+                              n_recos=n_recos, user_uid=req.headers.get(cfg.RECO_USER_UID), partition=partition)
+    if partition and cfg.HEADER_RECO_FALLBACK in response.headers:
+        items = [i for i in items if partitioning.matches(partition, i.dict())]
+    return items
+
+
+@api_router.get(ENDPOINT_ALS, response_model=List[BasicItemModel])
+async def get_als(item_id_seed: str,
+                  req: Request,
+                  response: Response,
+                  n_recos: int = cfg.N_RECOS_DEFAULT,
+                  db: Storage = Depends(get_storage)):
+    """Return list of items with most similar latent factors (implicit ALS builder) given a seed item ID (fallback
+    items when latency budget is exceeded, see `with_budget`).
+    Args:
+        item_id_seed (str): ID of seed item that is used for finding similar items.
+        req (Request): Object to retrieve identifying values from call (consumed items of user are excluded).
+        response (Response): Response object (receives fallback header).
+        db (Storage): Storage used for retrieving items.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[Item]: List of similar items.
+    """
+    return await with_budget(response, "als", cfg.RECO_LATENCY_BUDGET_MS_PERS, n_recos,
+                             rec_service.get_als_items, db, item_id_seed=item_id_seed, n_recos=n_recos,
+                             user_uid=req.headers.get(cfg.RECO_USER_UID))
+
+
+@api_router.get(ENDPOINT_CONTENT_BASED, response_model=List[BasicItemModel])
+async def get_content_based(item_id_seed: str,
+                            req: Request,
+                            response: Response,
+                            n_recos: int = cfg.N_RECOS_DEFAULT,
+                            db: Storage = Depends(get_storage)):
+    """Return list of items with most similar metadata (content-based builder) given a seed item ID, also for new
+    items without evidence (fallback items when latency budget is exceeded, see `with_budget`).
+    Args:
+        item_id_seed (str): ID of seed item that is used for finding similar items.
+        req (Request): Object to retrieve identifying values from call (consumed items of user are excluded).
+        response (Response): Response object (receives fallback header).
+        db (Storage): Storage used for retrieving items.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[Item]: List of similar items.
+    """
+    return await with_budget(response, "cb", cfg.RECO_LATENCY_BUDGET_MS_PERS, n_recos,
+                             rec_service.get_content_based_items, db, item_id_seed=item_id_seed, n_recos=n_recos,
+                             user_uid=req.headers.get(cfg.RECO_USER_UID))
+
+
+@api_router.get(ENDPOINT_SESSION, response_model=List[BasicItemModel])
+async def get_session(req: Request,
+                      response: Response,
+                      n_recos: int = cfg.N_RECOS_DEFAULT,
+                      db: Storage = Depends(get_storage)):
+    """Return list of items recommended from the user's recent interactions (user uid from request header, fallback
+    items for users without recent interactions or when latency budget is exceeded, see `with_budget`).
+    Args:
+        req (Request): Object to retrieve identifying values from call.
+        response (Response): Response object (receives fallback header).
+        db (Storage): Storage used for retrieving items.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[Item]: List of recommended items.
+    """
+    return await with_budget(response, "session", cfg.RECO_LATENCY_BUDGET_MS_PERS, n_recos,
+                             rec_service.get_session_items, db, user_uid=req.headers.get(cfg.RECO_USER_UID),
+                             n_recos=n_recos)
+
+
+@api_router.get(ENDPOINT_USER, response_model=List[BasicItemModel])
+async def get_user(req: Request,
+                   response: Response,
+                   n_recos: int = cfg.N_RECOS_DEFAULT,
+                   db: Storage = Depends(get_storage)):
+    """Return precomputed list of items for the user (user-to-item builder, user uid from request header, fallback
+    items for users without precomputed items or when latency budget is exceeded, see `with_budget`).
+    Args:
+        req (Request): Object to retrieve identifying values from call.
+        response (Response): Response object (receives fallback header).
+        db (Storage): Storage used for retrieving items.
+        n_recos (int): Number of items that should be returned.
+    Returns:
+        List[Item]: List of recommended items.
+    """
+    return await with_budget(response, "user", cfg.RECO_LATENCY_BUDGET_MS_PERS, n_recos,
+                             rec_service.get_user_items, db, user_uid=req.headers.get(cfg.RECO_USER_UID),
+                             n_recos=n_recos)
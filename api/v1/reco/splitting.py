@@ -2,32 +2,34 @@ import logging
 from typing import List
 
 from fastapi import APIRouter, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi import Request
+from fastapi import Request, Response
 
 import api.core.services.reco.splitting as service_split
+from api.core.services.reco.fallback import with_budget
 from api.core.db.models.item import BasicItemModel
 from api.core.db.models.splitting import BasicSplittingModel
 
-from api.core.db.mongodb import get_database
+from api.core.db.storage import Storage, get_storage
 from api.core.services.authentification.basic_auth import check_basic_auth
 import api.core.util.config as cfg
+from api.core.util.tracing import TracedRoute
 
-api_router = APIRouter(prefix=cfg.ENDPOINT_RECOMMENDATION + cfg.ENDPOINT_SPLITTING, tags=[cfg.TAG_SPLITTING])
+api_router = APIRouter(prefix=cfg.ENDPOINT_RECOMMENDATION + cfg.ENDPOINT_SPLITTING, tags=[cfg.TAG_SPLITTING],
+                       route_class=TracedRoute)
 
 logger = logging.getLogger(__name__)
 
 
 @api_router.get("/config", response_model=BasicSplittingModel)
 async def get_splitting(name: str,
-                        db: AsyncIOMotorClient = Depends(get_database),
+                        db: Storage = Depends(get_storage),
                         auth: str = Depends(check_basic_auth)):
     splitting = await service_split.get_splitting(db, name)
     return splitting
 
 
 @api_router.get("/config/all", response_model=List[BasicSplittingModel])
-async def get_all_splittings(db: AsyncIOMotorClient = Depends(get_database),
+async def get_all_splittings(db: Storage = Depends(get_storage),
                              auth: str = Depends(check_basic_auth)):
     return await service_split.get_all_splittings(db)
 
@@ -35,7 +37,7 @@ async def get_all_splittings(db: AsyncIOMotorClient = Depends(get_database),
 @api_router.post("/config", response_model=BasicSplittingModel)
 async def set_splitting(name: str,
                         methods: list,
-                        db: AsyncIOMotorClient = Depends(get_database),
+                        db: Storage = Depends(get_storage),
                         auth: str = Depends(check_basic_auth)):
     """Route to create a A/B testing setup."""
     splitting = await service_split.set_splitting(db, name, methods)
@@ -44,7 +46,7 @@ async def set_splitting(name: str,
 
 @api_router.delete("/config", response_model=int)
 async def delete_splitting(name: str,
-                           db: AsyncIOMotorClient = Depends(get_database),
+                           db: Storage = Depends(get_storage),
                            auth: str = Depends(check_basic_auth)):
     return await service_split.delete_splitting(db, name)
 
@@ -52,21 +54,24 @@ async def delete_splitting(name: str,
 @api_router.get("/", response_model=List[BasicItemModel])
 async def get_split_recos(name: str,
                           req: Request,
-                          item_id_seed: int,
-                          db: AsyncIOMotorClient = Depends(get_database),
+                          response: Response,
+                          item_id_seed: str,
+                          db: Storage = Depends(get_storage),
                           n_recos: int = cfg.N_RECOS_DEFAULT):
     """Endpoint that returns split recommendations (= recos from a method that is defined in a splitting).
 
     Args:
         name (str): Name of splitting (used to fetch respective reco algorithms).
         req (Request): Object to retrieve identifying values from call.
+        response (Response): Response object (receives fallback header when latency budget is exceeded).
         item_id_seed (str): ID of item for which reco are needed.
-        db (Session): Session object used for retrieving items from db.
+        db (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
 
     Returns:
         List[Item]: List of recommendations.
     """
     user_uid = req.headers.get(cfg.RECO_USER_UID)
-    return await service_split.get_split_recommendations_by_user_uid(db, name, user_uid,
-                                                                         item_id_seed, n_recos)
+    return await with_budget(response, "split", cfg.RECO_LATENCY_BUDGET_MS_SPLIT, n_recos,
+                             service_split.get_split_recommendations_by_user_uid, db, name, user_uid, item_id_seed,
+                             n_recos)
@@ -1,38 +1,48 @@
 from typing import List
 import api.core.util.config as cfg
-from fastapi import APIRouter, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import APIRouter, Depends, Response
 import api.core.services.reco.recommendation as rec_service
+from api.core.services.reco.fallback import with_budget
 from api.core.db.models.item import BasicItemModel
-from api.core.db.mongodb import get_database
+from api.core.db.storage import Storage, get_storage
+from api.core.util.tracing import TracedRoute
 from api.core.util.config import ENDPOINT_RECOMMENDATION, TAG_RECOMMENDATIONS, ENDPOINT_UNPERSONALIZED
 
-api_router = APIRouter(prefix=ENDPOINT_RECOMMENDATION + ENDPOINT_UNPERSONALIZED, tags=[TAG_RECOMMENDATIONS])
+api_router = APIRouter(prefix=ENDPOINT_RECOMMENDATION + ENDPOINT_UNPERSONALIZED, tags=[TAG_RECOMMENDATIONS],
+                       route_class=TracedRoute)
 
 
 @api_router.get("/random", response_model=List[BasicItemModel])
-async def get_random_items(db: AsyncIOMotorClient = Depends(get_database), n_recos: int = cfg.N_RECOS_DEFAULT):
+async def get_random_items(response: Response,
+                           db: Storage = Depends(get_storage),
+                           n_recos: int = cfg.N_RECOS_DEFAULT):
     """Return list of random items.
 
     Args:
-        db (Session): Session object used for retrieving items from db.
+        response (Response): Response object (receives fallback header when latency budget is exceeded).
+        db (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
 
     Returns:
         List[Item]: List of random items.
     """
-    return await rec_service.get_random_items(db, n_recos)
+    return await with_budget(response, "random", cfg.RECO_LATENCY_BUDGET_MS_UNPERS, n_recos,
+                             rec_service.get_random_items, db, n_recos)
 
 
 @api_router.get("/latest", response_model=List[BasicItemModel])
-async def get_latest_items(db: AsyncIOMotorClient = Depends(get_database), n_recos: int = cfg.N_RECOS_DEFAULT):
+async def get_latest_items(response: Response,
+                           db: Storage = Depends(get_storage),
+                           n_recos: int = cfg.N_RECOS_DEFAULT):
     """Return list of most recently added items.
 
     Args:
-        db (Session): Session object used for retrieving items from db.
+        response (Response): Response object (receives fallback header when latency budget is exceeded).
+        db (Storage): Storage used for retrieving items.
         n_recos (int): Number of items that should be returned.
 
     Returns:
         List[Item]: List of latest n_recos items.
     """
-    return await rec_service.get_latest_items(db, n_recos)
+    return await with_budget(response, "latest", cfg.RECO_LATENCY_BUDGET_MS_UNPERS, n_recos,
+                             rec_service.get_latest_items, db, n_recos)
@@ -0,0 +1,160 @@
+"""Builder benchmark on synthetic evidence (no MongoDB needed).
+
+Runs builders end to end (without storing relations) for a list of scale points and records time and peak memory
+per stage (see `BuildProfiler`). Every scale point runs in a fresh interpreter, so max. RSS is not inflated by
+previous runs and an out-of-memory scale point does not end the benchmark.
+
+    python -m benchmarks.builders --events 10000,100000,1000000 --output report.json
+    python -m benchmarks.builders --events 10000,100000 --baseline report.json  # exit code 1 on regression
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from benchmarks.synthetic import generate_evidence
+
+BUILDERS = ['cf', 'als', 'user']
+
+
+def create_builder(name: str, df, profiler):
+    if name == 'cf':
+        from api.core.services.builder.CollaborativeFilteringBuilder import CollaborativeFilteringBuilder
+        return CollaborativeFilteringBuilder(df, profiler=profiler)
+    if name == 'als':
+        from api.core.services.builder.ImplicitALSBuilder import ImplicitALSBuilder
+        return ImplicitALSBuilder(df, profiler=profiler)
+    if name == 'user':
+        from api.core.services.builder.UserItemBuilder import UserItemBuilder
+        return UserItemBuilder(df, profiler=profiler)
+    raise ValueError(f"Unknown builder {name}, choose from {BUILDERS}")
+
+
+def run_scale_point(builder: str, n_events: int, n_users: Optional[int], n_items: Optional[int],
+                    trace_memory: bool, seed: int) -> dict:
+    """Generates evidence and runs builder in this process, returns result record."""
+    from api.core.services.builder.profiling import BuildProfiler
+
+    start = time.perf_counter()
+    df = generate_evidence(n_events, n_users=n_users, n_items=n_items, seed=seed)
+    result = {'builder': builder,
+              'n_events': n_events,
+              'n_users': int(df['user_id'].nunique()),
+              'n_items': int(df['item_id'].nunique()),
+              'generate_s': round(time.perf_counter() - start, 3)}
+    profiler = BuildProfiler(builder, trace_memory=trace_memory)
+    try:
+        b = create_builder(builder, df, profiler)
+        b.run()
+        result.update(status='ok', n_relations=len(b.relations))
+    except MemoryError as e:
+        result.update(status='error', error=f"MemoryError: {e}")
+    result['profile'] = profiler.report()
+    return result
+
+
+def run_isolated(builder: str, n_events: int, args) -> dict:
+    cmd = [sys.executable, '-m', 'benchmarks.builders', '--single', '--builders', builder, '--events', str(n_events),
+           '--seed', str(args.seed)]
+    if args.users:
+        cmd += ['--users', str(args.users)]
+    if args.items:
+        cmd += ['--items', str(args.items)]
+    if not args.trace_memory:
+        cmd += ['--no-trace-memory']
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'builder': builder, 'n_events': n_events, 'status': 'error',
+                'error': f"exit code {proc.returncode}: {proc.stderr.strip()[-500:]}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def environment() -> dict:
+    import numpy
+    import pandas
+    import scipy
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'created': datetime.utcnow().isoformat(),
+            'git_commit': commit or None,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'packages': {'numpy': numpy.__version__, 'pandas': pandas.__version__, 'scipy': scipy.__version__}}
+
+
+def compare(results: List[dict], baseline: List[dict], max_regression: float) -> List[str]:
+    """Returns regressions (total wall time or peak memory ratio above max_regression) compared to baseline."""
+    base = {(r['builder'], r['n_events']): r for r in baseline if r.get('status') == 'ok'}
+    regressions = []
+    for r in results:
+        b = base.get((r['builder'], r['n_events']))
+        if b is None or r.get('status') != 'ok':
+            continue
+        for metric in ('total_wall_s', 'peak_mb'):
+            old, new = b['profile'][metric], r['profile'][metric]
+            if not (old and new):  # peak memory is 0 when not traced
+                continue
+            ratio = new / old
+            print(f"{r['builder']:>6} {r['n_events']:>10} {metric:>13}: {old:>10} -> {new:>10} ({ratio:.2f}x)")
+            if ratio > max_regression:
+                regressions.append(f"{r['builder']} at {r['n_events']} events: {metric} {ratio:.2f}x")
+    return regressions
+
+
+def print_summary(results: List[dict]):
+    for r in results:
+        if r.get('status') != 'ok':
+            print(f"{r['builder']:>6} {r['n_events']:>10} events: {r['status']} {r.get('error', '')}")
+            continue
+        print(f"{r['builder']:>6} {r['n_events']:>10} events ({r['n_users']} users, {r['n_items']} items): "
+              f"{r['profile']['total_wall_s']:.3f}s, peak {r['profile']['peak_mb']} MB")
+        for s in r['profile']['stages']:
+            print(f"{'':>8}{s['stage']:<24} {s['wall_s']:>10.3f}s {s['cpu_s']:>10.3f}s cpu "
+                  f"{s.get('peak_mb', '-'):>10} MB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark builders on synthetic power-law evidence.")
+    parser.add_argument('--builders', default=','.join(BUILDERS), help=f"comma separated, from {BUILDERS}")
+    parser.add_argument('--events', default='10000,100000', help="comma separated number of events (scale points)")
+    parser.add_argument('--users', type=int, help="distinct users (default: events / 20)")
+    parser.add_argument('--items', type=int, help="distinct items (default: events / 100)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help="do not trace peak memory per stage (tracemalloc slows down builders)")
+    parser.add_argument('--output', help="write JSON report to file")
+    parser.add_argument('--baseline', help="JSON report to compare with")
+    parser.add_argument('--max-regression', type=float, default=1.25,
+                        help="fail when time or memory grows by more than this factor compared to baseline")
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)  # run in this process
+    args = parser.parse_args()
+
+    builders = args.builders.split(',')
+    scale_points = [int(float(n)) for n in args.events.split(',')]
+    if args.single:
+        print(json.dumps(run_scale_point(builders[0], scale_points[0], args.users, args.items,
+                                         args.trace_memory, args.seed)))
+        return
+
+    results = [run_isolated(b, n, args) for b in builders for n in scale_points]
+    report = {**environment(), 'results': results}
+    print_summary(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.max_regression)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
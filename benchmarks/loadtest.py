@@ -0,0 +1,266 @@
+"""Serving load test that drives the ASGI app in-process (no HTTP server, no network).
+
+Requests are either replayed from a JSONL request log (one request per line) or generated from a weighted mix of
+cf, split, random, latest and evidence PUT requests against seeded data. By default the app is backed by the in-memory
+storage (`STORAGE_BACKEND=memory`) seeded with synthetic items, relations, users and a splitting, use `--db-url` for
+a real MongoDB (seeded only for generated workloads, request logs are replayed against the existing data). Memory
+latencies exclude database round trips, use them to compare runs of the harness and to profile the API itself.
+
+Request log lines look like
+
+    {"method": "GET", "path": "/api/v1/rec/pers/cf?item_id_seed=12&n_recos=3", "headers": {}, "body": null}
+
+Usage:
+
+    python -m benchmarks.loadtest --requests 5000 --concurrency 32 --output report.json
+    python -m benchmarks.loadtest --log requests.jsonl --concurrency 64 --baseline report.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+
+DEFAULT_MIX = "cf=40,split=20,random=5,latest=15,evidence=20"
+SPLIT_NAME = "loadtest"
+
+
+async def asgi_request(app, method: str, path: str, headers: Optional[dict] = None, body: bytes = b"") -> int:
+    """Sends a single HTTP request to an ASGI app and returns status code (response body is discarded)."""
+    url = urlsplit(path)
+    raw_headers = [(k.lower().encode(), str(v).encode()) for k, v in (headers or {}).items()]
+    if body:
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method.upper(),
+             "scheme": "http", "path": url.path, "raw_path": url.path.encode(), "root_path": "",
+             "query_string": url.query.encode(), "headers": raw_headers, "client": ("127.0.0.1", 50000),
+             "server": ("testserver", 80)}
+    received = False
+    status = 500
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)  # no disconnect while the app is still running
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def seed_storage(storage, n_items: int, n_users: int, n_neighbours: int, seed: int) -> List[str]:
+    """Inserts items, cf relations, users and a splitting into storage, returns user uids."""
+    import api.core.util.config as cfg
+    rng = random.Random(seed)
+    items = [{"id": str(i), cfg.COLUMN_ITEM_CODE: i, "type": "product", "name": f"Item {i}",
+              "price": round(rng.uniform(1, 200), 2),
+              "created_time": f"2022-01-{1 + i % 28:02d}T00:00:00"} for i in range(1, n_items + 1)]
+    await storage.items.upsert_many(items)
+    await storage.item_codes.insert_many([{"_id": i[cfg.COLUMN_ITEM_CODE], "id": i["id"]} for i in items])
+    relations = [{"type": cfg.TYPE_COLLABORATIVE_FILTERING, "base": "item", "item_id_seed": i,
+                  "item_id_recommended": rng.randint(1, n_items), "similarity": rng.random()}
+                 for i in range(1, n_items + 1) for _ in range(n_neighbours)]
+    await storage.relations.insert_many(relations)
+    users = [{"_id": ObjectId(f"{i:024x}"), "keys": {"reco2js_ids": [f"loadtest-{i}"]}} for i in range(n_users)]
+    for user in users:
+        await storage.users.insert(user)
+    await storage.splittings.upsert(
+        {"name": SPLIT_NAME, "methods": [cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, cfg.TYPE_LATEST]})
+    return [str(u["_id"]) for u in users]
+
+
+def generate_workload(n_requests: int, mix: str, n_items: int, user_uids: List[str], seed: int) -> List[dict]:
+    """Generates requests from a weighted mix, e.g. 'cf=40,split=20,random=5,latest=15,evidence=20'."""
+    import api.core.util.config as cfg
+    rng = random.Random(seed)
+    kinds, weights = zip(*[(k, float(w)) for k, w in (p.split("=") for p in mix.split(","))])
+    prefix = cfg.API_V1_STR
+    popular = [rng.paretovariate(1.2) for _ in range(n_items)]  # skewed seed popularity
+    seeds = rng.choices(range(1, n_items + 1), weights=popular, k=n_requests)
+    requests = []
+    for kind, item_id in zip(rng.choices(kinds, weights=weights, k=n_requests), seeds):
+        user_uid = rng.choice(user_uids)
+        if kind == "cf":
+            r = {"method": "GET", "path": f"{prefix}/rec/pers/cf?item_id_seed={item_id}"}
+        elif kind == "split":
+            r = {"method": "GET", "path": f"{prefix}/rec/split/?name={SPLIT_NAME}&item_id_seed={item_id}",
+                 "headers": {cfg.RECO_USER_UID: user_uid}}
+        elif kind == "random":
+            r = {"method": "GET", "path": f"{prefix}/rec/unpers/random"}
+        elif kind == "latest":
+            r = {"method": "GET", "path": f"{prefix}/rec/unpers/latest"}
+        elif kind == "evidence":
+            r = {"method": "PUT", "path": f"{prefix}/col/evidence", "headers": {cfg.RECO_USER_UID: user_uid},
+                 "body": [{"name": "view_details", "item_id": str(item_id), "path": f"/p/{item_id}"}]}
+        else:
+            raise ValueError(f"Unknown request kind {kind}")
+        requests.append(r)
+    return requests
+
+
+def read_log(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def run_requests(app, requests: List[dict], concurrency: int) -> Tuple[dict, float]:
+    """Runs requests with `concurrency` workers, returns latencies (seconds) and status codes per route and the
+    total wall time."""
+    results = defaultdict(lambda: {"latencies": [], "statuses": defaultdict(int)})
+    queue = asyncio.Queue()
+    for r in requests:
+        queue.put_nowait(r)
+
+    async def worker():
+        while not queue.empty():
+            r = queue.get_nowait()
+            body = r.get("body")
+            headers = dict(r.get("headers") or {})
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body)
+                headers.setdefault("content-type", "application/json")
+            route = f"{r['method'].upper()} {urlsplit(r['path']).path}"
+            start = time.perf_counter()
+            try:
+                status = await asgi_request(app, r["method"], r["path"], headers, (body or "").encode())
+            except Exception:  # unhandled exceptions are 500s in a server
+                status = 500
+            results[route]["latencies"].append(time.perf_counter() - start)
+            results[route]["statuses"][status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return results, time.perf_counter() - start
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values), max(1, math.ceil(q / 100 * len(sorted_values)))) - 1]
+
+
+def summarize(results: dict, wall: float) -> dict:
+    routes = {}
+    for route, r in sorted(results.items()):
+        lat = sorted(r["latencies"])
+        routes[route] = {"count": len(lat),
+                         "errors": sum(n for s, n in r["statuses"].items() if s >= 500),
+                         "statuses": {str(s): n for s, n in r["statuses"].items()},
+                         "throughput_rps": round(len(lat) / wall, 2),
+                         **{f"p{q}_ms": round(percentile(lat, q) * 1000, 3) for q in (50, 95, 99)}}
+    total = sum(r["count"] for r in routes.values())
+    return {"wall_s": round(wall, 3), "requests": total, "throughput_rps": round(total / wall, 2), "routes": routes}
+
+
+def print_summary(summary: dict):
+    print(f"{summary['requests']} requests in {summary['wall_s']}s ({summary['throughput_rps']} req/s)")
+    print(f"{'route':<40} {'count':>7} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, r in summary["routes"].items():
+        print(f"{route:<40} {r['count']:>7} {r['errors']:>7} {r['throughput_rps']:>9} {r['p50_ms']:>9} "
+              f"{r['p95_ms']:>9} {r['p99_ms']:>9}")
+
+
+def compare(summary: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Returns routes whose p95 latency grew by more than max_regression compared to baseline."""
+    regressions = []
+    for route, r in summary["routes"].items():
+        b = baseline["routes"].get(route)
+        if b and b["p95_ms"] and r["p95_ms"] / b["p95_ms"] > max_regression:
+            regressions.append(f"{route}: p95 {b['p95_ms']} ms -> {r['p95_ms']} ms")
+    return regressions
+
+
+async def run(args) -> dict:
+    import api.core.util.config as cfg
+    from api.core.db.mongodb import db
+    from api.core.db.mongodb_utils import connect_to_mongo_db, close_mongo_db_connection
+    from api.core.db.storage import storage_holder
+    from main import app
+
+    client = None
+    if args.db_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.db_url)
+    cfg.STORAGE_BACKEND = "mongodb" if args.db_url else "memory"
+    cfg.DB_NAME = args.db_name
+    db.client = client
+    for handler in app.router.on_startup:  # startup without (re)connecting to the configured MongoDB
+        if handler is not connect_to_mongo_db:
+            await handler()
+    storage = storage_holder.storage
+
+    if not args.db_url:  # user ids are deterministic, so saved workloads can be replayed against memory storage
+        user_uids = await seed_storage(storage, args.items, args.users, args.neighbours, args.seed)
+    if args.log:
+        requests = read_log(args.log)
+    else:
+        if args.db_url:
+            user_uids = await seed_storage(storage, args.items, args.users, args.neighbours, args.seed)
+        requests = generate_workload(args.requests, args.mix, args.items, user_uids, args.seed)
+        if args.save_workload:
+            with open(args.save_workload, "w") as f:
+                f.writelines(json.dumps(r) + "\n" for r in requests)
+    if args.warmup:
+        await run_requests(app, requests[:args.warmup], args.concurrency)
+    results, wall = await run_requests(app, requests, args.concurrency)
+
+    for handler in app.router.on_shutdown:
+        if handler is not close_mongo_db_connection:
+            await handler()
+    if client is not None:
+        if args.drop:
+            await client.drop_database(args.db_name)
+        client.close()
+    return {"concurrency": args.concurrency, "source": args.log or args.mix, **summarize(results, wall)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test of the reco API (ASGI).")
+    parser.add_argument("--log", help="JSONL request log to replay (otherwise a workload is generated)")
+    parser.add_argument("--requests", type=int, default=1000, help="number of generated requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted request mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent before measuring")
+    parser.add_argument("--items", type=int, default=300, help="seeded items (item ids 1..items)")
+    parser.add_argument("--users", type=int, default=200, help="seeded users")
+    parser.add_argument("--neighbours", type=int, default=10, help="seeded cf relations per item")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-workload", help="write generated requests as JSONL (replay with --log)")
+    parser.add_argument("--db-url", help="use MongoDB at this URL instead of memory storage")
+    parser.add_argument("--db-name", default="loadtest")
+    parser.add_argument("--drop", action="store_true", help="drop --db-name database after the run (with --db-url)")
+    parser.add_argument("--output", help="write JSON report to file")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--max-regression", type=float, default=1.25,
+                        help="fail when p95 latency of a route grows by more than this factor compared to baseline")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Import time and memory of application entry points, each measured in a fresh interpreter.
+
+    python -m benchmarks.startup                      # main:app (with builder routes) and serving:app
+    python -m benchmarks.startup --entry-points serving --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = ['main', 'serving']
+
+MEASURE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss = rss if sys.platform == 'darwin' else rss * 1024
+heavy = sorted(m for m in ('numpy', 'pandas', 'scipy') if m in sys.modules)
+print(json.dumps({{'import_s': elapsed, 'max_rss_mb': rss / 2 ** 20, 'heavy_modules': heavy}}))
+"""
+
+
+def measure(module: str) -> dict:
+    proc = subprocess.run([sys.executable, '-c', MEASURE.format(module=module)], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed: {proc.stderr.strip()[-500:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and max. RSS of app entry points.")
+    parser.add_argument('--entry-points', default=','.join(ENTRY_POINTS), help=f"comma separated, from {ENTRY_POINTS}")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per entry point (median is reported)")
+    parser.add_argument('--output', help="write JSON report to file")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.entry_points.split(','):
+        runs = [measure(module) for _ in range(args.repeat)]
+        result = {'entry_point': module,
+                  'import_s': round(statistics.median(r['import_s'] for r in runs), 3),
+                  'max_rss_mb': round(statistics.median(r['max_rss_mb'] for r in runs), 1),
+                  'heavy_modules': runs[0]['heavy_modules']}
+        results.append(result)
+        print(f"{module:>10}: import {result['import_s']:.3f}s, max. RSS {result['max_rss_mb']} MB, "
+              f"heavy modules: {', '.join(result['heavy_modules']) or '-'}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
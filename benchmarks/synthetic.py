@@ -0,0 +1,55 @@
+"""Synthetic evidence with power-law (Zipf like) user and item popularity."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import api.core.util.config as cfg
+
+EVIDENCE_NAMES = np.array(["view_details", "add_to_cart", "purchase"])
+EVIDENCE_NAME_P = np.array([0.85, 0.1, 0.05])
+
+
+def power_law_p(n: int, alpha: float) -> np.ndarray:
+    """Probabilities proportional to 1 / rank^alpha for ranks 1..n."""
+    p = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** alpha
+    return p / p.sum()
+
+
+def generate_evidence(n_events: int,
+                      n_users: int = None,
+                      n_items: int = None,
+                      alpha_users: float = 1.0,
+                      alpha_items: float = 1.1,
+                      days: int = 30,
+                      seed: int = 42) -> pd.DataFrame:
+    """Generates evidence in the format of `EvidencePipeline.get_raw_evidence`.
+
+    Args:
+        n_events (int): Number of evidence rows.
+        n_users (int, optional): Number of distinct users, defaults to n_events / 20.
+        n_items (int, optional): Number of distinct items, defaults to n_events / 100.
+        alpha_users (float): Power-law exponent of user activity.
+        alpha_items (float): Power-law exponent of item popularity.
+        days (int): Evidence timestamps are spread uniformly over the last `days` days.
+        seed (int): Random seed (same arguments produce the same evidence).
+    Returns:
+        pd.DataFrame: Evidence with columns user_id, item_id (item codes, see `EvidencePipeline`), name and
+            timestamp.
+    """
+    n_users = n_users or max(n_events // 20, 1)
+    n_items = n_items or max(n_events // 100, 1)
+    rng = np.random.default_rng(seed)
+    users = rng.choice(n_users, size=n_events, p=power_law_p(n_users, alpha_users))
+    items = rng.choice(n_items, size=n_events, p=power_law_p(n_items, alpha_items))
+    # shuffle ids, otherwise popularity correlates with id
+    users = rng.permutation(n_users)[users]
+    items = rng.permutation(n_items)[items]
+    now = datetime.utcnow()
+    seconds = rng.integers(0, days * 24 * 3600, size=n_events)
+    return pd.DataFrame({
+        cfg.COLUMN_USER_ID: pd.Series(users).map("u{}".format),
+        cfg.COLUMN_ITEM_ID: items.astype(np.int32),
+        cfg.COLUMN_NAME: rng.choice(EVIDENCE_NAMES, size=n_events, p=EVIDENCE_NAME_P),
+        'timestamp': pd.to_datetime(now - timedelta(days=days)) + pd.to_timedelta(seconds, unit='s'),
+    })
@@ -0,0 +1,4 @@
+"""Serving-only entry point without builder routes, e.g. `gunicorn -k uvicorn.workers.UvicornWorker serving:app`."""
+from api.app import create_app
+
+app = create_app(include_builder=False)
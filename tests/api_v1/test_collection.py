@@ -1,5 +1,8 @@
+import json
+
 from requests.auth import HTTPBasicAuth
 import api.core.util.config as cfg
+from tests.conftest import requires_mongodb
 
 
 class TestCollectionAPI:
@@ -13,9 +16,19 @@ class TestCollectionAPI:
         response = test_client.post("/api/v1/col/item", json=test_items, auth=HTTPBasicAuth('admin', 'nimda'))
         assert response.status_code == 201
 
+    @requires_mongodb
     def test_get_all_items(self, test_client, test_items):
         response = test_client.get("/api/v1/col/item/all", auth=HTTPBasicAuth('admin', 'nimda'))
-        assert len(response.json()) == len(test_items)
+        assert len(response.text.splitlines()) == len(test_items)
+
+    @requires_mongodb
+    def test_get_all_items_paginated(self, test_client, test_items):
+        response = test_client.get("/api/v1/col/item/all?limit=2&fields=id", auth=HTTPBasicAuth('admin', 'nimda'))
+        page = [json.loads(line) for line in response.text.splitlines()]
+        assert len(page) == 2 and set(page[0].keys()) == {"_id", "id"}
+        response = test_client.get(f"/api/v1/col/item/all?after={page[-1]['_id']}",
+                                   auth=HTTPBasicAuth('admin', 'nimda'))
+        assert len(response.text.splitlines()) == len(test_items) - 2
 
     def test_get_item_by_id(self, test_client):
         item_id = str(415)
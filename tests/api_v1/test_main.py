@@ -6,3 +6,9 @@ class TestAPI:
     def test_redirect(self, test_client):
         response = test_client.get("/")
         assert response.request.path_url == "/docs"
+
+    def test_metrics(self, test_client):
+        test_client.get("/docs")
+        response = test_client.get("/metrics")
+        assert response.status_code == 200
+        assert 'http_requests_total{method="GET",route="/docs",status="200"}' in response.text
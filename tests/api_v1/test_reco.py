@@ -1,16 +1,22 @@
 from requests.auth import HTTPBasicAuth
 import api.core.util.config as cfg
+from tests.conftest import requires_mongodb
 
 
 class TestRecommendationAPI:
     # BUILDER
 
+    @requires_mongodb
     def test_ib_cf_builder(self, test_client, test_evidence):
         res = test_client.put("/api/v1/bld", auth=HTTPBasicAuth('admin', 'nimda'))
         assert res.status_code == 201
 
     # SPLITTING CONFIG
 
+    def test_insert_items(self, test_client, test_items):  # fallback of the splitting, the client is per module
+        res = test_client.post("/api/v1/col/item", json=test_items, auth=HTTPBasicAuth('admin', 'nimda'))
+        assert res.status_code == 201
+
     def test_insert_splitting(self, test_client, test_splitting1, test_splitting2):
         res = test_client.post("/api/v1/rec/split/config?name=split1", json=test_splitting1,
                                auth=HTTPBasicAuth('admin', 'nimda'))
@@ -1,14 +1,19 @@
 import json
 
-from pytest import fixture
+from pytest import fixture, mark
 from starlette.testclient import TestClient
 
 import api.core.util.config as cfg
 from api.core.db.models.relation import CollaborativeFilteringRelation
 
+# tests of routes and builders that use MongoDB directly (exports, builders), run with STORAGE_BACKEND=mongodb and DB_URL
+requires_mongodb = mark.skipif(cfg.STORAGE_BACKEND == 'memory', reason="requires MongoDB")
 
-@fixture(scope="session")
+
+@fixture(scope="module")
 def test_client():
+    """Client of the app per test module (startup and shutdown run within the module, before tests of other modules
+    own the event loop)."""
     from main import app
     with TestClient(app) as test_client:
         yield test_client
@@ -47,16 +52,16 @@ def test_items():
 
 @fixture(scope="session")
 def test_relations_ib_cf():
-    relations = [
-        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": "1", "item_id_recommended": "101",
+    relations = [  # items are referenced by item code
+        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": 1, "item_id_recommended": 101,
          "similarity": 0.06, "base": "item"},
-        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": "1", "item_id_recommended": "102",
+        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": 1, "item_id_recommended": 102,
          "similarity": 0.07, "base": "item"},
-        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": "1", "item_id_recommended": "103",
+        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": 1, "item_id_recommended": 103,
          "similarity": 0.08, "base": "item"},
-        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": "1", "item_id_recommended": "104",
+        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": 1, "item_id_recommended": 104,
          "similarity": 0.09, "base": "item"},
-        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": "1", "item_id_recommended": "105",
+        {"type": cfg.TYPE_ITEM_BASED_COLLABORATIVE_FILTERING, "item_id_seed": 1, "item_id_recommended": 105,
          "similarity": 0.1, "base": "item"}
     ]
     res = [CollaborativeFilteringRelation(**rec) for rec in relations]
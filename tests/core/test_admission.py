@@ -0,0 +1,83 @@
+import asyncio
+
+from fastapi import APIRouter, FastAPI
+from starlette.testclient import TestClient
+
+from api.core.util.admission import ROUTE_CLASS_RECO, ROUTE_CLASS_WRITE, AdmissionControl, AdmissionMiddleware, \
+    ConcurrencyLimit, RateLimiter
+
+router = APIRouter()
+
+
+@router.get("/rec/unpers/popular")
+async def recommendations():
+    return []
+
+
+@router.post("/col/evidence")
+async def evidence():
+    return {}
+
+
+@router.get("/col/items")
+async def items():
+    return []
+
+
+control = AdmissionControl(prefix="/api", client_header="X-Client",
+                           rate_limits={ROUTE_CLASS_RECO: RateLimiter(0.001, 2),
+                                        ROUTE_CLASS_WRITE: RateLimiter(0, 1)},
+                           concurrency_limits={ROUTE_CLASS_RECO: ConcurrencyLimit(2, 0.05),
+                                               ROUTE_CLASS_WRITE: ConcurrencyLimit(1)})
+app = FastAPI()
+app.include_router(router, prefix="/api")
+app.add_middleware(AdmissionMiddleware, control=control)
+client = TestClient(app)
+
+
+def test_rate_limiter():
+    now = [0.0]
+    limiter = RateLimiter(rate=2, burst=2, max_clients=2, clock=lambda: now[0])
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0.5]
+    now[0] = 0.25
+    assert limiter.acquire("a") == 0.25  # half a token refilled
+    now[0] = 0.5
+    assert limiter.acquire("a") == 0 and limiter.acquire("b") == 0
+    limiter.acquire("c")
+    assert len(limiter) == 2 and limiter.acquire("a") == 0  # least recently seen client "a" was dropped
+    assert RateLimiter(rate=0, burst=1).acquire("a") == 0
+
+
+async def test_concurrency_limit():
+    limit = ConcurrencyLimit(1, max_wait=0.05)
+    assert await limit.acquire()
+    assert not await limit.acquire() and limit.waiting == 0  # timed out
+
+    async def release_later():
+        await asyncio.sleep(0.01)
+        await limit.release()
+
+    release = asyncio.ensure_future(release_later())
+    assert await limit.acquire() and limit.active == 1
+    await release
+    no_wait = ConcurrencyLimit(1)
+    assert await no_wait.acquire() and not await no_wait.acquire()  # rejected at once
+    assert await ConcurrencyLimit(0).acquire()
+
+
+def test_middleware():
+    assert client.get("/api/rec/unpers/popular", headers={"X-Client": "a"}).status_code == 200
+    assert client.get("/api/rec/unpers/popular", headers={"X-Client": "a"}).status_code == 200
+    response = client.get("/api/rec/unpers/popular", headers={"X-Client": "a"})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+    assert client.get("/api/rec/unpers/popular", headers={"X-Client": "b"}).status_code == 200
+    assert control.concurrency_limits[ROUTE_CLASS_RECO].active == 0  # slots are released
+
+    assert client.post("/api/col/evidence").status_code == 200
+    control.concurrency_limits[ROUTE_CLASS_RECO].waiting = 1  # writes are shed while recommendation reads wait
+    try:
+        response = client.post("/api/col/evidence")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        assert client.get("/api/col/items").status_code == 200  # not limited
+    finally:
+        control.concurrency_limits[ROUTE_CLASS_RECO].waiting = 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import random as sparse_random
+
+import api.core.util.config as cfg
+from api.core.services.builder.ImplicitALSBuilder import ImplicitALSBuilder, load_factors, row_blocks, solve_rows, \
+    top_k
+from api.core.services.builder.profiling import BuildProfiler
+
+
+def clustered_evidence() -> pd.DataFrame:
+    """Users 0-99 interact with 3 of items (codes) 0-5, users 100-199 with 3 of items 10-15."""
+    rng = np.random.default_rng(0)
+    rows = [{cfg.COLUMN_USER_ID: f"u{u}", cfg.COLUMN_ITEM_ID: (0 if u < 100 else 10) + int(i)}
+            for u in range(200) for i in rng.choice(6, 3, replace=False)]
+    return pd.DataFrame(rows)
+
+
+def test_solve_rows_matches_normal_equations():
+    rng = np.random.default_rng(0)
+    confidence = sparse_random(20, 15, density=0.3, format="csr", dtype=np.float32, random_state=1)
+    fixed = rng.standard_normal((15, 4)).astype(np.float32)
+    gram = fixed.T @ fixed + 0.1 * np.eye(4, dtype=np.float32)
+    blocks = row_blocks(confidence.indptr, 5)
+    assert blocks[0][0] == 0 and blocks[-1][1] == 20
+    assert all(confidence.indptr[e] - confidence.indptr[s] <= 5 or e - s == 1 for s, e in blocks)
+    res = np.vstack([solve_rows(confidence[s:e], fixed, gram) for s, e in blocks])
+    for u in range(20):
+        c = 1 + confidence[u].toarray()[0]
+        p = (confidence[u].toarray()[0] > 0).astype(np.float32)
+        expected = np.linalg.solve(fixed.T @ (c[:, None] * fixed) + 0.1 * np.eye(4), fixed.T @ (c * p))
+        np.testing.assert_allclose(res[u], expected, rtol=1e-3, atol=1e-4)
+
+
+def test_top_k():
+    scores = np.array([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]], dtype=np.float32)
+    (start, idx, top), = list(top_k(scores, scores, 2, block_elements=16, exclude_self=True))
+    assert start == 0 and idx[0].tolist() == [2, 1] and idx[2].tolist()[0] in (0, 1)
+    assert np.all(np.diff(top, axis=1) <= 0)
+    assert [s for s, _, _ in top_k(scores, scores, 1, block_elements=6)] == [0, 2]  # 2 rows of 3 candidates
+
+
+def test_builder(tmp_path):
+    profiler = BuildProfiler("ImplicitALSBuilder", trace_memory=False)
+    # fewer factors than items per cluster, otherwise items of a cluster get unrelated factors
+    builder = ImplicitALSBuilder(clustered_evidence(), factors=2, iterations=10, regularization=1.0, n_recos=3,
+                                 user_relations=True, block_nnz=64, profiler=profiler)
+    builder.run()
+    assert builder.user_factors.dtype == np.float32 and builder.user_factors.shape == (200, 2)
+    assert builder.item_factors.shape == (12, 2)
+    item_relations = [r for r in builder.relations if r.base == "item"]
+    assert len(item_relations) == 12 * 3 and all(r.type == cfg.TYPE_ALS for r in item_relations)
+    assert all(r.item_id_seed // 10 == r.item_id_recommended // 10 and r.item_id_seed != r.item_id_recommended
+               for r in item_relations)  # most similar items are from the same cluster
+    user_relations = [r for r in builder.relations if r.base == "user"]
+    seen = set(zip(builder.df[cfg.COLUMN_USER_ID], builder.df[cfg.COLUMN_ITEM_ID]))
+    assert user_relations and all((r.item_id_seed, r.item_id_recommended) not in seen for r in user_relations)
+    assert [s["stage"] for s in profiler.stages][:2] == ["create_confidence_matrix", "fit"]
+
+    builder.save_factors(str(tmp_path / "factors.npz"))
+    factors = load_factors(str(tmp_path / "factors.npz"))
+    np.testing.assert_array_equal(factors["item_factors"], builder.item_factors)
+    assert factors["item_ids"].tolist() == list(builder.item_ids)
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+from starlette.testclient import TestClient
+
+import api.core.util.config as cfg
+from api.app import create_app
+from api.core.db.storage import storage_holder
+
+
+def paths(app) -> set:
+    return {r.path for r in app.routes}
+
+
+def test_serving_app_excludes_builder():
+    builder_path = cfg.API_V1_STR + cfg.ENDPOINT_BUILDER
+    assert builder_path in paths(create_app())
+    serving_paths = paths(create_app(include_builder=False))
+    assert builder_path not in serving_paths
+    assert cfg.API_V1_STR + cfg.ENDPOINT_RECOMMENDATION + cfg.ENDPOINT_PERSONALIZED \
+        + cfg.ENDPOINT_COLLABORATIVE_FILTERING in serving_paths
+
+
+def test_entry_points_do_not_import_builder_dependencies():
+    code = "import main, serving, sys; print(sorted(m for m in ('numpy', 'pandas', 'scipy') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip().splitlines()[-1] == "[]"
+
+
+def test_app_starts_with_memory_storage(monkeypatch):
+    monkeypatch.setattr(cfg, "STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(cfg, "DB_URL", "")
+    with TestClient(create_app()) as client:  # runs startup and shutdown handlers through all middlewares
+        assert storage_holder.storage is not None
+        path = cfg.API_V1_STR + cfg.ENDPOINT_RECOMMENDATION + cfg.ENDPOINT_UNPERSONALIZED + "/random"
+        assert client.get(path).status_code == 200
@@ -0,0 +1,67 @@
+import api.core.util.config as cfg
+from api.core.db.models.item import BasicItemModel
+from api.core.db.storage import MemoryStorage
+from api.core.services.collection.consumed_items import ConsumedItems, consumed_items
+from api.core.services.collection.evidence import create_evidence, delete_evidence
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.reco.recommendation import get_collaborative_filtering_items
+
+
+def evidence(user_uid, item_id, name="purchase"):
+    return {cfg.COLUMN_NAME: name, cfg.COLUMN_USER_UID: user_uid, cfg.COLUMN_ITEM_ID: item_id}
+
+
+def test_consumed_items():
+    consumed = ConsumedItems(names=["purchase"], max_users=2, max_overfetch=2)
+    consumed.add([evidence("u1", i) for i in "cab"] + [evidence("u1", "a"), evidence("u1", "d", name="view")])
+    assert consumed.count("u1") == 3 and consumed.contains("u1", "a") and not consumed.contains("u1", "d")
+    assert consumed.fetch_size("u1", 5) == 7 and consumed.fetch_size("u2", 5) == 5 and consumed.fetch_size(None, 5) == 5
+    items = [BasicItemModel(id=i, type="product", name=i) for i in "abde"]
+    assert [i.id for i in consumed.exclude("u1", items)] == ["d", "e"]
+    assert consumed.exclude("u2", items) is items
+    consumed.add([evidence("u2", "a"), evidence("u1", "e"), evidence("u3", "a")])  # u2 is least recently active
+    assert consumed.count("u2") == 0 and consumed.count("u1") == 4 and len(consumed) == 2
+    consumed.clear("u1")
+    assert not consumed.contains("u1", "a")
+
+
+async def test_load_consumed_items():
+    storage = MemoryStorage()
+    await storage.evidence.insert_many([evidence("u1", "a"), evidence("u1", "b", name="view"), evidence("u1", "a")])
+    now = [0.0]
+    consumed = ConsumedItems(names=["purchase"], refresh_interval=60, clock=lambda: now[0])
+    consumed.add([evidence("u1", "c")])  # ingested by this process, not persisted yet
+    await consumed.load(storage, "u1")
+    assert consumed.count("u1") == 2 and consumed.contains("u1", "a") and consumed.contains("u1", "c")
+    await storage.evidence.insert_many([evidence("u1", "d")])  # ingested by another process
+    await consumed.load(storage, "u1")
+    assert not consumed.contains("u1", "d")
+    now[0] = 61
+    await consumed.load(storage, "u1")
+    assert consumed.contains("u1", "d") and consumed.count("u1") == 3
+    await consumed.load(storage, None)
+    assert len(consumed) == 1
+
+
+async def test_exclude_consumed_items():
+    storage = MemoryStorage()
+    await storage.items.upsert_many(await item_codes.add_codes(
+        storage, [{"id": str(i), "type": "product", "name": f"Item {i}"} for i in range(1, 7)]))
+    code = item_codes.codes
+    await storage.relations.insert_many([
+        {"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": code["1"], "item_id_recommended": code[str(i)],
+         "similarity": 1 / i, "base": "item"} for i in range(2, 7)])
+    await create_evidence(storage, [evidence("consumer", "2"), evidence("consumer", "4"),
+                                    evidence("consumer", "5", name="view")])
+    items = await get_collaborative_filtering_items(storage, item_id_seed="1", base="item", n_recos=3,
+                                                    user_uid="consumer")
+    assert [i.id for i in items] == ["3", "5", "6"]  # over-fetched by the number of consumed items
+    items = await get_collaborative_filtering_items(storage, item_id_seed="1", base="item", n_recos=3)
+    assert [i.id for i in items] == ["2", "3", "4"]
+    await delete_evidence(storage, "consumer")
+    assert consumed_items.count("consumer") == 0
+
+    await storage.evidence.insert_many([evidence("restarted", "2")])  # consumed before the process started
+    items = await get_collaborative_filtering_items(storage, item_id_seed="1", base="item", n_recos=3,
+                                                    user_uid="restarted")
+    assert [i.id for i in items] == ["3", "4", "5"]
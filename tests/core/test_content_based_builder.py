@@ -0,0 +1,92 @@
+import pytest
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.builder.ContentBasedBuilder import ContentBasedBuilder, ContentIndex, item_terms
+from api.core.services.builder.profiling import BuildProfiler
+from api.core.services.collection.content_index import ContentIndexHolder, _acquire_process_lock
+from api.core.services.reco.recommendation import get_collaborative_filtering_items, get_content_based_items
+
+
+def item(item_id, name, **kwargs):
+    return {"id": item_id, "item_code": int(item_id), "type": "product", "name": name, **kwargs}
+
+
+ITEMS = [item("1", "Garden Gnome Deluxe", brand="Acme"),
+         item("2", "Garden Gnome", brand="Acme"),
+         item("3", "Gnome Hat", brand="Acme"),
+         item("4", "Red Bike", brand="Velo", tags=["bike", "sport"]),
+         item("5", "Blue Bike", brand="Velo", tags=["bike"]),
+         item("6", "Kettle", brand="Steam")]
+
+
+def test_item_terms():
+    terms = item_terms(item("1", "Garden Gnome gnome", brand="Acme", tags=["Red Bike"], size=42, url="https://x.y",
+                            nested={"a": "b"}))
+    assert terms == {"garden": 1, "gnome": 2, "type:product": 1, "brand:acme": 1, "tags:red": 1, "tags:bike": 1,
+                     "size:42": 1}
+
+
+def test_builder():
+    builder = ContentBasedBuilder(ITEMS, n_recos=2, block_size=4,
+                                  profiler=BuildProfiler("ContentBasedBuilder", trace_memory=False))
+    builder.run()
+    relations = {}
+    for r in builder.relations:
+        assert r.type == cfg.TYPE_CONTENT_BASED and r.base == "item" and 0 < r.similarity <= 1
+        relations.setdefault(r.item_id_seed, []).append(r.item_id_recommended)
+    assert relations[1] == [2, 3] and relations[4] == [5] and relations[5] == [4]
+    assert 6 not in relations  # no shared terms (type of all items is dropped by max_df)
+    assert builder.profiler.stages[0]["stage"] == "build_index"
+
+
+def test_update():
+    index = ContentIndex(n_recos=2, block_size=2)
+    index.build(ITEMS)
+    assert index.update(ITEMS[:2]) == []  # unchanged
+    matrix, idf = index.matrix, index._idf.copy()
+    updated = index.update([item("7", "Kettle Deluxe", brand="Steam"), item("3", "Bike Hat", brand="Velo")])
+    assert index.matrix is matrix and (index._idf[:len(idf)] == idf).all()  # no re-vectorization of the catalog
+    assert set(updated) >= {3, 6, 7}
+    neighbours = {seed: [] for seed in updated}
+    for seed, recommended, _ in index.neighbours(updated):
+        neighbours[seed].append(recommended)
+    assert neighbours[7][0] == 6 and neighbours[6] == [7]
+    assert 3 not in neighbours[1] and 3 in neighbours[5]
+    assert index.update([{"id": "8", "type": "product", "name": "Kettle"}]) == []  # no item code
+
+    fresh = ContentIndex(n_recos=2)  # changed items get the neighbours of a full build
+    fresh.build(ITEMS[:2] + [item("3", "Bike Hat", brand="Velo")] + ITEMS[3:] + [item("7", "Kettle Deluxe",
+                                                                                     brand="Steam")])
+    assert [r[:2] for r in fresh.neighbours([7, 3])] == [r[:2] for r in index.neighbours([7, 3])]
+
+
+async def test_incremental_relations_and_backfill(monkeypatch):
+    storage = MemoryStorage()
+    await storage.items.upsert_many(ITEMS)
+    await storage.item_codes.insert_many([{"_id": code, "id": str(code)} for code in range(1, 11)])
+    holder = ContentIndexHolder()
+    assert await holder.update(storage, ITEMS) == 0  # no index
+    holder.index = ContentIndex(n_recos=2)
+    holder.index.build(ITEMS)
+    new = item("10", "Green Bike", brand="Velo")
+    await storage.items.upsert_many([new])
+    assert await holder.update(storage, [new]) > 0
+    assert sorted(i.id for i in await get_content_based_items(storage, "10", n_recos=2)) == ["4", "5"]
+
+    # collaborative filtering without relations of the new item is filled up with content-based relations
+    await storage.relations.insert_many([{"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": 10,
+                                          "item_id_recommended": 5, "similarity": 0.5, "base": "item"}])
+    assert [i.id for i in await get_collaborative_filtering_items(storage, "10", "item", n_recos=3)][0] == "5"
+    assert len(await get_collaborative_filtering_items(storage, "10", "item", n_recos=3)) == 2
+    monkeypatch.setattr(cfg, "RECO_BACKFILL_TYPES", [])
+    assert [i.id for i in await get_collaborative_filtering_items(storage, "10", "item", n_recos=4)] == ["5"]
+
+
+def test_single_process_updates_index(tmp_path):
+    path = str(tmp_path / "content-index.lock")
+    lock = _acquire_process_lock(path)
+    with pytest.raises(RuntimeError):
+        _acquire_process_lock(path)  # held by another worker
+    lock.close()
+    _acquire_process_lock(path).close()
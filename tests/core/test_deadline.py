@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from starlette.responses import Response
+
+import api.core.util.config as cfg
+from api.core.db.models.item import BasicItemModel
+from api.core.services.reco.fallback import BUDGET_OVERRUNS, fallback_items, with_budget
+from api.core.util.deadline import hedged
+
+
+async def sleep_and_return(delay: float, value):
+    await asyncio.sleep(delay)
+    return value
+
+
+class TestHedged:
+    async def test_fast_call_is_not_hedged(self):
+        calls = []
+
+        async def query():
+            calls.append(1)
+            return "ok"
+
+        assert await hedged("test", 0.05, query) == "ok"
+        assert calls == [1]
+
+    async def test_second_attempt_wins(self):
+        delays = [1.0, 0.01]  # first attempt hangs
+
+        async def query():
+            return await sleep_and_return(delays.pop(0), len(delays))
+
+        assert await hedged("test", 0.01, query) == 0
+
+    async def test_failed_attempt_waits_for_other(self):
+        attempts = []
+
+        async def query():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.03)
+                raise ValueError("first")
+            return await sleep_and_return(0.05, "second")
+
+        assert await hedged("test", 0.01, query) == "second"
+
+    async def test_all_attempts_fail(self):
+        async def query():
+            await asyncio.sleep(0.02)
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await hedged("test", 0.01, query)
+
+
+class TestWithBudget:
+    async def test_within_budget(self):
+        response = Response()
+        assert await with_budget(response, "test", 100, 3, sleep_and_return, 0, ["a"]) == ["a"]
+        assert cfg.HEADER_RECO_FALLBACK not in response.headers
+
+    async def test_budget_exceeded(self, monkeypatch):
+        items = [BasicItemModel(id=str(i), type="product", name=f"Item {i}") for i in range(5)]
+        monkeypatch.setattr(fallback_items, "items", items)
+        response = Response()
+        overruns = BUDGET_OVERRUNS.value(route="test")
+        assert await with_budget(response, "test", 10, 3, sleep_and_return, 1, ["a"]) == items[:3]
+        assert response.headers[cfg.HEADER_RECO_FALLBACK] == fallback_items.source
+        assert BUDGET_OVERRUNS.value(route="test") == overruns + 1
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from api.core.services.collection.evidence_buffer import EvidenceBuffer, EvidenceBufferFull
+
+
+class InsertRecorder:
+    """Collection stand-in that records insert_many calls."""
+
+    def __init__(self):
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        self.batches.append(list(documents))
+
+
+class TestEvidenceBuffer:
+    async def test_flush_on_size(self):
+        collection = InsertRecorder()
+        buffer = EvidenceBuffer(max_size=100, flush_size=3, flush_interval=60, put_timeout=0.1)
+        await buffer.start(collection)
+        assert await buffer.put([{'name': 'view'}, {'name': 'view'}]) == 2
+        await asyncio.sleep(0.01)
+        assert collection.batches == []
+        await buffer.put([{'name': 'purchase'}])
+        await asyncio.sleep(0.01)
+        assert [len(b) for b in collection.batches] == [3]
+        await buffer.stop()
+
+    async def test_flush_on_interval(self):
+        collection = InsertRecorder()
+        buffer = EvidenceBuffer(max_size=100, flush_size=50, flush_interval=0.05, put_timeout=0.1)
+        await buffer.start(collection)
+        await buffer.put([{'name': 'view'}])
+        await asyncio.sleep(0.1)
+        assert [len(b) for b in collection.batches] == [1]
+        await buffer.stop()
+
+    async def test_backpressure_rejects_whole_batch(self):
+        collection = InsertRecorder()
+        buffer = EvidenceBuffer(max_size=2, flush_size=50, flush_interval=60, put_timeout=0.01)
+        await buffer.start(collection)
+        await buffer.put([{'name': 'view'}])
+        with pytest.raises(EvidenceBufferFull):
+            await buffer.put([{'name': 'view'}, {'name': 'view'}])
+        assert buffer.depth() == 1
+        await buffer.stop()
+
+    async def test_stop_flushes_pending(self):
+        collection = InsertRecorder()
+        buffer = EvidenceBuffer(max_size=100, flush_size=2, flush_interval=60, put_timeout=0.1)
+        await buffer.start(collection)
+        await buffer.put([{'name': 'view'}])
+        await buffer.stop()
+        assert buffer.depth() == 0
+        assert [len(b) for b in collection.batches] == [1]
+        assert not buffer.running
@@ -0,0 +1,43 @@
+import gzip
+import json
+
+import msgpack
+import pytest
+from fastapi import HTTPException
+
+from api.core.services.collection.evidence_format import decode_evidence_batch, to_evidence_documents
+
+EVIDENCE = [{"name": "view", "item_id": "415", "path": "/p/415", "campaign": "newsletter"},
+            {"name": "purchase", "item_id": 416, "timestamp": "2022-03-01T10:00:00+01:00"}]
+
+
+class TestEvidenceFormat:
+    def test_json(self):
+        assert decode_evidence_batch(json.dumps(EVIDENCE).encode(), "application/json", None) == EVIDENCE
+
+    def test_gzip_ndjson(self):
+        body = gzip.compress(b"\n".join(json.dumps(e).encode() for e in EVIDENCE))
+        assert decode_evidence_batch(body, "application/x-ndjson", "gzip") == EVIDENCE
+
+    def test_msgpack_compact_batch(self):
+        body = msgpack.packb({"keys": ["name", "item_id"], "rows": [["view", "415"], ["purchase", "416"]]})
+        objects = decode_evidence_batch(body, "application/msgpack", None)
+        assert objects == [{"name": "view", "item_id": "415"}, {"name": "purchase", "item_id": "416"}]
+
+    def test_invalid_body(self):
+        with pytest.raises(HTTPException) as e:
+            decode_evidence_batch(b"{no json", "application/json", None)
+        assert e.value.status_code == 400
+
+    def test_documents(self):
+        documents = to_evidence_documents(EVIDENCE, user_uid="u1")
+        assert documents[0]["campaign"] == "newsletter"  # additional attributes are kept
+        assert documents[1]["item_id"] == "416"
+        assert documents[1]["timestamp"] == "2022-03-01T09:00:00"
+        assert all(d["user_uid"] == "u1" and "timestamp" in d for d in documents)
+
+    def test_documents_missing_name(self):
+        with pytest.raises(HTTPException) as e:
+            to_evidence_documents([{"name": "view"}, {"item_id": "1"}])
+        assert e.value.status_code == 422
+        assert e.value.detail[0]["loc"] == ("body", 1, "name")
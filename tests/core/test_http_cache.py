@@ -0,0 +1,95 @@
+import asyncio
+
+from fastapi import APIRouter, FastAPI, Response
+from starlette.testclient import TestClient
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.collection.consumed_items import consumed_items
+from api.core.services.reco.http_cache import ConditionalGetMiddleware, ResponseVersions, etag_matches
+from api.core.util.compression import CompressionMiddleware, negotiate_encoding
+
+router = APIRouter()
+calls = []
+
+
+@router.get("/rec/pers/cf")
+async def recommendations(item_id_seed: int, n_recos: int = 3):
+    calls.append(item_id_seed)
+    return [{"id": str(i), "name": "x" * 100} for i in range(n_recos)]
+
+
+@router.get("/rec/unpers/random")
+async def random_items():
+    return []
+
+
+@router.get("/rec/pers/als")
+async def fallback(response: Response):
+    response.headers[cfg.HEADER_RECO_FALLBACK] = "popular"
+    return []
+
+
+versions = ResponseVersions()
+storage = MemoryStorage()
+app = FastAPI()
+app.include_router(router, prefix="/api")
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+app.add_middleware(ConditionalGetMiddleware, versions=versions, prefix="/api/rec", max_age=30,
+                   storage=storage)
+client = TestClient(app)
+
+
+async def test_response_versions():
+    storage = MemoryStorage()
+    fresh = ResponseVersions()
+    await fresh.refresh(storage)
+    assert fresh.ready
+    etag = fresh.etag("/api/rec/pers/cf", "n_recos=3&item_id_seed=1")
+    assert etag == fresh.etag("/api/rec/pers/cf", "item_id_seed=1&n_recos=3")  # order of parameters is irrelevant
+    assert etag != fresh.etag("/api/rec/pers/cf", "item_id_seed=1&n_recos=3", user_uid="u1")
+    await storage.items.upsert_many([{"id": "1", "type": "product", "name": "Item"}])
+    await fresh.refresh(storage)
+    changed = fresh.etag("/api/rec/pers/cf", "n_recos=3&item_id_seed=1")
+    assert changed != etag
+    fresh.touch()
+    assert fresh.etag("/api/rec/pers/cf", "n_recos=3&item_id_seed=1") != changed
+    assert etag_matches(f'"a", {etag[2:]}', etag) and etag_matches("*", etag) and not etag_matches("", etag)
+
+
+def test_conditional_get():
+    versions.relations, versions.items = "build", "catalog"
+    calls.clear()
+    response = client.get("/api/rec/pers/cf?item_id_seed=1")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "public, max-age=30" and cfg.RECO_USER_UID in response.headers["vary"]
+    response = client.get("/api/rec/pers/cf?item_id_seed=1", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag and calls == [1]  # route did not run
+    versions.touch()
+    assert client.get("/api/rec/pers/cf?item_id_seed=1", headers={"If-None-Match": etag}).status_code == 200
+    response = client.get("/api/rec/pers/cf?item_id_seed=1", headers={cfg.RECO_USER_UID: "u1"})
+    assert response.headers["cache-control"].startswith("private") and response.headers["etag"] != etag
+    assert "etag" not in client.get("/api/rec/unpers/random").headers
+    assert "etag" not in client.get("/api/rec/pers/als").headers  # fallback items
+
+
+def test_consumed_items_of_other_processes_change_etag(monkeypatch):
+    monkeypatch.setattr(consumed_items, "refresh_interval", 0)  # evidence of other processes is seen at once
+    versions.relations, versions.items = "build", "catalog"
+    headers = {cfg.RECO_USER_UID: "buyer"}
+    etag = client.get("/api/rec/pers/cf?item_id_seed=1", headers=headers).headers["etag"]
+    assert client.get("/api/rec/pers/cf?item_id_seed=1", headers={**headers, "If-None-Match": etag}).status_code == 304
+    purchase = {cfg.COLUMN_NAME: "purchase", cfg.COLUMN_USER_UID: "buyer", cfg.COLUMN_ITEM_ID: "2"}
+    asyncio.run(storage.evidence.insert_many([purchase]))  # stored by another process
+    response = client.get("/api/rec/pers/cf?item_id_seed=1", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    consumed_items.clear("buyer")
+
+
+def test_compression():
+    assert negotiate_encoding("gzip;q=0, deflate") is None and negotiate_encoding("deflate, gzip") == "gzip"
+    response = client.get("/api/rec/pers/cf?item_id_seed=2&n_recos=10", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip" and "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content) and len(response.json()) == 10
+    response = client.get("/api/rec/pers/cf?item_id_seed=2&n_recos=1", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers  # below minimum size
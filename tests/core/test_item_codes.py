@@ -0,0 +1,57 @@
+import asyncio
+
+import pandas as pd
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.collection.evidence import create_evidence, encode_item_ids
+from api.core.services.collection.item import upsert_item_chunk
+from api.core.services.collection.item_codes import ItemCodes, item_codes
+from api.core.services.reco.recommendation import get_collaborative_filtering_items
+
+
+async def test_assign_and_decode():
+    storage = MemoryStorage()
+    await storage.item_codes.insert_many([{"_id": 0, "id": "a"}])
+    codes = ItemCodes()
+    assert await codes.encode(storage, ["a", "b"]) == [0, None]
+    assert await codes.assign(storage, ["b", "a", "c", "b"]) == [1, 0, 2, 1]
+    assert await codes.decode(storage, [2, 7, 0]) == ["c", None, "a"]
+    assert len(storage.item_codes) == 3
+
+    other = ItemCodes()  # another process assigned code 3 to "d" after this process cached its dictionary
+    await other.assign(storage, ["d"])
+    await storage.item_codes.insert_many([{"_id": 4, "id": "e"}])
+    assert await codes.assign(storage, ["e", "d", "f"]) == [4, 3, 5]
+
+    documents = await codes.add_codes(storage, [{"id": "a"}, {"id": "g"}, {"name": "no item"}])
+    assert [d.get(cfg.COLUMN_ITEM_CODE) for d in documents] == [0, 6, None]
+    assert await codes.encode(MemoryStorage(), ["a"]) == [None]  # cache belongs to one storage
+
+
+def test_encode_item_ids():
+    df = pd.DataFrame({cfg.COLUMN_USER_ID: ["u1", "u1", "u2"], cfg.COLUMN_ITEM_ID: ["a", "x", "b"],
+                       cfg.COLUMN_ITEM_CODE: [0, None, 1]})
+    res = encode_item_ids(df, {"a": 0, "b": 1})
+    assert res[cfg.COLUMN_ITEM_ID].tolist() == [0, 1] and res[cfg.COLUMN_ITEM_ID].dtype == "int32"
+    assert list(res.columns) == [cfg.COLUMN_USER_ID, cfg.COLUMN_ITEM_ID]
+
+
+async def test_non_numeric_seed():
+    storage = MemoryStorage()
+    await upsert_item_chunk(storage, [{"id": i, "type": "product", "name": i} for i in ("sku-a", "sku-b")],
+                            asyncio.Semaphore(1))
+    seed, recommended = await item_codes.encode(storage, ["sku-a", "sku-b"])
+    await storage.relations.insert_many([{"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": seed,
+                                          "item_id_recommended": recommended, "similarity": 0.5, "base": "item"}])
+    items = await get_collaborative_filtering_items(storage, item_id_seed="sku-a", base="item", n_recos=2)
+    assert [i.id for i in items] == ["sku-b"]
+
+
+async def test_evidence_does_not_assign_codes():
+    storage = MemoryStorage()
+    code, = await item_codes.assign(storage, ["known"])
+    documents = [{cfg.COLUMN_USER_UID: "u1", cfg.COLUMN_ITEM_ID: i, "name": "buy"} for i in ("known", "unknown")]
+    await create_evidence(storage, documents)
+    assert [d.get(cfg.COLUMN_ITEM_CODE) for d in documents] == [code, None]
+    assert len(storage.item_codes) == 1
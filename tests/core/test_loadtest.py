@@ -0,0 +1,44 @@
+from fastapi import FastAPI, Request
+
+from benchmarks.loadtest import asgi_request, compare, percentile, run_requests, summarize
+
+app = FastAPI()
+
+
+@app.get("/ping")
+async def ping():
+    return {"pong": True}
+
+
+@app.put("/echo")
+async def echo(req: Request):
+    return {"length": len(await req.body())}
+
+
+async def test_asgi_request():
+    assert await asgi_request(app, "GET", "/ping?x=1") == 200
+    assert await asgi_request(app, "PUT", "/echo", {"content-type": "application/json"}, b"[1, 2]") == 200
+    assert await asgi_request(app, "GET", "/missing") == 404
+
+
+async def test_run_requests():
+    requests = [{"method": "GET", "path": "/ping"}] * 20 + [{"method": "PUT", "path": "/echo", "body": [1]}] * 5
+    results, wall = await run_requests(app, requests, concurrency=4)
+    summary = summarize(results, wall)
+    assert summary["requests"] == 25
+    assert summary["routes"]["GET /ping"]["count"] == 20
+    assert summary["routes"]["PUT /echo"]["statuses"] == {"200": 5}
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 95) == 0.0
+
+
+def test_compare():
+    baseline = {"routes": {"GET /ping": {"p95_ms": 10.0}}}
+    assert compare({"routes": {"GET /ping": {"p95_ms": 12.0}}}, baseline, 1.25) == []
+    assert len(compare({"routes": {"GET /ping": {"p95_ms": 13.0}}}, baseline, 1.25)) == 1
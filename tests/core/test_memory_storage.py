@@ -0,0 +1,88 @@
+from bson import ObjectId
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+
+
+def item(item_id, created_time=None, **kwargs):
+    return {"id": item_id, "item_code": int(item_id), "type": "product", "name": f"Item {item_id}",
+            "created_time": created_time, **kwargs}
+
+
+async def test_items():
+    storage = MemoryStorage()
+    res = await storage.items.upsert_many([item("1", "2022-01-01T00:00:00"), item("2", "2022-01-03T00:00:00"),
+                                           item("3"), item("4", "2022-01-02T00:00:00")])
+    assert res == {"inserted": 4, "updated": 0, "failed": 0}
+    res = await storage.items.upsert_many([item("1", "2022-01-04T00:00:00", price=3)])
+    assert res == {"inserted": 0, "updated": 1, "failed": 0}
+    assert (await storage.items.find_by_id("1"))["price"] == 3
+    assert [i["id"] for i in await storage.items.latest(10)] == ["1", "2", "4", "3"]
+    assert [i["id"] for i in await storage.items.find_by_ids(["4", "missing", "2"])] == ["4", "2"]
+    assert [i["id"] for i in await storage.items.find_by_codes([4, 9, 2])] == ["4", "2"]
+    assert await storage.items.delete_by_id("2") == 1
+    assert [i["id"] for i in await storage.items.latest(2)] == ["1", "4"]
+    assert sorted(i["id"] for i in await storage.items.sample(10)) == ["1", "3", "4"]
+    assert await storage.items.find_by_codes([2]) == []
+    assert len(await storage.items.sample(2)) == 2
+
+
+async def test_relations():
+    storage = MemoryStorage()
+    await storage.items.upsert_many([item(str(i)) for i in range(1, 5)])
+    cf, als = cfg.TYPE_COLLABORATIVE_FILTERING, cfg.TYPE_ALS
+    await storage.relations.insert_many([
+        {"type": cf, "item_id_seed": 1, "item_id_recommended": 2, "similarity": 0.1, "base": "item"},
+        {"type": cf, "item_id_seed": 1, "item_id_recommended": 3, "similarity": 0.3, "base": "item"},
+        {"type": cf, "item_id_seed": 1, "item_id_recommended": 9, "similarity": 0.5, "base": "item"},  # unknown
+        {"type": cf, "item_id_seed": "u1", "item_id_recommended": 4, "similarity": 0.2, "base": "user"},
+        {"type": als, "item_id_seed": 1, "item_id_recommended": 2, "similarity": 0.9, "base": "item"}])
+    await storage.relations.insert_many([{"type": cf, "item_id_seed": 1, "item_id_recommended": 4,
+                                          "similarity": 0.2, "base": "item"}])
+    assert [i["id"] for i in await storage.relations.recommended_items(1, "item", 5, [cf])] == ["3", "4", "2"]
+    assert [i["id"] for i in await storage.relations.recommended_items(1, "item", 1, [cf])] == ["3"]
+    assert [i["id"] for i in await storage.relations.recommended_items(1, "item", 5, [als, cf])] == \
+           ["2", "3", "4", "2"]
+    assert await storage.relations.recommended_items(2, "item", 5, [cf]) == []
+    assert await storage.relations.neighbours([1, 2], "item", 3, [cf]) == {1: [(9, 0.5), (3, 0.3), (4, 0.2)]}
+
+    assert await storage.relations.replace(cf, "item", [1], [
+        {"type": cf, "item_id_seed": 1, "item_id_recommended": 4, "similarity": 0.7, "base": "item"}]) == 1
+    assert [i["id"] for i in await storage.relations.recommended_items(1, "item", 5, [als, cf])] == ["2", "4"]
+    assert [i["id"] for i in await storage.relations.recommended_items("u1", "user", 5, [cf])] == ["4"]
+
+
+async def test_users():
+    storage = MemoryStorage()
+    user = await storage.users.upsert_by_reco2js_id("r1", {"first_name": "Jane"})
+    assert (await storage.users.find_by_uid(str(user["_id"])))["first_name"] == "Jane"
+    updated = await storage.users.upsert_by_reco2js_id("r1", {"keys": {"reco2js_ids": ["r1"]}, "last_name": "Doe"})
+    assert updated["_id"] == user["_id"] and updated["first_name"] == "Jane"
+    await storage.users.set_group(user["_id"], "split", cfg.TYPE_LATEST)
+    assert (await storage.users.find_by_reco2js_id("r1"))["groups"] == {"split": cfg.TYPE_LATEST}
+    uid = await storage.users.insert({"_id": ObjectId(f"{1:024x}"), "keys": {"reco2js_ids": ["r2"]}})
+    assert (await storage.users.find_by_uid(uid))["keys"]["reco2js_ids"] == ["r2"]
+    assert await storage.users.delete_by_reco2js_id("r1") == 1
+    assert await storage.users.find_by_reco2js_id("r1") is None
+
+
+async def test_evidence():
+    storage = MemoryStorage()
+    assert await storage.evidence.insert_many([{"user_uid": "u1", "item_id": "1", "name": "view"},
+                                               {"user_uid": "u1", "item_id": "2", "name": "view"},
+                                               {"user_uid": "u2", "item_id": "2", "name": "view"},
+                                               {"user_uid": "u2", "name": "search"}]) == 4
+    assert len(await storage.evidence.find_by_user("u2")) == 2
+    assert await storage.evidence.popular_item_ids(5) == ["2", "1"]
+    assert await storage.evidence.delete_by_user("u1") == 2
+    assert await storage.evidence.popular_item_ids(5) == ["2"]
+
+
+async def test_splittings():
+    storage = MemoryStorage()
+    await storage.splittings.upsert({"name": "s", "methods": [cfg.TYPE_LATEST]})
+    await storage.splittings.upsert({"name": "s", "methods": [cfg.TYPE_RANDOM_RECOMMENDATIONS]})
+    assert (await storage.splittings.find("s"))["methods"] == [cfg.TYPE_RANDOM_RECOMMENDATIONS]
+    assert len(await storage.splittings.find_all()) == 1
+    assert await storage.splittings.delete("s") == 1
+    assert await storage.splittings.delete("s") == 0
@@ -0,0 +1,44 @@
+from api.core.util.metrics import Counter, Histogram, Registry, registry
+
+
+class TestMetrics:
+    def test_histogram_render(self):
+        h = Histogram("test_duration_seconds", "Test.", ["route"], buckets=(0.1, 1.0), registry=Registry())
+        for v in (0.05, 0.1, 0.5, 2.0):
+            h.observe(v, route="/a")
+        lines = h.render().splitlines()
+        assert lines[:2] == ["# HELP test_duration_seconds Test.", "# TYPE test_duration_seconds histogram"]
+        assert 'test_duration_seconds_bucket{route="/a",le="0.1"} 2' in lines
+        assert 'test_duration_seconds_bucket{route="/a",le="1.0"} 3' in lines
+        assert 'test_duration_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+        assert 'test_duration_seconds_count{route="/a"} 4' in lines
+        assert h.count(route="/a") == 4
+
+    def test_counter_labels(self):
+        test_registry = Registry()
+        c = Counter("test_requests_total", "Test.", ["status"], registry=test_registry)
+        c.inc(status=200)
+        c.inc(2, status=200)
+        c.inc(status=404)
+        assert c.value(status=200) == 3
+        assert 'test_requests_total{status="404"} 1' in c.render()
+        assert test_registry.metrics == [c] and c not in registry.metrics  # not rendered by `/metrics`
+
+
+class TestPoolMonitor:
+    def test_checkout(self):
+        from types import SimpleNamespace
+        from api.core.util.metrics import PoolMonitor, MONGODB_POOL_CHECKOUT_WAIT, MONGODB_POOL_CONNECTIONS_IN_USE, \
+            MONGODB_POOL_CHECKOUT_FAILURES
+        monitor = PoolMonitor("test", max_pool_size=2)
+        event = SimpleNamespace(address=("localhost", 27017), connection_id=1, reason="timeout")
+        monitor.connection_created(event)
+        monitor.connection_check_out_started(event)
+        monitor.connection_checked_out(event)
+        assert MONGODB_POOL_CONNECTIONS_IN_USE._values[("test",)] == 1
+        monitor.connection_checked_in(event)
+        monitor.connection_check_out_started(event)
+        monitor.connection_check_out_failed(event)
+        assert MONGODB_POOL_CONNECTIONS_IN_USE._values[("test",)] == 0
+        assert MONGODB_POOL_CHECKOUT_WAIT.count(client="test") == 2
+        assert MONGODB_POOL_CHECKOUT_FAILURES.value(client="test", reason="timeout") == 1
@@ -0,0 +1,23 @@
+import pytest
+from pymongo.read_preferences import ReadPreference
+
+from api.core.db.mongodb_utils import MongoDBHelper, close_sync_client, get_sync_client, read_preference
+
+
+def test_sync_client_is_shared():
+    client = get_sync_client()
+    assert get_sync_client() is client
+    with MongoDBHelper("testing") as db:
+        assert db.client is client
+    with MongoDBHelper("testing"):
+        pass
+    assert get_sync_client() is client  # leaving a block does not close the client
+    close_sync_client()
+    assert get_sync_client() is not client
+    close_sync_client()
+
+
+def test_read_preference():
+    assert read_preference("secondaryPreferred") == ReadPreference.SECONDARY_PREFERRED
+    with pytest.raises(ValueError):
+        read_preference("secondary_preferred")
@@ -0,0 +1,41 @@
+import gzip
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+from api.core.util.ndjson import iter_lines, is_gzip, stream_documents
+
+
+async def stream(data: bytes, chunk_size: int = 7):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+class TestNDJSON:
+    async def test_lines_split_across_chunks(self):
+        data = b'{"id": "1"}\n\n{"id": "2"}\r\n{"id": "3"}'
+        lines = [line async for line in iter_lines(stream(data))]
+        assert lines == [b'{"id": "1"}', b'{"id": "2"}\r', b'{"id": "3"}']
+
+    async def test_gzip_stream(self):
+        data = b"".join(b'{"id": "%d"}\n' % i for i in range(1000))
+        lines = [line async for line in iter_lines(stream(gzip.compress(data), 64), gzip=True)]
+        assert len(lines) == 1000
+        assert lines[-1] == b'{"id": "999"}'
+
+    def test_is_gzip(self):
+        assert is_gzip("application/x-ndjson", "gzip")
+        assert is_gzip("application/gzip", None)
+        assert not is_gzip("application/x-ndjson", None)
+
+    async def test_stream_documents(self):
+        oid = ObjectId()
+
+        async def cursor():
+            yield {'_id': oid, 'timestamp': datetime(2022, 1, 1, 12), 'name': 'view'}
+            yield {'_id': oid, 'name': 'purchase'}
+
+        lines = [line async for line in stream_documents(cursor())]
+        assert len(lines) == 2 and all(line.endswith(b"\n") for line in lines)
+        assert json.loads(lines[0]) == {'_id': str(oid), 'timestamp': '2022-01-01T12:00:00', 'name': 'view'}
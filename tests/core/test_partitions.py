@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.builder.CollaborativeFilteringBuilder import CollaborativeFilteringBuilder
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.reco.partitions import Partitioning, bucket_label
+from api.core.services.reco.recommendation import get_collaborative_filtering_items
+
+ITEMS = [{"id": "1", "type": "product", "price": 5}, {"id": "2", "type": "product", "price": Decimal("20")},
+         {"id": "3", "type": "blog"}, {"id": "4", "type": "product", "price": "60.5"}]
+
+
+def test_partitioning():
+    partitioning = Partitioning(["type", "price"], "price:10,50")
+    assert [bucket_label(v, ["10", "50"]) for v in (5, 10, "60.5", Decimal("20"), None, "n/a")] == \
+           ["-10", "10-50", "50-", "10-50", None, None]
+    assert partitioning.keys(ITEMS[1]) == ["price=10-50", "type=product", "price=10-50,type=product"]
+    assert partitioning.keys(ITEMS[2]) == ["type=blog"]
+    assert partitioning.key("type=product, price=10-50") == "price=10-50,type=product"
+    assert partitioning.key(None) is None and partitioning.matches("type=blog", ITEMS[2])
+    for invalid in ("color=red", "type", "type=a,type=b"):
+        with pytest.raises(ValueError):
+            partitioning.key(invalid)
+    assert not Partitioning([], "")
+
+
+def test_partitioned_relations():
+    # users 0-2 interact with items (codes) 1, 2, 3 (item 4 only with user 3 and item 1)
+    df = pd.DataFrame([(u, i) for u in range(3) for i in (1, 2, 3)] + [(3, 1), (3, 4)],
+                      columns=[cfg.COLUMN_USER_ID, cfg.COLUMN_ITEM_ID])
+    builder = CollaborativeFilteringBuilder(df=df, items=[{**i, "item_code": int(i["id"])} for i in ITEMS],
+                                            partitioning=Partitioning(["type"], ""), partition_n_recos=1)
+    builder.run()
+    partitioned = {(r.item_id_seed, r.partition): r.item_id_recommended for r in builder.relations if r.partition}
+    assert partitioned[(1, "type=blog")] == 3
+    assert partitioned[(1, "type=product")] == 2  # most similar product
+    assert partitioned[(2, "type=product")] == 1  # seed itself is excluded
+    assert (4, "type=blog") not in partitioned  # no similar blog
+
+
+async def test_partitioned_recommendations():
+    storage = MemoryStorage()
+    await storage.items.upsert_many(await item_codes.add_codes(storage, [{"name": i["id"], **i} for i in ITEMS]))
+    code = item_codes.codes
+    relation = {"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": code["1"], "base": "item"}
+    await storage.relations.insert_many([
+        {**relation, "item_id_recommended": code["3"], "similarity": 0.9},
+        {**relation, "item_id_recommended": code["2"], "similarity": 0.5},
+        {**relation, "item_id_recommended": code["4"], "similarity": 0.2, "partition": "type=product"},
+        {**relation, "item_id_recommended": code["2"], "similarity": 0.5, "partition": "type=product"}])
+    items = await get_collaborative_filtering_items(storage, item_id_seed="1", base="item", n_recos=2)
+    assert [i.id for i in items] == ["3", "2"]
+    items = await get_collaborative_filtering_items(storage, item_id_seed="1", base="item", n_recos=2,
+                                                    partition="type=product")
+    assert [i.id for i in items] == ["2", "4"]
+    assert await storage.relations.neighbours([code["1"]], "item", 5, [cfg.TYPE_COLLABORATIVE_FILTERING]) == \
+           {code["1"]: [(code["3"], 0.9), (code["2"], 0.5)]}
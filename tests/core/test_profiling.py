@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from api.core.services.builder.profiling import BuildProfiler, matrix_info
+
+
+class TestBuildProfiler:
+    def test_stages(self):
+        profiler = BuildProfiler("TestBuilder", trace_memory=True)
+        with profiler.stage("allocate"):
+            a = np.ones((512, 512))  # 2 MiB
+            profiler.annotate(**matrix_info(a))
+        with profiler.stage("sum"):
+            a.sum()
+        report = profiler.report()
+        assert [s["stage"] for s in report["stages"]] == ["allocate", "sum"]
+        assert report["stages"][0]["shape"] == [512, 512]
+        assert report["stages"][0]["peak_mb"] >= 2
+        assert report["peak_mb"] == report["stages"][0]["peak_mb"]
+        assert all(s["wall_s"] >= 0 and s["cpu_s"] >= 0 for s in report["stages"])
+
+    def test_nested_stages(self):
+        profiler = BuildProfiler("TestBuilder", trace_memory=True)
+        with profiler.stage("outer"):
+            with profiler.stage("inner"):
+                pass
+        inner, outer = profiler.stages
+        assert "peak_mb" not in inner and "peak_mb" in outer
+
+    def test_concurrent_builds_trace_one_at_a_time(self):
+        profiler, other = BuildProfiler("A", trace_memory=True), BuildProfiler("B", trace_memory=True)
+        with profiler.stage("a"):
+            with other.stage("b"):
+                pass
+        with other.stage("c"):
+            pass
+        assert "peak_mb" in profiler.stages[0] and "peak_mb" not in other.stages[0] and "peak_mb" in other.stages[1]
+        assert "rss_peak_mb" in other.stages[0]
+        assert not BuildProfiler("C").trace_memory  # off by default
+
+    def test_rss_of_stage(self):
+        profiler = BuildProfiler("TestBuilder", rss_interval=0.001)
+        with profiler.stage("allocate"):
+            a = np.ones((2048, 2048))  # 32 MiB, freed before the stage ends
+            time.sleep(0.02)
+            del a
+        with profiler.stage("keep"):
+            kept = np.ones((2048, 2048))
+        allocate, keep = profiler.stages
+        assert allocate["rss_peak_mb"] >= allocate["rss_delta_mb"] + 30  # peak within the stage, not at its end
+        assert keep["rss_delta_mb"] >= 30 and profiler.report()["rss_peak_mb"] >= keep["rss_peak_mb"]
+        assert kept.sum() > 0
+
+    def test_matrix_info_sparse(self):
+        m = csr_matrix(np.eye(4))
+        assert matrix_info(m) == {"shape": [4, 4], "nnz": 4}
@@ -0,0 +1,36 @@
+import asyncio
+
+from pymongo.errors import PyMongoError
+
+from api.core.util.refresher import PeriodicRefresher
+
+
+class Counting(PeriodicRefresher):
+    def __init__(self):
+        super().__init__(refresh_interval=0.01)
+        self.value = 0
+        self.fail = False
+
+    async def refresh(self, storage):
+        if self.fail:
+            raise PyMongoError("unavailable")
+        self.value += 1
+
+    def failure_message(self) -> str:
+        return f"Refreshing counter failed, keep {self.value}"
+
+
+class TestPeriodicRefresher:
+    async def test_refreshes_until_stopped(self, caplog):
+        refresher = Counting()
+        await refresher.start(None)
+        assert refresher.value == 1  # loaded at start
+        await asyncio.sleep(0.05)
+        refresher.fail = True
+        value = refresher.value
+        await asyncio.sleep(0.03)
+        assert value > 1 and refresher.value == value  # failed refreshes keep the state
+        assert "Refreshing counter failed, keep" in caplog.text and __name__ in caplog.records[0].name
+        await refresher.stop()
+        assert refresher._task is None
+        await refresher.stop()  # idempotent
@@ -0,0 +1,24 @@
+from api.core.services.collection.rollup import build_rollup_updates
+
+
+class TestRollup:
+    def test_updates_aggregate_per_key(self):
+        documents = [
+            {'name': 'view', 'user_uid': 'u1', 'item_id': '1', 'item_code': 0, 'timestamp': '2022-01-02T00:00:00'},
+            {'name': 'view', 'user_uid': 'u1', 'item_id': '1', 'item_code': 0, 'timestamp': '2022-01-01T00:00:00'},
+            {'name': 'purchase', 'user_uid': 'u1', 'item_id': '1', 'item_code': 0, 'timestamp': '2022-01-03T00:00:00'},
+            {'name': 'view', 'user_uid': None, 'item_id': '1', 'item_code': 0},
+            {'name': 'view', 'user_uid': 'u1', 'item_id': '2'},  # no item code
+            {'name': 'view', 'path': '/home'},
+        ]
+        updates = {tuple(u._filter.values()): u._doc for u in build_rollup_updates(documents)}
+        assert len(updates) == 2
+        view = updates[('u1', 0, 'view')]
+        assert view['$inc'] == {'count': 2}
+        assert view['$min'] == {'first_timestamp': '2022-01-01T00:00:00'}
+        assert view['$max'] == {'last_timestamp': '2022-01-02T00:00:00'}
+        assert updates[('u1', 0, 'purchase')]['$inc'] == {'count': 1}
+
+    def test_updates_without_timestamp(self):
+        updates = build_rollup_updates([{'name': 'view', 'user_uid': 'u1', 'item_id': '1', 'item_code': 0}])
+        assert updates[0]._doc == {'$inc': {'count': 1}}
@@ -0,0 +1,47 @@
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.collection.evidence import create_evidence, delete_evidence
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.collection.session_buffer import SessionBuffer, session_buffer
+from api.core.services.reco.recommendation import get_session_items, recency_weights, score_session
+
+
+def evidence(user_uid, item_id):
+    return {cfg.COLUMN_NAME: "view", cfg.COLUMN_USER_UID: user_uid, cfg.COLUMN_ITEM_ID: item_id}
+
+
+def test_session_buffer():
+    buffer = SessionBuffer(size=3, max_users=2)
+    buffer.add([evidence("u1", i) for i in "abcd"] + [{cfg.COLUMN_NAME: "view", cfg.COLUMN_USER_UID: "u1"}])
+    assert buffer.recent("u1") == ["d", "c", "b"]
+    buffer.add([evidence("u2", "a"), evidence("u1", "e"), evidence("u3", "a")])  # u2 is least recently active
+    assert buffer.recent("u2") == [] and buffer.recent("u1") == ["e", "d", "c"] and len(buffer) == 2
+    buffer.clear("u1")
+    assert buffer.recent("u1") == []
+
+
+def test_score_session():
+    weights = recency_weights(["b", "a", "b"], 0.5)
+    assert weights == {"b": 1.25, "a": 0.5}
+    neighbours = {"a": [("c", 1.0), ("b", 0.9)], "b": [("d", 0.6), ("c", 0.2)]}
+    assert score_session(weights, neighbours, 5) == ["d", "c"]  # d: 0.75, c: 0.25 + 0.5, seeds excluded
+    assert score_session(weights, neighbours, 1) == ["d"]
+
+
+async def test_session_items():
+    storage = MemoryStorage()
+    await storage.items.upsert_many(await item_codes.add_codes(
+        storage, [{"id": str(i), "type": "product", "name": f"Item {i}"} for i in range(1, 6)]))
+    code = item_codes.codes
+    await storage.relations.insert_many([
+        {"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": code["1"], "item_id_recommended": code["3"],
+         "similarity": 0.5, "base": "item"},
+        {"type": cfg.TYPE_CONTENT_BASED, "item_id_seed": code["2"], "item_id_recommended": code["4"],
+         "similarity": 0.9, "base": "item"},
+        {"type": cfg.TYPE_CONTENT_BASED, "item_id_seed": code["2"], "item_id_recommended": code["1"],
+         "similarity": 0.8, "base": "item"}])
+    await create_evidence(storage, [evidence("session-user", "1"), evidence("session-user", "2")])
+    assert [i.id for i in await get_session_items(storage, "session-user", n_recos=3)] == ["4", "3"]
+    assert len(await get_session_items(storage, "unknown-user", n_recos=2)) == 2  # fallback (random) items
+    await delete_evidence(storage, "session-user")
+    assert session_buffer.recent("session-user") == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from api.core.util.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    async def test_coalesces_concurrent_calls(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def query(x):
+            calls.append(x)
+            await asyncio.sleep(0.01)
+            return [x]
+
+        results = await asyncio.gather(*[flight.do(("q", 1), query, 1) for _ in range(10)],
+                                       flight.do(("q", 2), query, 2))
+        assert calls == [1, 2]
+        assert results == [[1]] * 10 + [[2]]
+        assert len(flight) == 0
+        assert await flight.do(("q", 1), query, 1) == [1]  # completed calls are not cached
+        assert calls == [1, 2, 1]
+
+    async def test_error_propagation(self):
+        flight = SingleFlight("test")
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*[flight.do("k", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flight) == 0
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        flight = SingleFlight("test")
+
+        async def query():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        first = asyncio.ensure_future(flight.do("k", query))
+        second = asyncio.ensure_future(flight.do("k", query))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        assert await second == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert len(flight) == 0
@@ -0,0 +1,66 @@
+import json
+import logging
+
+from fastapi import APIRouter, FastAPI
+from starlette.testclient import TestClient
+
+import api.core.util.config as cfg
+from api.core.util.tracing import TracedRoute, TracingMiddleware, span
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("/traced")
+async def traced():
+    with span("mongodb"):
+        with span("inner"):
+            pass
+    with span("mongodb"):
+        pass
+    return [{"id": i} for i in range(3)]
+
+
+@router.get("/sync")
+def traced_sync():
+    with span("models"):
+        return {"ok": True}
+
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+app.add_middleware(TracingMiddleware)
+client = TestClient(app)
+
+
+def server_timing(response) -> dict:
+    entries = [e.split(";dur=") for e in response.headers["server-timing"].split(", ")]
+    return {name: float(duration) for name, duration in entries}
+
+
+def test_debug_header():
+    response = client.get("/api/traced", headers={cfg.TRACING_DEBUG_HEADER: "1"})
+    assert response.json() == [{"id": 0}, {"id": 1}, {"id": 2}]
+    timings = server_timing(response)
+    assert list(timings) == ["inner", "mongodb", "endpoint", "validate", "render", "total"]
+    assert timings["total"] >= timings["endpoint"] >= timings["mongodb"]
+
+
+def test_sync_endpoint():
+    timings = server_timing(client.get("/api/sync", headers={cfg.TRACING_DEBUG_HEADER: "1"}))
+    assert {"models", "endpoint", "validate", "render"} <= set(timings)
+
+
+def test_not_sampled():
+    assert "server-timing" not in client.get("/api/traced").headers
+    with span("outside of request"):  # no-op
+        pass
+
+
+def test_slow_request_log(monkeypatch, caplog):
+    monkeypatch.setattr(cfg, "TRACING_SLOW_REQUEST_MS", 1e-6)
+    with caplog.at_level(logging.WARNING, logger="api.core.util.tracing"):
+        response = client.get("/api/traced")
+    assert "server-timing" not in response.headers
+    record = json.loads(caplog.records[-1].message)
+    assert record["event"] == "slow_request" and record["path"] == "/api/traced"
+    assert [s["name"] for s in record["spans"] if s["depth"] == 2] == ["inner"]
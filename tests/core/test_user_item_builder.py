@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import api.core.services.builder.UserItemBuilder as user_item_builder
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.builder.UserItemBuilder import UserItemBuilder, top_k_rows
+from api.core.services.builder.profiling import BuildProfiler
+from api.core.services.reco.recommendation import get_user_items
+
+
+def evidence() -> pd.DataFrame:
+    """u1 and u2 share items (codes) 0 and 1, u2 also interacted with 2, u3 with 3 and 4 only."""
+    pairs = [("u1", 0), ("u1", 1), ("u1", 0), ("u2", 0), ("u2", 1), ("u2", 2), ("u3", 3), ("u3", 4)]
+    return pd.DataFrame([{cfg.COLUMN_USER_ID: u, cfg.COLUMN_ITEM_ID: i} for u, i in pairs])
+
+
+def test_top_k_rows():
+    matrix = csr_matrix(np.array([[0.1, 0.5, -1, 0.3], [0, 0, 0, 0], [2, 0, 1, 0]], dtype=np.float32))
+    res = top_k_rows(matrix, 2)
+    assert res.shape == (3, 4) and np.diff(res.indptr).tolist() == [2, 0, 2]
+    assert res.indices.tolist() == [1, 3, 0, 2] and res.data.tolist() == [0.5, np.float32(0.3), 2, 1]
+
+
+def test_builder():
+    builder = UserItemBuilder(evidence(), n_recos=2, neighbours=2, block_size=2,
+                              profiler=BuildProfiler("UserItemBuilder", trace_memory=False))
+    builder.run()
+    assert builder.interactions.sum() == 7  # duplicate interaction counted once
+    assert builder.similarity.shape == (5, 5) and builder.similarity.diagonal().sum() == 0
+    assert np.diff(builder.similarity.indptr).max() <= 2
+    recommendations = {r.user_uid: r for r in builder.relations}
+    assert recommendations["u1"].item_ids == [2] and recommendations["u1"].type == cfg.TYPE_USER_ITEMS
+    assert "u2" not in recommendations and "u3" not in recommendations  # nothing left that was not seen
+    assert [s["stage"] for s in builder.profiler.stages] == ["create_interaction_matrix", "truncated_item_similarity",
+                                                            "top_k_user_items", "convert_to_models"]
+
+
+class FakeCollection:
+    """Minimal user recommendation collection (replace by user uid, delete by build id)."""
+
+    def __init__(self, docs):
+        self.docs = {d[cfg.COLUMN_USER_UID]: d for d in docs}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            self.docs[op._filter[cfg.COLUMN_USER_UID]] = op._doc
+
+    def delete_many(self, query):
+        stale = [u for u, d in self.docs.items() if d.get("build_id") != query["build_id"]["$ne"]]
+        for u in stale:
+            del self.docs[u]
+        return type("DeleteResult", (), {"deleted_count": len(stale)})()
+
+
+def test_store_relations_replaces_all_users(monkeypatch):
+    collection = FakeCollection([{cfg.COLUMN_USER_UID: "gone", "item_ids": [1], "build_id": "earlier"},
+                                 {cfg.COLUMN_USER_UID: "u1", "item_ids": [1]}])
+
+    class FakeHelper:
+        def __init__(self, db_name):
+            pass
+
+        def __enter__(self):
+            return {cfg.COLLECTION_NAME_USER_RECOMMENDATION: collection}
+
+        def __exit__(self, *args):
+            pass
+
+    monkeypatch.setattr(user_item_builder, "MongoDBHelper", FakeHelper)
+    builder = UserItemBuilder(evidence(), n_recos=2, neighbours=2,
+                              profiler=BuildProfiler("UserItemBuilder", trace_memory=False))
+    builder.run()
+    builder.store_relations()
+    assert set(collection.docs) == {r.user_uid for r in builder.relations} and "gone" not in collection.docs
+    assert builder.profiler.stages[-1]["n_deleted_users"] == 1
+
+
+async def test_user_items():
+    storage = MemoryStorage()
+    await storage.items.upsert_many([{"id": i, "item_code": code, "type": "product", "name": i}
+                                     for code, i in enumerate("abcd")])
+    await storage.user_recommendations.replace_many([
+        {"user_uid": "u1", "item_ids": [2, 9, 0, 1], "scores": [3, 2, 1, 0.5]},
+        {"user_uid": "u2", "item_ids": [3], "scores": [1]}])
+    await storage.user_recommendations.replace_many([{"user_uid": "u2", "item_ids": [1], "scores": [1]}])
+    assert [i.id for i in await get_user_items(storage, "u1", n_recos=3)] == ["c", "a"]  # unknown item x skipped
+    assert [i.id for i in await get_user_items(storage, "u2", n_recos=3)] == ["b"]
+    assert len(await get_user_items(storage, "unknown", n_recos=2)) == 2  # fallback (random) items
@@ -0,0 +1,61 @@
+import asyncio
+
+import pandas as pd
+
+import api.core.util.config as cfg
+from api.core.db.storage import MemoryStorage
+from api.core.services.collection.consumed_items import ConsumedItems
+from api.core.services.collection.evidence import collapse_item_codes, encode_item_ids
+from api.core.services.collection.item import upsert_item_chunk
+from api.core.services.collection.item_codes import item_codes
+from api.core.services.collection.variants import Variants, variants
+from api.core.services.reco.recommendation import get_collaborative_filtering_items
+
+
+def item(item_id, parent_id=None):
+    return {"id": item_id, "type": "product", "name": f"Item {item_id}", "parent_id": parent_id}
+
+
+async def test_variants():
+    storage = MemoryStorage()
+    await storage.items.upsert_many([item("p1"), item("p1-s", "p1"), item("p1-m", "p1"), item("p2", "p2")])
+    index = Variants(attribute="parent_id")
+    await index.refresh(storage)
+    assert index.parents == {"p1-s": "p1", "p1-m": "p1"}  # items referencing themselves are no variants
+    assert index.resolve("p1-s") == "p1" and index.resolve("p2") == "p2" and index.resolve("x") == "x"
+    index.update([item("p2-s", "p2"), item("p1-m"), {"id": "p1-s", "name": "renamed"}])
+    assert index.parents == {"p1-s": "p1", "p2-s": "p2"}  # upserts without parent attribute keep the parent
+    index.remove("p1-s")
+    assert index.parent_ids([item("a", "p3"), item("b")]) == ["p3"] and len(index) == 1
+    assert Variants(attribute="").parent_ids([item("a", "p3")]) == []
+
+
+async def test_variant_seeds():
+    storage = MemoryStorage()
+    await upsert_item_chunk(storage, [item("10"), item("10001", "10"), item("20")], asyncio.Semaphore(1))
+    assert variants.resolve("10001") == "10"
+    code = item_codes.codes
+    await storage.relations.insert_many([{"type": cfg.TYPE_COLLABORATIVE_FILTERING, "item_id_seed": code["10"],
+                                          "item_id_recommended": code["20"], "similarity": 0.5, "base": "item"}])
+    items = await get_collaborative_filtering_items(storage, item_id_seed="10001", base="item", n_recos=2)
+    assert [i.id for i in items] == ["20"]  # relations of the parent
+    variants.remove("10001")
+
+
+def test_consumed_variants_exclude_parent():
+    variants.update([item("p1-s", "p1")])
+    consumed = ConsumedItems(names=["purchase"])
+    consumed.add([{"name": "purchase", "user_uid": "u1", "item_id": "p1-s"}])
+    assert consumed.contains("u1", "p1") and consumed.contains("u1", "p1-s") and consumed.count("u1") == 2
+    variants.remove("p1-s")
+
+
+def test_collapse_variants():
+    df = pd.DataFrame({cfg.COLUMN_USER_ID: ["u1", "u1", "u2", "u2"], cfg.COLUMN_ITEM_ID: ["p-s", "p-m", "p", "q"]})
+    codes = {"p": 0, "p-s": 1, "p-m": 2, "q": 3}
+    res = encode_item_ids(df, codes, {"p-s": "p", "p-m": "p"})
+    assert res[cfg.COLUMN_ITEM_ID].tolist() == [0, 0, 0, 3]
+    rollups = pd.DataFrame({cfg.COLUMN_USER_ID: ["u1", "u1", "u2"], cfg.COLUMN_ITEM_ID: [1, 2, 3]})
+    res = collapse_item_codes(rollups, codes, {"p-s": "p", "p-m": "p", "unknown": "p"})
+    assert res[cfg.COLUMN_ITEM_ID].tolist() == [0, 0, 3] and res[cfg.COLUMN_ITEM_ID].dtype == "int32"
+    assert collapse_item_codes(rollups, codes, {}) is rollups
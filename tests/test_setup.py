@@ -2,8 +2,10 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 import api.core.util.config as cfg
 from api.core.db.mongodb import DataBase
+from tests.conftest import requires_mongodb
 
 
+@requires_mongodb
 async def test_prepare_db():
     # TODO: find local option for test MongoDB
     db = DataBase()